@@ -0,0 +1,94 @@
+"""Benchmark fringestopping and summing visibilities over products.
+
+Compares :func:`draco.util._fast_tools.beamform`, which calculates the phase
+of every product, with :func:`draco.util._fast_tools.beamform_separable`,
+which calculates a phase for each distinct EW and NS baseline component and
+combines them. The products are the stacked XX baselines of a CHIME-like
+telescope, with `ncyl` cylinders of `nfeed` feeds each.
+
+Run as::
+
+    python benchmarks/bench_beamform.py [ncyl] [nfeed] [nfreq] [nha]
+"""
+
+import sys
+import time
+
+import numpy as np
+
+from draco.util._fast_tools import beamform, beamform_separable
+
+
+def _stacked_baselines(ncyl, nfeed):
+    # Every EW and NS separation of the cylinders and feeds
+    du, dv = np.meshgrid(
+        np.arange(ncyl) * 22.0, np.arange(-nfeed + 1, nfeed) * 0.3048, indexing="ij"
+    )
+    return np.array([du.ravel(), dv.ravel()])
+
+
+def _time(func, repeat=3):
+    best = np.inf
+    for _ in range(repeat):
+        t0 = time.time()
+        result = func()
+        best = min(best, time.time() - t0)
+    return best, result
+
+
+def main(ncyl=4, nfeed=256, nfreq=4, nha=121):
+    baselines = _stacked_baselines(ncyl, nfeed)
+    nprod = baselines.shape[1]
+    nra = 2 * nha
+
+    rng = np.random.RandomState(0)
+    shape = (nfreq, nra, nprod)
+    vis = (rng.standard_normal(shape) + 1.0j * rng.standard_normal(shape)).astype(
+        np.complex64
+    )
+    weight = rng.uniform(0.0, 3.0, size=shape).astype(np.float32)
+
+    wavenumber = np.linspace(800.0, 400.0, nfreq)[:, np.newaxis] * 1e6 / 3e8
+    u = np.ascontiguousarray(baselines[0] * wavenumber)
+    v = np.ascontiguousarray(baselines[1] * wavenumber)
+    u_unique, u_index = np.unique(baselines[0], return_inverse=True)
+    v_unique, v_index = np.unique(baselines[1], return_inverse=True)
+    u_unique = np.ascontiguousarray(u_unique[np.newaxis, :] * wavenumber)
+    v_unique = np.ascontiguousarray(v_unique[np.newaxis, :] * wavenumber)
+
+    ha = np.linspace(-0.1, 0.1, nha)
+    args = (0.6, 0.85, np.cos(ha), np.sin(ha))
+    f_index = np.arange(nfreq, dtype=np.int32)
+    ra_index = np.arange(nha // 2, nha // 2 + nha, dtype=np.int32)
+
+    t_direct, direct = _time(
+        lambda: beamform(vis, weight, *args, u, v, f_index, ra_index)
+    )
+    t_sep, sep = _time(
+        lambda: beamform_separable(
+            vis,
+            weight,
+            *args,
+            u_unique,
+            v_unique,
+            u_index.astype(np.intp),
+            v_index.astype(np.intp),
+            f_index,
+            ra_index
+        )
+    )
+
+    err = np.abs(sep - direct).max() / np.abs(direct).max()
+
+    print(
+        "%i products (%i EW x %i NS), %i freqs, %i HAs"
+        % (nprod, u_unique.shape[1], v_unique.shape[1], nfreq, nha)
+    )
+    print("%-12s %10s" % ("kernel", "time [s]"))
+    print("%-12s %10.4f" % ("beamform", t_direct))
+    print("%-12s %10.4f" % ("separable", t_sep))
+    print("max relative difference %.1e" % err)
+
+
+if __name__ == "__main__":
+    main(*[int(arg) for arg in sys.argv[1:]])
@@ -0,0 +1,102 @@
+"""Benchmark the chunk shape used when writing distributed datasets.
+
+Compares writing a dataset split unevenly between ranks with the requested
+chunk shape, where chunks straddling two rank slabs go through the HDF5
+filter pipeline, against chunks shrunk along the distributed axis so that
+their boundaries line up with the slabs (the gcd of the slab sizes). The
+ranks are simulated by writing their slabs in turn, as
+:meth:`draco.core.containers.ContainerBase.to_hdf5_threaded` does. The time to
+read back the full frequency spectrum of a single sample is also reported,
+as that is where the number of chunks along the distributed axis matters.
+
+Run as::
+
+    python benchmarks/bench_dist_chunks.py [nfreq] [nranks]
+"""
+
+import os
+import sys
+import tempfile
+import time
+
+import h5py
+import numpy as np
+
+import bitshuffle.h5
+
+from draco.util import chunkio
+
+
+def _slabs(n, nranks):
+    # Split `n` between ranks in the same way as `mpiutil.split_m`
+    sizes = [n // nranks + (1 if ri < n % nranks else 0) for ri in range(nranks)]
+    starts = np.cumsum([0] + sizes[:-1])
+    return list(zip(starts, sizes))
+
+
+def _write(fname, data, chunks, slabs, num_threads):
+    with h5py.File(fname, "w") as f:
+        dset = f.create_dataset(
+            "vis_weight",
+            shape=data.shape,
+            dtype=data.dtype,
+            chunks=chunks,
+            compression=bitshuffle.h5.H5FILTER,
+            compression_opts=(0, bitshuffle.h5.H5_COMPRESS_LZ4),
+        )
+        for start, size in slabs:
+            offset = (start,) + (0,) * (data.ndim - 1)
+            chunkio.write_chunks(
+                dset, data[start : start + size], offset, num_threads=num_threads
+            )
+
+
+def main(nfreq=1024, nranks=3, num_threads=None):
+    chunks = (64, 64, 128)
+    shape = (nfreq, 64, 128)
+
+    # Something with the compressibility of typical weights
+    rng = np.random.RandomState(0)
+    data = (rng.poisson(100.0, size=shape) / 1e3).astype(np.float32)
+
+    slabs = _slabs(nfreq, nranks)
+    step = int(np.gcd.reduce([size for _, size in slabs]))
+    aligned = (max(c for c in range(1, chunks[0] + 1) if step % c == 0),) + chunks[1:]
+
+    tmpdir = tempfile.mkdtemp()
+
+    print("%i rows over %i ranks, slabs %s" % (nfreq, nranks, [s for _, s in slabs]))
+    print(
+        "%-10s %-16s %10s %10s %12s"
+        % ("layout", "chunks", "write [s]", "size [MB]", "spectrum [s]")
+    )
+
+    for label, chunk in [("requested", chunks), ("aligned", aligned)]:
+        fname = os.path.join(tmpdir, "%s.h5" % label)
+
+        t0 = time.time()
+        _write(fname, data, chunk, slabs, num_threads)
+        elapsed = time.time() - t0
+
+        with h5py.File(fname, "r") as f:
+            assert np.array_equal(f["vis_weight"][:], data)
+
+        # Read the spectra of a few samples, with a cold chunk cache each time
+        t0 = time.time()
+        for ii in range(4):
+            with h5py.File(fname, "r", rdcc_nbytes=0) as f:
+                f["vis_weight"][:, ii, 0]
+        spectrum = (time.time() - t0) / 4
+
+        size = os.path.getsize(fname) / 2.0 ** 20
+        print(
+            "%-10s %-16s %10.3f %10.1f %12.4f"
+            % (label, chunk, elapsed, size, spectrum)
+        )
+        os.remove(fname)
+
+    os.rmdir(tmpdir)
+
+
+if __name__ == "__main__":
+    main(*[int(arg) for arg in sys.argv[1:]])
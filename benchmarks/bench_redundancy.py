@@ -0,0 +1,81 @@
+"""Benchmark calculating the redundancy of stacked baselines.
+
+Compares the original serial kernel, which loops over every product and time
+sample, against :func:`draco.util.tools.calculate_redundancy`, both without
+its result cache (the first call for a set of flags) and with it (repeated
+calls). Products of a cylinder telescope are stacked by feed separation.
+
+With the flags of a few inputs changing once, only two time samples need to
+be calculated. With flags that change in every sample (`noisy`) all of them
+do, and a cache hit saves the most.
+
+Run as::
+
+    python benchmarks/bench_redundancy.py [ninput] [ntime]
+"""
+
+import sys
+import time
+
+import numpy as np
+
+from draco.util import _fast_tools, tools
+
+
+def _stacked_products(ninput, ncyl=4):
+    # The products of a cylinder telescope, stacked on the feed separation
+    ii, jj = np.triu_indices(ninput)
+    prod = np.empty(len(ii), dtype=[("input_a", "<u2"), ("input_b", "<u2")])
+    prod["input_a"], prod["input_b"] = ii, jj
+
+    nf = ninput // ncyl
+    sep = (jj // nf - ii // nf) * 2 * nf + (jj % nf - ii % nf)
+    _, stack = np.unique(sep, return_inverse=True)
+
+    return prod, stack.astype(np.uint32), int(stack.max()) + 1
+
+
+def _old(flags, prod, stack, nstack):
+    redundancy = np.zeros((nstack, flags.shape[1]), dtype=np.float32)
+    pm = prod.view(np.int16).reshape(-1, 2)
+    _fast_tools._calc_redundancy(flags, pm, stack, nstack, redundancy)
+    return redundancy
+
+
+def _time(func, repeat=3):
+    best = np.inf
+    for _ in range(repeat):
+        t0 = time.time()
+        result = func()
+        best = min(best, time.time() - t0)
+    return best, result
+
+
+def main(ninput=1024, ntime=512):
+    prod, stack, nstack = _stacked_products(ninput)
+    rng = np.random.RandomState(0)
+
+    steady = np.ones((ninput, ntime), dtype=np.float32)
+    steady[rng.randint(0, ninput, 20), ntime // 2 :] = 0.0
+    noisy = (rng.uniform(size=(ninput, ntime)) > 0.01).astype(np.float32)
+
+    print("%i inputs, %i products, %i stacks" % (ninput, len(prod), nstack))
+    print("%-8s %10s %10s %10s" % ("flags", "old [s]", "cold [s]", "cached [s]"))
+
+    for label, flags in [("steady", steady), ("noisy", noisy)]:
+        t_old, expected = _time(lambda: _old(flags, prod, stack, nstack), repeat=1)
+        t_cold, cold = _time(
+            lambda: tools.calculate_redundancy(flags, prod, stack, nstack, cache=False)
+        )
+        tools.calculate_redundancy(flags, prod, stack, nstack)
+        t_hit, hit = _time(
+            lambda: tools.calculate_redundancy(flags, prod, stack, nstack)
+        )
+
+        assert np.array_equal(cold, expected) and np.array_equal(hit, expected)
+
+        print("%-8s %10.4f %10.4f %10.4f" % (label, t_old, t_cold, t_hit))
+
+
+if __name__ == "__main__":
+    main(*[int(arg) for arg in sys.argv[1:]])
@@ -0,0 +1,67 @@
+"""Benchmark truncating a complex dataset relative to its weights.
+
+Compares the single pass in place :func:`draco.util.truncate.truncate_weights`
+against the original approach of the `Truncate` task, which truncated copies
+of the real and imaginary parts with the 1D kernel and assigned them back.
+
+Run as::
+
+    python benchmarks/bench_truncate.py [nfreq] [nstack] [nra]
+"""
+
+import sys
+import time
+
+import numpy as np
+
+from draco.util import truncate
+
+
+def _old(val, wgt, fallback, scale):
+    # The original `Truncate.process` for a complex dataset with weights
+    shape = val.shape
+    flat = np.ndarray.reshape(val, val.size)
+    invvar = np.ndarray.reshape(wgt, val.size) * scale
+    val.real = truncate.bit_truncate_weights(
+        np.ascontiguousarray(flat.real), invvar, fallback
+    ).reshape(shape)
+    val.imag = truncate.bit_truncate_weights(
+        np.ascontiguousarray(flat.imag), invvar, fallback
+    ).reshape(shape)
+
+
+def _new(val, wgt, fallback, scale):
+    truncate.truncate_weights(val, wgt, fallback, scale=scale)
+
+
+def _time(func, val, wgt, repeat=3):
+    best = np.inf
+    for _ in range(repeat):
+        v = val.copy()
+        t0 = time.time()
+        func(v, wgt, 1e-4, 2.0 / 3e-3)
+        best = min(best, time.time() - t0)
+    return best, v
+
+
+def main(nfreq=64, nstack=512, nra=256):
+    shape = (nfreq, nstack, nra)
+    rng = np.random.RandomState(0)
+
+    val = (rng.standard_normal(shape) + 1.0j * rng.standard_normal(shape)).astype(
+        np.complex64
+    )
+    wgt = rng.uniform(1e2, 1e4, size=shape).astype(np.float32)
+    wgt[:, ::7] = 0.0
+
+    t_old, v_old = _time(_old, val, wgt)
+    t_new, v_new = _time(_new, val, wgt)
+
+    print("shape %s, %.1f MB" % (shape, val.nbytes / 2.0 ** 20))
+    print("old: %.3f s" % t_old)
+    print("new: %.3f s (%.1fx)" % (t_new, t_old / t_new))
+    print("max difference: %g" % np.abs(v_old - v_new).max())
+
+
+if __name__ == "__main__":
+    main(*[int(arg) for arg in sys.argv[1:]])
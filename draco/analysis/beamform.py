@@ -12,7 +12,8 @@ from caput import config, mpiutil, mpiarray
 from cora.util import units
 
 from ..core import task, containers, io
-from ..util._fast_tools import beamform
+from ..util import autotune
+from ..util._fast_tools import beamform, beamform_separable
 from ..util.tools import baseline_vector, polarization_map, invert_no_zero
 from ..util.tools import calculate_redundancy
 
@@ -224,28 +225,54 @@ class BeamFormBase(task.SingleTask):
 
                 # Fringestop and sum over products
                 # 'beamform' does not normalize sum.
-                this_formed_beam = beamform(
-                    self.vis[pol],
-                    self.sumweight[pol],
-                    dec,
-                    self.latitude,
-                    np.cos(ha_array),
-                    np.sin(ha_array),
-                    self.bvec[pol][0],
-                    self.bvec[pol][1],
-                    f_local_indices,
-                    ra_index_range,
+                u, v, u_index, v_index = self.bvec[pol]
+                nvis = (
+                    len(f_local_indices) * len(ra_index_range) * self.vis[pol].shape[2]
                 )
+                if u_index is not None:
+                    this_formed_beam = beamform_separable(
+                        self.vis[pol],
+                        self.sumweight[pol],
+                        dec,
+                        self.latitude,
+                        np.cos(ha_array),
+                        np.sin(ha_array),
+                        u,
+                        v,
+                        u_index,
+                        v_index,
+                        f_local_indices,
+                        ra_index_range,
+                        num_threads=autotune.num_threads("beamform_separable", nvis),
+                    )
+                else:
+                    this_formed_beam = beamform(
+                        self.vis[pol],
+                        self.sumweight[pol],
+                        dec,
+                        self.latitude,
+                        np.cos(ha_array),
+                        np.sin(ha_array),
+                        u,
+                        v,
+                        f_local_indices,
+                        ra_index_range,
+                        num_threads=autotune.num_threads("beamform", nvis),
+                    )
 
                 sumweight_inrange = self.sumweight[pol][:, ra_index_range, :]
                 visweight_inrange = self.visweight[pol][:, ra_index_range, :]
 
+                # The weights are stored in single precision, so accumulate
+                # their sums over products in double precision
                 if self.collapse_ha:
                     # Sum over RA. Does not multiply by weights because
                     # this_formed_beam was never normalized (this avoids
                     # re-work and makes code more efficient).
                     this_sumweight = np.sum(
-                        np.sum(sumweight_inrange, axis=-1) * primary_beam, axis=1
+                        np.sum(sumweight_inrange, axis=-1, dtype=np.float64)
+                        * primary_beam,
+                        axis=1,
                     )
 
                     formed_beam_full[pol] = np.sum(
@@ -258,13 +285,15 @@ class BeamFormBase(task.SingleTask):
                                 sumweight_inrange ** 2
                                 * invert_no_zero(visweight_inrange),
                                 axis=-1,
+                                dtype=np.float64,
                             )
                             * primary_beam ** 2,
                             axis=1,
                         )
                     else:
                         this_weight2 = np.sum(
-                            np.sum(sumweight_inrange, axis=-1) * primary_beam ** 2,
+                            np.sum(sumweight_inrange, axis=-1, dtype=np.float64)
+                            * primary_beam ** 2,
                             axis=1,
                         )
 
@@ -275,7 +304,9 @@ class BeamFormBase(task.SingleTask):
                     # Need to divide by weight here for proper
                     # normalization because it is not done in
                     # beamform()
-                    this_sumweight = np.sum(sumweight_inrange, axis=-1)
+                    this_sumweight = np.sum(
+                        sumweight_inrange, axis=-1, dtype=np.float64
+                    )
                     # Populate only where ha_mask is true. Zero otherwise.
                     formed_beam_full[pol][
                         :, ha_mask
@@ -284,6 +315,7 @@ class BeamFormBase(task.SingleTask):
                         this_weight2 = np.sum(
                             sumweight_inrange ** 2 * invert_no_zero(visweight_inrange),
                             axis=-1,
+                            dtype=np.float64,
                         )
                         # Populate only where ha_mask is true. Zero otherwise.
                         weight_full[pol][
@@ -534,36 +566,45 @@ class BeamFormBase(task.SingleTask):
             pol = fullpol.index(pol)
             polmask = polmap == pol
             # Swap order of product(1) and RA(2) axes, to reduce striding
-            # through memory later on.
-            self.vis.append(
-                np.copy(np.moveaxis(data.vis[:, polmask, :], 1, 2), order="C")
-            )
+            # through memory later on. The beamforming kernels accept the
+            # native types of the visibilities and weights, so don't convert.
+            self.vis.append(_select_transposed(data.vis[:], polmask))
             # Restrict visweight to the local frequencies
             self.visweight.append(
-                np.copy(
-                    np.moveaxis(
-                        data.weight[self.lo : self.lo + self.ls][:, polmask, :], 1, 2
-                    ).astype(np.float64),
-                    order="C",
-                )
+                _select_transposed(data.weight[self.lo : self.lo + self.ls], polmask)
             )
-            # Multiply bvec_m by frequencies to get vector in wavelengths.
-            # Shape: (2, nfreq_local, nvis), for each pol.
-            self.bvec.append(
-                np.copy(
-                    bvec_m[:, np.newaxis, polmask]
-                    * self.freq_local[np.newaxis, :, np.newaxis]
-                    * 1e6
-                    / C,
-                    order="C",
+            # Baseline vectors in wavelengths. The phase of each product is
+            # linear in its baseline, so if the EW and NS components only take
+            # a few distinct values (as for CHIME), store those and the index
+            # of each product into them, letting the phases be calculated per
+            # component. Otherwise store the full (nfreq_local, nvis) arrays.
+            wavenumber = self.freq_local[:, np.newaxis] * 1e6 / C
+            u_unique, u_index = np.unique(bvec_m[0, polmask], return_inverse=True)
+            v_unique, v_index = np.unique(bvec_m[1, polmask], return_inverse=True)
+            if len(u_unique) + len(v_unique) < polmask.sum():
+                self.bvec.append(
+                    (
+                        np.ascontiguousarray(u_unique[np.newaxis, :] * wavenumber),
+                        np.ascontiguousarray(v_unique[np.newaxis, :] * wavenumber),
+                        u_index.astype(np.intp),
+                        v_index.astype(np.intp),
+                    )
+                )
+            else:
+                self.bvec.append(
+                    (
+                        np.ascontiguousarray(bvec_m[0, polmask] * wavenumber),
+                        np.ascontiguousarray(bvec_m[1, polmask] * wavenumber),
+                        None,
+                        None,
+                    )
                 )
-            )
             if self.weight == "inverse_variance":
                 # Weights for sum are just the visibility weights
                 self.sumweight.append(self.visweight[-1])
             else:
                 # Ensure zero visweights result in zero sumweights
-                this_sumweight = (self.visweight[-1] > 0.0).astype(np.float64)
+                this_sumweight = (self.visweight[-1] > 0.0).astype(np.float32)
                 ssi = data.input_flags[:]
                 ssp = data.index_map["prod"][:]
                 sss = data.reverse_map["stack"]["stack"][:]
@@ -572,7 +613,7 @@ class BeamFormBase(task.SingleTask):
                 # It has shape (nstack, ntime)
                 redundancy = np.moveaxis(
                     calculate_redundancy(ssi, ssp, sss, nstack)[polmask].astype(
-                        np.float64
+                        np.float32
                     ),
                     0,
                     1,
@@ -581,7 +622,7 @@ class BeamFormBase(task.SingleTask):
                 #        astype(np.float64)[np.newaxis, np.newaxis, :])
                 this_sumweight *= redundancy
                 if self.weight == "uniform":
-                    this_sumweight = (this_sumweight > 0.0).astype(np.float64)
+                    this_sumweight = (this_sumweight > 0.0).astype(np.float32)
                 self.sumweight.append(np.copy(this_sumweight, order="C"))
 
 
@@ -683,3 +724,14 @@ class BeamFormCat(BeamFormBase):
 
         # Call generic process method.
         return super(BeamFormCat, self).process()
+
+
+def _select_transposed(arr, mask):
+    # Select the products in `mask` from a [freq, prod, time] array and swap
+    # the last two axes, returning a C ordered array. This is done a frequency
+    # at a time so there is only a small temporary copy.
+    arr = np.asarray(arr)
+    out = np.empty((arr.shape[0], arr.shape[2], np.sum(mask)), dtype=arr.dtype)
+    for fi in range(arr.shape[0]):
+        out[fi] = arr[fi][mask].T
+    return out
@@ -43,6 +43,8 @@ class DelayFilter(task.SingleTask):
         NS direction (like CHIME) use 'NS'. The default is 'NS'.
     """
 
+    modifies_input = True
+
     delay_cut = config.Property(proptype=float, default=0.1)
     za_cut = config.Property(proptype=float, default=1.0)
     update_weight = config.Property(proptype=bool, default=False)
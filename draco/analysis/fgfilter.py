@@ -71,7 +71,7 @@ class SVDModeProject(_ProjectFilterBase):
         bt : BeamTransfer
             This can also take a ProductManager instance.
         """
-        self.beamtransfer = io.get_beamtransfer(bt)
+        self.beamtransfer = io.cache_beamtransfer(io.get_beamtransfer(bt))
 
     def _forward(self, mmodes):
         # Forward transform into SVD basis
@@ -87,8 +87,9 @@ class SVDModeProject(_ProjectFilterBase):
         mmodes.redistribute("m")
         svdmodes.redistribute("m")
 
-        # Iterate over local m's, project mode and save to disk.
-        for lm, mi in mmodes.vis[:].enumerate(axis=0):
+        # Iterate over local m's, project mode and save to disk. The matrices
+        # for the next m are read while the current one is projected.
+        for lm, mi in io.prefetch_m(mmodes.vis[:].enumerate(axis=0), bt.beam_ut):
 
             tm = mmodes.vis[mi].transpose((1, 0, 2)).reshape(tel.nfreq, 2 * tel.npairs)
             svdm = bt.project_vector_telescope_to_svd(mi, tm)
@@ -133,8 +134,9 @@ class SVDModeProject(_ProjectFilterBase):
         mmodes.redistribute("m")
         svdmodes.redistribute("m")
 
-        # Iterate over local m's, project mode and save to disk.
-        for lm, mi in mmodes.vis[:].enumerate(axis=0):
+        # Iterate over local m's, project mode and save to disk. The matrices
+        # for the next m are read while the current one is projected.
+        for lm, mi in io.prefetch_m(mmodes.vis[:].enumerate(axis=0), bt.beam_ut):
 
             svdm = svdmodes.vis[mi]
             tm = bt.project_vector_svd_to_telescope(mi, svdm)
@@ -184,7 +186,9 @@ class KLModeProject(_ProjectFilterBase):
                 "Requested KL basis %s not available (options are %s)"
                 % (self.klname, repr(list(self.product_manager.kltransforms.items())))
             )
-        kl = self.product_manager.kltransforms[self.klname]
+        kl = io.cache_methods(
+            self.product_manager.kltransforms[self.klname], ["modes_m"]
+        )
 
         # Construct the container and redistribute
         klmodes = containers.KLModes(
@@ -196,8 +200,10 @@ class KLModeProject(_ProjectFilterBase):
         klmodes.redistribute("m")
         svdmodes.redistribute("m")
 
-        # Iterate over local m's and project mode into KL basis
-        for lm, mi in svdmodes.vis[:].enumerate(axis=0):
+        # Iterate over local m's and project mode into KL basis, reading the
+        # modes for the next m while the current one is projected
+        modes_m = (kl.modes_m, {"threshold": self.threshold})
+        for lm, mi in io.prefetch_m(svdmodes.vis[:].enumerate(axis=0), modes_m):
 
             sm = svdmodes.vis[mi][: svdmodes.nmode[mi]]
             klm = kl.project_vector_svd_to_kl(mi, sm, threshold=self.threshold)
@@ -223,7 +229,9 @@ class KLModeProject(_ProjectFilterBase):
                 "Requested KL basis %s not available (options are %s)"
                 % (self.klname, repr(list(self.product_manager.kltransforms.items())))
             )
-        kl = self.product_manager.kltransforms[self.klname]
+        kl = io.cache_methods(
+            self.product_manager.kltransforms[self.klname], ["modes_m"]
+        )
 
         # Construct the container and redistribute
 
@@ -233,8 +241,10 @@ class KLModeProject(_ProjectFilterBase):
         klmodes.redistribute("m")
         svdmodes.redistribute("m")
 
-        # Iterate over local m's and project mode into KL basis
-        for lm, mi in klmodes.vis[:].enumerate(axis=0):
+        # Iterate over local m's and project mode into KL basis, reading the
+        # modes for the next m while the current one is projected
+        modes_m = (kl.modes_m, {"threshold": self.threshold})
+        for lm, mi in io.prefetch_m(klmodes.vis[:].enumerate(axis=0), modes_m):
 
             klm = klmodes.vis[mi][: klmodes.nmode[mi]]
             sm = kl.project_vector_kl_to_svd(mi, klm, threshold=self.threshold)
@@ -51,6 +51,8 @@ class DayMask(task.SingleTask):
         does not use data from the masked region.
     """
 
+    modifies_input = True
+
     start = config.Property(proptype=float, default=90.0)
     end = config.Property(proptype=float, default=270.0)
 
@@ -131,6 +133,8 @@ class MaskData(task.SingleTask):
         Include negative m-modes (default=True).
     """
 
+    modifies_input = True
+
     auto_correlations = config.Property(proptype=bool, default=False)
     m_zero = config.Property(proptype=bool, default=False)
     positive_m = config.Property(proptype=bool, default=True)
@@ -185,6 +189,8 @@ class MaskBaselines(task.SingleTask):
         (default is False).
     """
 
+    modifies_input = True
+
     mask_long_ns = config.Property(proptype=float, default=None)
     mask_short = config.Property(proptype=float, default=None)
     mask_short_ew = config.Property(proptype=float, default=None)
@@ -251,6 +257,8 @@ class RadiometerWeight(task.SingleTask):
 
     """
 
+    modifies_input = True
+
     replace = config.Property(proptype=bool, default=True)
 
     def process(self, stream):
@@ -313,6 +321,8 @@ class SmoothVisWeight(task.SingleTask):
 
     """
 
+    modifies_input = True
+
     # 31 time points correspond to ~ 5min in 10s cadence
     kernel_size = config.Property(proptype=int, default=31)
 
@@ -367,6 +377,8 @@ class ThresholdVisWeight(task.SingleTask):
         will be set to zero.
     """
 
+    modifies_input = True
+
     absolute_threshold = config.Property(proptype=float, default=1e-7)
     relative_threshold = config.Property(proptype=float, default=0.0)
 
@@ -419,6 +431,8 @@ class RFIMask(task.SingleTask):
         Deprecated option to remove the striping.
     """
 
+    modifies_input = True
+
     sigma = config.Property(proptype=float, default=5.0)
     tv_fraction = config.Property(proptype=float, default=0.5)
     stack_ind = config.Property(proptype=int)
@@ -47,7 +47,7 @@ class BaseMapMaker(task.SingleTask):
             pre-generated beam transfer matrices.
         """
 
-        self.beamtransfer = io.get_beamtransfer(bt)
+        self.beamtransfer = io.cache_beamtransfer(io.get_beamtransfer(bt))
 
     def process(self, mmodes):
         """Make a map from the given m-modes.
@@ -100,18 +100,15 @@ class BaseMapMaker(task.SingleTask):
         )
         alm[:] = 0.0
 
-        # Loop over all m's and solve from m-mode visibilities to alms.
-        for mi, m in m_array.enumerate(axis=0):
+        # Loop over all m's and solve from m-mode visibilities to alms. The beam
+        # transfer matrices for the next m are read while the current one is
+        # solved for, and requests for single frequencies are served from them.
+        for mi, m in io.prefetch_m(m_array.enumerate(axis=0), bt.beam_m):
 
             self.log.debug(
                 "Processing m=%i (local %i/%i)", m, mi + 1, m_array.local_shape[0]
             )
 
-            # Get and cache the beam transfer matrix, but trim off any l < m.
-            # if self.bt_cache is None:
-            #     self.bt_cache = (m, bt.beam_m(m))
-            #     self.log.debug("Cached beamtransfer for m=%i", m)
-
             for fi in range(nfreq):
                 v = m_array[mi, :, fi].view(np.ndarray)
                 a = alm[fi, ..., mi].view(np.ndarray)
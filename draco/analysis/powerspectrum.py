@@ -11,7 +11,7 @@ from future.builtins.disabled import *  # noqa  pylint: disable=W0401, W0614
 import numpy as np
 
 from caput import config
-from ..core import task, containers
+from ..core import task, containers, io
 
 
 class QuadraticPSEstimation(task.SingleTask):
@@ -67,9 +67,12 @@ class QuadraticPSEstimation(task.SingleTask):
         pse = self.manager.psestimators[self.psname]
         pse.genbands()
 
+        # Read the KL modes for the next m while the current one is processed
+        kl = io.cache_methods(pse.kltrans, ["modes_m"])
+
         q_list = []
 
-        for mi, m in klmodes.vis[:].enumerate(axis=0):
+        for mi, m in io.prefetch_m(klmodes.vis[:].enumerate(axis=0), kl.modes_m):
             ps_single = pse.q_estimator(m, klmodes.vis[m, : klmodes.nmode[m]])
             q_list.append(ps_single)
 
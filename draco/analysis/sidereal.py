@@ -51,17 +51,24 @@ class SiderealGrouper(task.SingleTask):
         should set this quantity to `240 * (source_ra - 180)`.
     min_day_length : float
         Require at least this fraction of a full sidereal day to process.
+    manifest : str, optional
+        Path of a manifest of the incoming files (see
+        :func:`draco.core.io.build_manifest`). With it, each day is passed on
+        as soon as its last file has been received, rather than when the
+        first file of a later day arrives.
     """
 
     padding = config.Property(proptype=float, default=0.0)
     offset = config.Property(proptype=float, default=0.0)
     min_day_length = config.Property(proptype=float, default=0.10)
+    manifest = config.Property(proptype=str, default=None)
 
     def __init__(self):
         super(SiderealGrouper, self).__init__()
 
         self._timestream_list = []
         self._current_lsd = None
+        self._file_starts = None
 
     def setup(self, manager):
         """Set the local observers position.
@@ -76,6 +83,13 @@ class SiderealGrouper(task.SingleTask):
         # Need an observer object holding the geographic location of the telescope.
         self.observer = io.get_telescope(manager)
 
+        # Get the start times of all the files to come from the manifest
+        if self.manifest is not None:
+            files = io.load_manifest(self.manifest)["files"]
+            self._file_starts = np.sort(
+                [entry["time"][0] for entry in files.values() if "time" in entry]
+            )
+
     def process(self, tstream):
         """Load in each sidereal day.
 
@@ -126,9 +140,34 @@ class SiderealGrouper(task.SingleTask):
             self._current_lsd = lsd_end
 
             return tstream_all
+
+        # If no later file starts in the current LSD it's complete
+        elif self._last_file_of_lsd(tstream):
+            self.log.info("Concatenating files for LSD:%i", self._current_lsd)
+
+            tstream_all = self._process_current_lsd()
+
+            self._timestream_list = []
+            self._current_lsd = None
+
+            return tstream_all
+
         else:
             return None
 
+    def _last_file_of_lsd(self, tstream):
+        # Use the manifest to check if any files after this one start in the
+        # current LSD
+        if self._file_starts is None:
+            return False
+
+        later = self._file_starts[self._file_starts > tstream.time[0]]
+        if len(later) == 0:
+            return True
+
+        next_lsd = int(self.observer.unix_to_lsd(later[0] - self.padding - self.offset))
+        return next_lsd > self._current_lsd
+
     def process_finish(self):
         """Return the final sidereal day.
 
@@ -140,6 +179,9 @@ class SiderealGrouper(task.SingleTask):
         """
 
         # If we are here there is no more data coming, we just need to process any remaining data
+        if not self._timestream_list:
+            return None
+
         tstream_all = self._process_current_lsd()
 
         return tstream_all
@@ -286,8 +328,11 @@ class SiderealStacker(task.SingleTask):
             self.stack = containers.empty_like(sdata)
             self.stack.redistribute("freq")
 
-            self.stack.vis[:] = sdata.vis[:] * sdata.weight[:]
-            self.stack.weight[:] = sdata.weight[:]
+            self.stack.vis[:] = 0.0
+            self.stack.weight[:] = 0.0
+            tools.weighted_accumulate(
+                self.stack.vis[:], self.stack.weight[:], sdata.vis[:], sdata.weight[:]
+            )
 
             self.lsd_list = input_lsd
 
@@ -300,8 +345,9 @@ class SiderealStacker(task.SingleTask):
         # note: Eventually we should fix up gains
 
         # Combine stacks with inverse `noise' weighting
-        self.stack.vis[:] += sdata.vis[:] * sdata.weight[:]
-        self.stack.weight[:] += sdata.weight[:]
+        tools.weighted_accumulate(
+            self.stack.vis[:], self.stack.weight[:], sdata.vis[:], sdata.weight[:]
+        )
 
         self.lsd_list += input_lsd
 
@@ -317,7 +363,8 @@ class SiderealStacker(task.SingleTask):
         self.stack.attrs["tag"] = "stack"
         self.stack.attrs["lsd"] = np.array(self.lsd_list)
 
-        self.stack.vis[:] *= tools.invert_no_zero(self.stack.weight[:])
+        stack_vis = self.stack.vis[:]
+        tools.divide_no_zero(stack_vis, self.stack.weight[:], out=stack_vis)
 
         return self.stack
 
@@ -85,6 +85,8 @@ class SVDFilter(task.SingleTask):
         largest mode on any m
     """
 
+    modifies_input = True
+
     niter = config.Property(proptype=int, default=5)
     global_threshold = config.Property(proptype=float, default=1e-3)
     local_threshold = config.Property(proptype=float, default=1e-2)
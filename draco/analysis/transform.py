@@ -74,25 +74,36 @@ class FrequencyRebin(task.SingleTask):
         # Create new container for rebinned stream
         sb = containers.empty_like(ss, freq=freq_map)
 
+        # The gains aren't created by default, so only rebin them if present
+        has_gain = "gain" in ss.datasets
+        if has_gain:
+            sb.add_dataset("gain")
+            sb.gain[:] = 0.0
+
         # Get all frequencies onto same node
         sb.redistribute(["time", "ra"])
 
+        # Get views of the local data to accumulate into directly
+        ssv = ss.vis[:].view(np.ndarray)
+        ssw = ss.weight[:].view(np.ndarray)
+        sbv = sb.vis[:].view(np.ndarray)
+        sbw = sb.weight[:].view(np.ndarray)
+
         # Rebin the arrays, do this with a loop to save memory
         for fi in range(len(ss.freq)):
 
             # Calculate rebinned index
             ri = fi // self.channel_bin
 
-            sb.vis[ri] += ss.vis[fi] * ss.weight[fi]
-            sb.gain[ri] += (
-                ss.gain[fi] / self.channel_bin
-            )  # Don't do weighted average for the moment
-
-            sb.weight[ri] += ss.weight[fi]
+            tools.weighted_accumulate(sbv[ri], sbw[ri], ssv[fi], ssw[fi])
+            if has_gain:
+                sb.gain[ri] += (
+                    ss.gain[fi] / self.channel_bin
+                )  # Don't do weighted average for the moment
 
             # If we are on the final sub-channel then divide the arrays through
             if (fi + 1) % self.channel_bin == 0:
-                sb.vis[ri] *= tools.invert_no_zero(sb.weight[ri])
+                tools.divide_no_zero(sbv[ri], sbw[ri], out=sbv[ri])
 
         sb.redistribute("freq")
 
@@ -138,15 +149,10 @@ class CollateProducts(task.SingleTask):
         self.telescope = io.get_telescope(tel)
 
         # Precalculate the stack properties
-        self.bt_stack = np.array(
-            [
-                (tools.cmap(upp[0], upp[1], self.telescope.nfeed), 0)
-                if upp[0] <= upp[1]
-                else (tools.cmap(upp[1], upp[0], self.telescope.nfeed), 1)
-                for upp in self.telescope.uniquepairs
-            ],
-            dtype=[("prod", "<u4"), ("conjugate", "u1")],
-        )
+        upp = np.asarray(self.telescope.uniquepairs)
+        self.bt_stack = np.empty(len(upp), dtype=[("prod", "<u4"), ("conjugate", "u1")])
+        self.bt_stack["prod"] = tools.cmap(upp[:, 0], upp[:, 1], self.telescope.nfeed)
+        self.bt_stack["conjugate"] = upp[:, 0] > upp[:, 1]
 
         # Construct the equivalent prod and stack index_map for the telescope instance
         dt_prod = np.dtype([("input_a", "<u2"), ("input_b", "<u2")])
@@ -355,14 +361,14 @@ class CollateProducts(task.SingleTask):
                 spv[:, sp_pi] += wss * ssv[freq_ind, ss_pi].conj()
 
             # Accumulate variances in quadrature.  Save in the weight dataset.
-            spw[:, sp_pi] += wss ** 2 * tools.invert_no_zero(ssw[freq_ind, ss_pi])
+            spw[:, sp_pi] += tools.divide_no_zero(wss ** 2, ssw[freq_ind, ss_pi])
 
             # Increment counter
             counter[:, sp_pi] += wss
 
         # Divide through by counter to get properly weighted visibility average
-        sp.vis[:] *= tools.invert_no_zero(counter)
-        sp.weight[:] = counter ** 2 * tools.invert_no_zero(sp.weight[:])
+        tools.divide_no_zero(spv, counter, out=spv)
+        tools.divide_no_zero(np.square(counter, out=counter), spw, out=spw)
 
         # Switch back to frequency distribution
         ss.redistribute("freq")
@@ -685,10 +691,9 @@ class Regridder(task.SingleTask):
         # scale to specified range
         interp_grid = interp_grid * (self.end - self.start) + self.start
 
-        # Construct regridding matrix for reverse problem
-        lzf = regrid.lanczos_forward_matrix(
-            interp_grid, times, self.lanczos_width
-        ).T.copy()
+        # Construct regridding matrix for reverse problem. This is given in band
+        # form, i.e. only the non-zero entries for each time sample
+        lzf = regrid.lanczos_band_matrix(interp_grid, times, self.lanczos_width)
 
         # Reshape data
         vr = vis_data.reshape(-1, vis_data.shape[-1])
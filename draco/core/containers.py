@@ -44,6 +44,7 @@ from past.builtins import basestring
 # === End Python 2/3 compatibility
 
 import inspect
+import weakref
 
 import numpy as np
 
@@ -55,6 +56,11 @@ try:
 except ImportError:
     HAS_BITSHUFFLE = False
 
+# Attribute memh5 uses to mark distributed datasets in files
+_DIST_HINT = "__memh5_distributed_dset"
+
+# Size in bytes of the blocks contiguous datasets are transformed and written in
+_WRITE_BLOCK_BYTES = 2 ** 24
 
 
 class ContainerBase(memh5.BasicCont):
@@ -339,6 +345,577 @@ class ContainerBase(memh5.BasicCont):
         # hash randomization
         return tuple(sorted(axes))
 
+    def to_cache(self, dirname):
+        """Write the container into an uncompressed, memory-mappable cache.
+
+        The cache is a directory holding one raw binary file per dataset per
+        rank slab, alongside a `meta.h5` sidecar containing the attributes,
+        index and reverse maps, and the layout of every dataset. Reloading
+        with :meth:`from_cache` memory maps the raw files, so is nearly
+        instantaneous.
+
+        Parameters
+        ----------
+        dirname : string
+            Directory to write the cache into. Any existing cache in this
+            location is replaced.
+        """
+
+        import h5py
+        import os
+        import shutil
+
+        comm = self.comm
+        rank = comm.rank if comm is not None else 0
+
+        # Write into a temporary directory and move into place at the end, such
+        # that a partially written cache is never picked up
+        dirname = os.path.normpath(dirname)
+        tmpdir = dirname + ".tmp"
+
+        if rank == 0:
+            if os.path.exists(tmpdir):
+                shutil.rmtree(tmpdir)
+            os.makedirs(tmpdir)
+        if comm is not None:
+            comm.Barrier()
+
+        layout = {}
+
+        for name, dset in self.datasets.items():
+
+            if isinstance(dset, memh5.MemDatasetDistributed):
+                axis = dset.distributed_axis
+                local = dset[:].view(np.ndarray)
+                offset = dset.local_offset[axis]
+
+                fname = "%s.%i.raw" % (name, rank)
+                _to_h5_compatible(np.ascontiguousarray(local)).tofile(
+                    os.path.join(tmpdir, fname)
+                )
+
+                slab = (offset, local.shape[axis])
+                slabs = comm.allgather(slab) if comm is not None else [slab]
+                layout[name] = (axis,) + tuple(zip(*slabs))
+
+            else:
+                if rank == 0:
+                    _to_h5_compatible(np.ascontiguousarray(dset[:])).tofile(
+                        os.path.join(tmpdir, "%s.raw" % name)
+                    )
+                layout[name] = None
+
+        if rank == 0:
+
+            with h5py.File(os.path.join(tmpdir, "meta.h5"), "w") as f:
+
+                _write_h5_attrs(self.attrs, f.attrs)
+                f.attrs["__cache_class"] = (
+                    self.__class__.__module__ + "." + self.__class__.__name__
+                )
+
+                for mapname in ["index_map", "reverse_map"]:
+                    group = f.create_group(mapname)
+                    for key, value in getattr(self, mapname).items():
+                        _write_h5_array(group, key, value[:])
+
+                # Store an empty placeholder per dataset to record its type,
+                # with the shape and distribution in the attributes
+                dgroup = f.create_group("datasets")
+                for name, dset in self.datasets.items():
+                    dtype = _to_h5_compatible(np.zeros(0, dtype=dset.dtype)).dtype
+                    placeholder = dgroup.create_dataset(name, shape=(0,), dtype=dtype)
+                    _write_h5_attrs(dset.attrs, placeholder.attrs)
+                    placeholder.attrs["__cache_shape"] = np.array(dset.shape)
+                    placeholder.attrs["__cache_unicode"] = dset.dtype.kind == "U"
+
+                    if layout[name] is not None:
+                        axis, offsets, sizes = layout[name]
+                        placeholder.attrs["__cache_axis"] = axis
+                        placeholder.attrs["__cache_offsets"] = np.array(offsets)
+                        placeholder.attrs["__cache_sizes"] = np.array(sizes)
+
+            if os.path.exists(dirname):
+                shutil.rmtree(dirname)
+            os.rename(tmpdir, dirname)
+
+        if comm is not None:
+            comm.Barrier()
+
+    @classmethod
+    def from_cache(cls, dirname, comm=None):
+        """Load a container from a cache written by :meth:`to_cache`.
+
+        Datasets are memory mapped copy-on-write, so modifying them does not
+        change the cache on disk. If the number of ranks matches
+        that used to write the cache each rank maps its own slab directly,
+        otherwise the overlapping parts of the slabs are copied in.
+
+        Parameters
+        ----------
+        dirname : string
+            Directory containing the cache.
+        comm : MPI.Comm, optional
+            Communicator to distribute over. Use `COMM_WORLD` if not set.
+
+        Returns
+        -------
+        cont : ContainerBase
+            The container. If called on a base class the type stored in the
+            cache is used.
+        """
+
+        import h5py
+        import os
+
+        from caput import mpiarray, mpiutil
+
+        if comm is None:
+            comm = mpiutil.world
+        rank, size = (comm.rank, comm.size) if comm is not None else (0, 1)
+
+        group = memh5.MemGroup(distributed=True, comm=comm)
+
+        with h5py.File(os.path.join(dirname, "meta.h5"), "r") as f:
+
+            _read_h5_attrs(f.attrs, group.attrs)
+            clspath = group.attrs.pop("__cache_class")
+
+            for mapname in ["index_map", "reverse_map"]:
+                mgroup = group.create_group(mapname)
+                for key, value in f[mapname].items():
+                    unicode_ = value.attrs["__cache_unicode"]
+                    mgroup.create_dataset(
+                        key, data=_from_h5_compatible(value[:], unicode_)
+                    )
+
+            for name, placeholder in f["datasets"].items():
+
+                attrs = {}
+                _read_h5_attrs(placeholder.attrs, attrs)
+                shape = tuple(attrs.pop("__cache_shape"))
+                unicode_ = attrs.pop("__cache_unicode")
+                dtype = placeholder.dtype
+
+                if "__cache_axis" in attrs:
+                    axis = int(attrs.pop("__cache_axis"))
+                    offsets = attrs.pop("__cache_offsets")
+                    sizes = attrs.pop("__cache_sizes")
+
+                    n, start, end = mpiutil.split_local(shape[axis], comm=comm)
+
+                    def _slab(ri, mode="c"):
+                        slab_shape = shape[:axis] + (sizes[ri],) + shape[(axis + 1) :]
+                        return np.memmap(
+                            os.path.join(dirname, "%s.%i.raw" % (name, ri)),
+                            dtype=dtype,
+                            mode=mode,
+                            shape=slab_shape,
+                        )
+
+                    # Map our own slab directly if the distribution is unchanged
+                    if (
+                        len(offsets) == size
+                        and offsets[rank] == start
+                        and sizes[rank] == n
+                        and not unicode_
+                    ):
+                        local = _slab(rank)
+
+                    # Otherwise copy in the overlapping parts of each slab
+                    else:
+                        local_shape = shape[:axis] + (n,) + shape[(axis + 1) :]
+                        local = np.empty(local_shape, dtype=dtype)
+                        for ri, (so, ss) in enumerate(zip(offsets, sizes)):
+                            lo, hi = max(so, start), min(so + ss, end)
+                            if lo >= hi:
+                                continue
+                            pad = (slice(None),) * axis
+                            local[pad + (slice(lo - start, hi - start),)] = _slab(
+                                ri, mode="r"
+                            )[pad + (slice(lo - so, hi - so),)]
+                        local = _from_h5_compatible(local, unicode_)
+
+                    data = mpiarray.MPIArray.wrap(local, axis=axis, comm=comm)
+                    dset = group.create_dataset(
+                        name, data=data, distributed=True, distributed_axis=axis
+                    )
+
+                else:
+                    data = np.memmap(
+                        os.path.join(dirname, "%s.raw" % name),
+                        dtype=dtype,
+                        mode="c",
+                        shape=shape,
+                    )
+                    dset = group.create_dataset(
+                        name, data=_from_h5_compatible(data, unicode_)
+                    )
+
+                memh5.copyattrs(attrs, dset.attrs)
+
+        # Use the stored container type if it is a subclass of the one requested
+        stored_cls = _import_class(clspath)
+        if issubclass(stored_cls, cls):
+            cls = stored_cls
+
+        return _bare_container(cls, group, comm)
+
+    @classmethod
+    def from_file(
+        cls, filename, distributed_axis=None, comm=None, num_threads=None, **kwargs
+    ):
+        """Load a container from an HDF5 file.
+
+        Parameters
+        ----------
+        filename : string
+            File to load.
+        distributed_axis : string or dict, optional
+            The name of the axis to distribute the datasets over when loading.
+            Either a single axis name for every distributed dataset, or a
+            dictionary of dataset name to axis name. Each rank then reads its
+            own section along that axis directly, so there is no need to
+            redistribute after loading. Datasets without the axis are
+            distributed along their first axis.
+        comm : MPI.Comm, optional
+            Communicator to distribute over. Use `COMM_WORLD` if not set.
+        num_threads : int, optional
+            If set, datasets compressed with bitshuffle/LZ4 are read with
+            direct chunk reads and decompressed in this many threads per rank,
+            straight into the loaded arrays. Zero means use `OMP_NUM_THREADS`.
+        **kwargs
+            Passed to :meth:`memh5.BasicCont.from_file` if neither
+            `distributed_axis` nor `num_threads` is set.
+
+        Returns
+        -------
+        cont : ContainerBase
+            The container. If called on a base class the type stored in the
+            file is used.
+        """
+
+        if distributed_axis is None and num_threads is None:
+            return super(ContainerBase, cls).from_file(filename, comm=comm, **kwargs)
+
+        from caput import mpiutil
+
+        if comm is None:
+            comm = mpiutil.world
+        rank, size = (comm.rank, comm.size) if comm is not None else (0, 1)
+
+        local = _read_local(
+            filename, rank, size, axes=distributed_axis, num_threads=num_threads
+        )
+
+        return _container_from_local(local, comm, cls=cls)
+
+    def to_hdf5_collective(self, filename):
+        """Write the container to an HDF5 file using collective MPI-IO.
+
+        Every rank writes its own slab of each distributed dataset in
+        parallel, rather than funnelling the data through a few writers.
+        Distributed datasets keep their requested chunk shape, so where the
+        slab boundaries of the ranks don't line up with the chunks, HDF5 has
+        to combine the parts of the shared chunks from each rank. If h5py is
+        not built with MPI support, or the container is not distributed, this
+        falls back to :meth:`to_hdf5`.
+
+        Parameters
+        ----------
+        filename : string
+            File to write to. Overwritten if it already exists.
+        """
+
+        import h5py
+
+        comm = self.comm
+
+        if comm is None or not self.distributed or not h5py.get_config().mpi:
+            self.to_hdf5(filename)
+            return
+
+        with h5py.File(filename, "w", driver="mpio", comm=comm) as f:
+
+            _write_h5_attrs(self.attrs, f.attrs)
+            f.attrs["__memh5_subclass"] = (
+                self.__class__.__module__ + "." + self.__class__.__name__
+            )
+
+            _write_group_collective(self._data, f, comm)
+
+    def to_hdf5_threaded(self, filename, num_threads=None, transforms=None):
+        """Write the container to an HDF5 file, compressing in parallel.
+
+        Distributed datasets compressed with bitshuffle/LZ4 have their chunks
+        compressed in a pool of threads, and written with HDF5 direct chunk
+        writes, rather than by the serial HDF5 filter pipeline. Ranks write in
+        turn, and any chunks split between the slabs of two ranks are written
+        by each through the filter pipeline.
+
+        Parameters
+        ----------
+        filename : string
+            File to write to. Overwritten if it already exists.
+        num_threads : int, optional
+            Number of threads to compress with on each rank. By default use
+            `OMP_NUM_THREADS`.
+        transforms : dict, optional
+            Functions to apply to distributed datasets as they are written,
+            keyed by dataset name. Each is called as `func(part, sel)` on a
+            copy of each chunk (or block) sized part of the local data of a
+            distributed dataset, or of the whole of a non-distributed one,
+            where `sel` is its selection within the local array, and must
+            modify `part` in place. The container itself is left unchanged.
+        """
+
+        import h5py
+
+        from ..util import chunkio
+
+        comm = self.comm
+        rank, size = (comm.rank, comm.size) if comm is not None else (0, 1)
+
+        items = list(_walk_group(self._data))
+
+        # Find the chunk shapes of the distributed datasets
+        chunks = {}
+        for path, item in items:
+            if isinstance(item, memh5.MemDatasetDistributed):
+                chunks[path] = _dist_chunks(item.chunks, item[:].global_shape)
+
+        # Create the file structure and write the common datasets
+        if rank == 0:
+            with h5py.File(filename, "w") as f:
+
+                _write_h5_attrs(self.attrs, f.attrs)
+                f.attrs["__memh5_subclass"] = (
+                    self.__class__.__module__ + "." + self.__class__.__name__
+                )
+
+                for path, item in items:
+
+                    if isinstance(item, memh5.MemGroup):
+                        _write_h5_attrs(item.attrs, f.create_group(path).attrs)
+                        continue
+
+                    if isinstance(item, memh5.MemDatasetDistributed):
+                        dtype = _to_h5_compatible(np.zeros(0, dtype=item.dtype)).dtype
+                        chunk = chunks[path]
+                        dset = f.create_dataset(
+                            path,
+                            shape=item[:].global_shape,
+                            dtype=dtype,
+                            chunks=chunk,
+                            compression=item.compression if chunk else None,
+                            compression_opts=item.compression_opts if chunk else None,
+                        )
+                        dset.attrs[_DIST_HINT] = True
+                    else:
+                        data = _to_h5_compatible(np.asarray(item[:]))
+                        func = transforms.get(path.lstrip("/")) if transforms else None
+                        if func is not None:
+                            data = np.array(data)
+                            func(data, (slice(None),) * data.ndim)
+
+                        dset = f.create_dataset(
+                            path,
+                            data=data,
+                            chunks=item.chunks,
+                            compression=item.compression,
+                            compression_opts=item.compression_opts,
+                        )
+
+                    _write_h5_attrs(item.attrs, dset.attrs)
+
+        # Each rank writes its slabs in turn
+        for ri in range(size):
+
+            if comm is not None:
+                comm.Barrier()
+
+            if ri != rank:
+                continue
+
+            with h5py.File(filename, "r+") as f:
+                for path, item in items:
+
+                    if not isinstance(item, memh5.MemDatasetDistributed):
+                        continue
+
+                    local = item[:]
+                    axis = item.distributed_axis
+                    data = _to_h5_compatible(local.view(np.ndarray))
+                    offset = [0] * data.ndim
+                    offset[axis] = local.local_offset[axis]
+
+                    if data.size == 0:
+                        continue
+
+                    dset = f[path]
+                    func = transforms.get(path.lstrip("/")) if transforms else None
+
+                    if dset.chunks is not None and chunkio.is_bitshuffle_lz4(dset):
+                        chunkio.write_chunks(dset, data, offset, num_threads, func)
+
+                    elif func is not None:
+                        # Transform and write in blocks along the first axis so
+                        # only a block is ever copied
+                        if dset.chunks is not None:
+                            step = dset.chunks[0]
+                        else:
+                            step = max(1, _WRITE_BLOCK_BYTES // data[:1].nbytes)
+                        for start in range(0, data.shape[0], step):
+                            sel = (slice(start, start + step),)
+                            part = np.array(data[sel])
+                            func(part, sel)
+                            dsel = list(offset)
+                            dsel[0] += start
+                            dset.write_direct(
+                                part,
+                                dest_sel=tuple(
+                                    slice(o, o + n) for o, n in zip(dsel, part.shape)
+                                ),
+                            )
+
+                    else:
+                        sel = tuple(slice(o, o + n) for o, n in zip(offset, data.shape))
+                        dset[sel] = data
+
+        if comm is not None:
+            comm.Barrier()
+
+    def cow_copy(self):
+        """Create a copy-on-write clone of this container.
+
+        The clone gets its own attributes and index maps, but shares the
+        buffers of all datasets with this container. While they are shared
+        the buffers are read-only in both the clone and this container, so an
+        in place write to either raises an error rather than showing up in
+        the other. The first container to call :meth:`ensure_writeable` on a
+        shared dataset takes a private copy of it, and when only one container
+        is left referencing a buffer it becomes writeable again without a copy.
+
+        :class:`~draco.core.task.SingleTask` calls :meth:`ensure_writeable` on
+        the inputs of tasks that set `modifies_input`. Other code modifying a
+        container in place must call :meth:`ensure_writeable` first.
+
+        Returns
+        -------
+        clone : ContainerBase
+            A container of the same type.
+        """
+
+        group = memh5.MemGroup(distributed=self.distributed, comm=self.comm)
+        memh5.copyattrs(self.attrs, group.attrs)
+
+        # The index maps are small so we just copy them
+        for mapname in ["index_map", "reverse_map"]:
+            mgroup = group.create_group(mapname)
+            for key, value in getattr(self, mapname).items():
+                mgroup.create_dataset(key, data=value[:].copy())
+
+        clone = _bare_container(
+            self.__class__, group, self.comm, distributed=self.distributed
+        )
+
+        shared = self._cow_shared
+
+        for name, dset in self.datasets.items():
+
+            # Swap our own array for a read-only view the first time it's
+            # shared, so that neither container can write into the other
+            if name not in shared:
+                view = dset[:].view()
+                view.flags.writeable = False
+                self._set_dataset_data(name, view)
+
+                shared[name] = _SharedDataset(name, view)
+                shared[name].add(self)
+
+            view = self.datasets[name][:].view()
+
+            clone._set_dataset_data(name, view, like=self.datasets[name])
+            clone._cow_shared[name] = shared[name]
+            shared[name].add(clone)
+
+        return clone
+
+    def ensure_writeable(self, names=None):
+        """Make sure the given datasets are not shared with other containers.
+
+        Any dataset shared copy-on-write (see :meth:`cow_copy`) is replaced
+        with a private copy.
+
+        Parameters
+        ----------
+        names : list of str, optional
+            Datasets to unshare. If not set, all shared datasets are.
+        """
+
+        shared = self._cow_shared
+
+        names = list(shared.keys()) if names is None else names
+
+        for name in names:
+
+            if name not in shared:
+                continue
+
+            share = shared.pop(name)
+            data = self.datasets[name][:]
+
+            # The dataset may already have been replaced, e.g. by a redistribute
+            if np.may_share_memory(data, share.data):
+                self._set_dataset_data(name, data.copy())
+
+            share.discard(self)
+
+    @property
+    def _cow_shared(self):
+        # The datasets shared copy-on-write with other containers. This is
+        # created on demand as containers loaded from files bypass `__init__`
+        if "_cow_shared_datasets" not in self.__dict__:
+            self._cow_shared_datasets = {}
+        return self._cow_shared_datasets
+
+    def _release_shared(self, name):
+        # Called when this is the last container sharing a dataset buffer,
+        # making it writeable in place
+        if self._cow_shared.pop(name, None) is None:
+            return
+
+        data = self.datasets[name][:]
+
+        if not data.flags.writeable:
+            data = data.view()
+            data.flags.writeable = True
+            self._set_dataset_data(name, data)
+
+    def _set_dataset_data(self, name, data, like=None):
+        # Replace (or create) a dataset with the given array, keeping the
+        # attributes and distribution of the original (or of `like`)
+
+        like = self.datasets[name] if like is None else like
+
+        kwargs = {
+            "chunks": getattr(like, "chunks", None),
+            "compression": getattr(like, "compression", None),
+            "compression_opts": getattr(like, "compression_opts", None),
+        }
+        if isinstance(like, memh5.MemDatasetDistributed):
+            kwargs["distributed"] = True
+            kwargs["distributed_axis"] = like.distributed_axis
+
+        attrs = {}
+        memh5.copyattrs(like.attrs, attrs)
+
+        if name in self._data:
+            del self._data[name]
+
+        dset = self._data.create_dataset(name, data=data, **kwargs)
+        memh5.copyattrs(attrs, dset.attrs)
+
 
 class TableBase(ContainerBase):
     """A base class for containers holding tables of data.
@@ -1505,3 +2082,330 @@ def empty_timestream(**kwargs):
     ts : TimeStream
     """
     return TimeStream(**kwargs)
+
+
+class _SharedDataset(object):
+    # Track the containers sharing a dataset buffer copy-on-write, so that the
+    # last one left can be told it's free to write in place
+
+    def __init__(self, name, data):
+        self.name = name
+        self.data = data
+        self._refs = []
+
+    def add(self, cont):
+        self._refs.append(weakref.ref(cont, self._remove_ref))
+
+    def discard(self, cont):
+        self._refs = [ref for ref in self._refs if ref() is not cont]
+        self._check_last()
+
+    def _remove_ref(self, dead_ref):
+        self._refs = [ref for ref in self._refs if ref is not dead_ref]
+        self._check_last()
+
+    def _check_last(self):
+        if len(self._refs) == 1:
+            cont = self._refs[0]()
+            if cont is not None:
+                cont._release_shared(self.name)
+
+
+def _import_class(clspath):
+    # Import a class from its fully qualified name
+    import importlib
+
+    modname, clsname = clspath.rsplit(".", 1)
+    return getattr(importlib.import_module(modname), clsname)
+
+
+def _bare_container(cls, group, comm, distributed=True):
+    # Wrap an existing memh5 group in a container of type `cls` without
+    # running the constructor, in the same way `memh5` does when loading
+    cont = cls.__new__(cls)
+    memh5.BasicCont.__init__(cont, data_group=group, distributed=distributed, comm=comm)
+    cont.allow_chunked = False
+    return cont
+
+
+def _to_h5_compatible(arr):
+    # HDF5 can't store numpy unicode strings, so encode them as bytes
+    if arr.dtype.kind == "U":
+        return np.char.encode(arr, "utf8")
+    return arr
+
+
+def _from_h5_compatible(arr, unicode_=True):
+    # Convert any byte strings back into unicode
+    if unicode_ and arr.dtype.kind == "S":
+        return np.char.decode(arr, "utf8")
+    return arr
+
+
+def _write_h5_array(group, name, arr):
+    # Write an array into an HDF5 group converting any unicode strings
+    dset = group.create_dataset(name, data=_to_h5_compatible(arr))
+    dset.attrs["__cache_unicode"] = arr.dtype.kind == "U"
+
+
+def _write_h5_attrs(src, dest):
+    # Copy attributes into an HDF5 attribute set, encoding unicode arrays
+    for key, value in src.items():
+        if isinstance(value, np.ndarray):
+            value = _to_h5_compatible(value)
+        dest[key] = value
+
+
+def _read_h5_attrs(src, dest):
+    # Copy attributes out of an HDF5 attribute set, decoding byte strings
+    for key, value in src.items():
+        if isinstance(value, bytes):
+            value = value.decode("utf8")
+        elif isinstance(value, np.ndarray):
+            value = _from_h5_compatible(value)
+        dest[key] = value
+
+
+def _read_local(
+    filename,
+    rank,
+    size,
+    distributed=True,
+    chunk_cache=None,
+    axes=None,
+    num_threads=None,
+):
+    # Read the parts of an HDF5 file local to `rank` (of `size`) into a nested
+    # dictionary of plain numpy arrays. Datasets flagged as distributed by
+    # memh5 are split along their first axis, as `memh5` itself does, unless
+    # `axes` gives an axis name (or a dict of dataset name to axis name) to
+    # split along instead. If `num_threads` is not None, bitshuffle compressed
+    # datasets are read with direct chunk reads and decompressed in that many
+    # threads. This makes no MPI calls so it is safe to run in a background
+    # thread. Use `_container_from_local` to turn the output into a container.
+    import h5py
+
+    kwargs = {} if chunk_cache is None else {"rdcc_nbytes": int(chunk_cache)}
+
+    with h5py.File(filename, "r", **kwargs) as f:
+        return _read_local_group(f, rank, size, distributed, axes, num_threads)
+
+
+def _dist_axis_index(name, attrs, axes):
+    # Find the index of the axis to distribute the named dataset along
+    if isinstance(axes, dict):
+        axes = axes.get(name, None)
+
+    dset_axes = list(attrs.get("axis", []))
+    if axes is not None and axes in dset_axes:
+        return dset_axes.index(axes)
+
+    return 0
+
+
+def _read_local_group(group, rank, size, distributed, axes=None, num_threads=None):
+    # Recursively read an HDF5 group for `_read_local`
+    import h5py
+
+    from caput import mpiutil
+
+    from ..util import chunkio
+
+    local = {"attrs": {}, "groups": {}, "datasets": {}}
+    _read_h5_attrs(group.attrs, local["attrs"])
+
+    for name, item in group.items():
+
+        if isinstance(item, h5py.Group):
+            local["groups"][name] = _read_local_group(
+                item, rank, size, distributed, axes, num_threads
+            )
+            continue
+
+        attrs = {}
+        _read_h5_attrs(item.attrs, attrs)
+        axis = None
+        if distributed and attrs.pop(_DIST_HINT, False):
+            axis = _dist_axis_index(name, attrs, axes)
+
+        threaded = (
+            num_threads is not None
+            and item.chunks is not None
+            and chunkio.is_bitshuffle_lz4(item)
+        )
+
+        if axis is None:
+            if threaded and item.size > 0:
+                data = np.empty(item.shape, item.dtype)
+                chunkio.read_chunks(item, data, num_threads=num_threads)
+            else:
+                data = item[()]
+            local["datasets"][name] = (data, attrs, None)
+            continue
+
+        n, start, end = mpiutil.split_m(item.shape[axis], size)[:, rank]
+        sel = (slice(None),) * axis + (slice(start, end),)
+
+        data = np.empty(item.shape[:axis] + (n,) + item.shape[(axis + 1) :], item.dtype)
+        if data.size > 0 and threaded:
+            offset = [0] * data.ndim
+            offset[axis] = start
+            chunkio.read_chunks(item, data, offset, num_threads)
+        elif data.size > 0:
+            item.read_direct(data, source_sel=sel)
+
+        local["datasets"][name] = (data, attrs, axis)
+
+    return local
+
+
+def _local_nbytes(filename, size, distributed=True):
+    # Estimate the memory needed on each rank to load the given file
+    import h5py
+
+    nbytes = [0]
+
+    def _count(name, item):
+        if isinstance(item, h5py.Dataset):
+            dist = distributed and item.attrs.get(_DIST_HINT, False)
+            nbytes[0] += item.size * item.dtype.itemsize // (size if dist else 1)
+
+    with h5py.File(filename, "r") as f:
+        f.visititems(_count)
+
+    return nbytes[0]
+
+
+def _container_from_local(local, comm, distributed=True, cls=memh5.BasicCont):
+    # Construct a container from the output of `_read_local`. This involves
+    # collective MPI calls so must be called on all ranks. The type stored in
+    # the file is used if it is a subclass of `cls`.
+
+    clspath = local["attrs"].get("__memh5_subclass", None)
+    if clspath is not None:
+        try:
+            stored_cls = _import_class(clspath)
+        except (ImportError, AttributeError):
+            stored_cls = None
+        if stored_cls is not None and issubclass(stored_cls, cls):
+            cls = stored_cls
+
+    group = memh5.MemGroup(distributed=distributed, comm=comm)
+    _fill_group_from_local(group, local, comm)
+
+    return _bare_container(cls, group, comm, distributed=distributed)
+
+
+def _fill_group_from_local(group, local, comm):
+    # Recursively fill a memh5 group for `_container_from_local`
+
+    from caput import mpiarray
+
+    memh5.copyattrs(local["attrs"], group.attrs)
+
+    # Iterate in a fixed order as creating a distributed dataset is collective
+    for name in sorted(local["groups"]):
+        _fill_group_from_local(group.create_group(name), local["groups"][name], comm)
+
+    for name in sorted(local["datasets"]):
+        data, attrs, axis = local["datasets"][name]
+
+        if axis is None:
+            dset = group.create_dataset(name, data=data)
+        else:
+            data = mpiarray.MPIArray.wrap(data, axis=axis, comm=comm)
+            dset = group.create_dataset(
+                name, data=data, distributed=True, distributed_axis=axis
+            )
+
+        memh5.copyattrs(attrs, dset.attrs)
+
+
+def _walk_group(group, prefix=""):
+    # Iterate over the path and item of every group and dataset below `group`,
+    # in the same order on all ranks, with parents before their children
+    for name in sorted(group.keys()):
+        item = group[name]
+        path = prefix + "/" + name
+
+        yield path, item
+
+        if isinstance(item, memh5.MemGroup):
+            for sub in _walk_group(item, path):
+                yield sub
+
+
+def _write_group_collective(group, h5group, comm):
+    # Recursively write a memh5 group into an HDF5 file opened with the mpio
+    # driver. Any change to the file structure is collective, so everything
+    # must be created in the same order on all ranks.
+
+    for name in sorted(group.keys()):
+        item = group[name]
+
+        if isinstance(item, memh5.MemGroup):
+            h5sub = h5group.create_group(name)
+            _write_h5_attrs(item.attrs, h5sub.attrs)
+            _write_group_collective(item, h5sub, comm)
+            continue
+
+        if not isinstance(item, memh5.MemDatasetDistributed):
+            data = _to_h5_compatible(np.asarray(item[:]))
+            dset = h5group.create_dataset(
+                name,
+                shape=data.shape,
+                dtype=data.dtype,
+                chunks=item.chunks,
+                compression=item.compression,
+                compression_opts=item.compression_opts,
+            )
+            _write_h5_attrs(item.attrs, dset.attrs)
+
+            # Filtered datasets can only be written collectively
+            if item.compression is not None:
+                with dset.collective:
+                    dset[...] = data
+            elif comm.rank == 0:
+                dset[...] = data
+            continue
+
+        axis = item.distributed_axis
+        local = item[:]
+        shape = local.global_shape
+
+        chunks = _dist_chunks(item.chunks, shape)
+
+        dtype = _to_h5_compatible(np.zeros(0, dtype=item.dtype)).dtype
+        dset = h5group.create_dataset(
+            name,
+            shape=shape,
+            dtype=dtype,
+            chunks=chunks,
+            compression=item.compression if chunks else None,
+            compression_opts=item.compression_opts if chunks else None,
+        )
+        _write_h5_attrs(item.attrs, dset.attrs)
+        dset.attrs[_DIST_HINT] = True
+
+        start = local.local_offset[axis]
+        sel = (slice(None),) * axis + (slice(start, start + local.local_shape[axis]),)
+        data = _to_h5_compatible(np.ascontiguousarray(local.view(np.ndarray)))
+
+        with dset.collective:
+            dset[sel] = data
+
+
+def _dist_chunks(chunks, shape):
+    # Get the chunk shape to write a distributed dataset with. This is the
+    # requested chunk shape, which is kept even if the chunk boundaries don't
+    # line up with the rank slabs. Aligning them means using a divisor of the
+    # gcd of the slab sizes, which for an uneven split (e.g. 1024 over 3 ranks)
+    # is 1. With 1024 x 64 x 128 float32 over 3 ranks that made writing ~20%
+    # slower and reading a spectrum ~30% slower, while the cost of the two
+    # chunks merged through the filter pipeline at each slab boundary was
+    # within the noise (see `benchmarks/bench_dist_chunks.py`). Datasets
+    # without a chunk shape are left contiguous.
+    if chunks is None or 0 in shape:
+        return None
+
+    return tuple(min(c, n) for c, n in zip(chunks, shape))
@@ -9,9 +9,13 @@ Tasks
     LoadFiles
     LoadMaps
     LoadFilesFromParams
+    LoadCachedFiles
+    LoadFilesFromManifest
     Save
     Print
     LoadBeamTransfer
+    LoadProductManager
+    LoadTelescopeSnapshot
 
 File Groups
 ===========
@@ -50,8 +54,16 @@ from caput import pipeline
 from caput import config
 
 from . import task
-from ..util.truncate import bit_truncate_weights, bit_truncate_fixed
-from .containers import SiderealStream, TimeStream, TrackBeam
+from ..util.truncate import truncate_weights, truncate_fixed
+from .containers import (
+    SiderealStream,
+    TimeStream,
+    TrackBeam,
+    MModes,
+    Map,
+    FormedBeam,
+    DelaySpectrum,
+)
 
 
 TRUNC_SPEC = {
@@ -73,6 +85,30 @@ TRUNC_SPEC = {
         "fixed_precision": 1e-4,
         "variance_increase": 1e-3,
     },
+    MModes: {
+        "dataset": ["vis", "vis_weight"],
+        "weight_dataset": ["vis_weight", None],
+        "fixed_precision": 1e-4,
+        "variance_increase": 1e-3,
+    },
+    Map: {
+        "dataset": ["map"],
+        "weight_dataset": [None],
+        "fixed_precision": 1e-4,
+        "variance_increase": 1e-3,
+    },
+    FormedBeam: {
+        "dataset": ["beam", "weight"],
+        "weight_dataset": ["weight", None],
+        "fixed_precision": 1e-4,
+        "variance_increase": 1e-3,
+    },
+    DelaySpectrum: {
+        "dataset": ["spectrum"],
+        "weight_dataset": [None],
+        "fixed_precision": 1e-4,
+        "variance_increase": 1e-3,
+    },
 }
 
 
@@ -139,12 +175,213 @@ def _list_of_filegroups(groups):
     return groups
 
 
-class LoadMaps(task.MPILoggedTask):
+class _FilePrefetcher(object):
+    # Read files ahead of when they are needed in a background thread.
+    #
+    # Only the sections of each file local to this rank are read, into
+    # preallocated numpy buffers, and without making any MPI calls. The
+    # container itself is assembled (collectively) on the main thread when the
+    # file is requested with `get`.
+
+    def __init__(
+        self,
+        comm,
+        depth,
+        memory=None,
+        chunk_cache=None,
+        distributed=True,
+        axes=None,
+        num_threads=None,
+    ):
+        self.comm = comm
+        self.rank, self.size = (comm.rank, comm.size) if comm is not None else (0, 1)
+        self.depth = depth
+        self.memory = memory
+        self.chunk_cache = chunk_cache
+        self.distributed = distributed
+        self.axes = axes
+        self.num_threads = num_threads
+
+        self._executor = None
+        self._pending = {}
+
+    def get(self, filename, upcoming=()):
+        # Fetch the container for `filename`, and start reading the files in
+        # `upcoming`, subject to the depth and memory limits
+        from . import containers
+
+        if filename in self._pending:
+            future, _ = self._pending.pop(filename)
+            local = future.result()
+        else:
+            local = self._read(filename)
+
+        self._schedule(upcoming)
+
+        return containers._container_from_local(
+            local, self.comm, distributed=self.distributed
+        )
+
+    def _read(self, filename):
+        from . import containers
+
+        return containers._read_local(
+            filename,
+            self.rank,
+            self.size,
+            distributed=self.distributed,
+            chunk_cache=self.chunk_cache,
+            axes=self.axes,
+            num_threads=self.num_threads,
+        )
+
+    def _schedule(self, upcoming):
+        from . import containers
+
+        if self.depth <= 0:
+            return
+
+        if self._executor is None:
+            from concurrent.futures import ThreadPoolExecutor
+
+            self._executor = ThreadPoolExecutor(max_workers=1)
+
+        upcoming = list(upcoming)[: self.depth]
+
+        # Forget about anything that's no longer coming up
+        for filename in list(self._pending):
+            if filename not in upcoming:
+                self._pending.pop(filename)[0].cancel()
+
+        used = sum(nbytes for _, nbytes in self._pending.values())
+
+        for filename in upcoming:
+            if filename in self._pending:
+                continue
+
+            nbytes = containers._local_nbytes(
+                filename, self.size, distributed=self.distributed
+            )
+            if self.memory is not None and used + nbytes > self.memory:
+                break
+
+            future = self._executor.submit(self._read, filename)
+            self._pending[filename] = (future, nbytes)
+            used += nbytes
+
+    def close(self):
+        # Drop any pending reads and stop the background thread
+        for future, _ in self._pending.values():
+            future.cancel()
+        self._pending = {}
+
+        if self._executor is not None:
+            self._executor.shutdown(wait=True)
+            self._executor = None
+
+
+class _PrefetchMixin(object):
+    """Support for reading ahead files in a background thread.
+
+    Attributes
+    ----------
+    prefetch : int, optional
+        Number of upcoming files to read ahead in the background while the
+        current one is being processed. Default is 0, i.e. no read ahead.
+    prefetch_memory : int, optional
+        Maximum number of bytes (per rank) to use for files that have been
+        read ahead. If not set there is no limit beyond `prefetch`.
+    chunk_cache_size : int, optional
+        Size in bytes of the HDF5 chunk cache to use when reading. If not
+        set, the HDF5 default is used.
+    threaded_decompression : bool, optional
+        Read bitshuffle compressed datasets with direct chunk reads, and
+        decompress them in a pool of `OMP_NUM_THREADS` threads per rank.
+        Default is False.
+    """
+
+    prefetch = config.Property(proptype=int, default=0)
+    prefetch_memory = config.Property(proptype=int, default=None)
+    chunk_cache_size = config.Property(proptype=int, default=None)
+    threaded_decompression = config.Property(proptype=bool, default=False)
+
+    _prefetcher = None
+
+    def _use_prefetcher(self):
+        return (
+            self.prefetch > 0
+            or self.chunk_cache_size is not None
+            or self.threaded_decompression
+        )
+
+    def _prefetch_load(self, file_, upcoming=(), distributed=True, axes=None):
+        # Load the given file, reading ahead the files in `upcoming`. If given,
+        # distributed datasets are read directly distributed along `axes`
+        if self._prefetcher is None:
+            self._prefetcher = _FilePrefetcher(
+                self.comm,
+                self.prefetch,
+                memory=self.prefetch_memory,
+                chunk_cache=self.chunk_cache_size,
+                distributed=distributed,
+                axes=axes,
+                num_threads=0 if self.threaded_decompression else None,
+            )
+
+        return self._prefetcher.get(file_, upcoming)
+
+    def finish(self):
+        """Stop reading ahead, in case the pipeline ended before all the files
+        were loaded.
+        """
+        self._prefetch_close()
+        return super(_PrefetchMixin, self).finish()
+
+    def _prefetch_close(self):
+        if self._prefetcher is not None:
+            self._prefetcher.close()
+            self._prefetcher = None
+
+
+def _read_map_slab(filename, start, end, out, chunk_cache=None, num_threads=None):
+    # Read the frequency slab [start, end) of the map in `filename` into `out`
+    # and return the index maps. Makes no MPI calls.
+    import h5py
+
+    from .containers import _from_h5_compatible
+    from ..util import chunkio
+
+    kwargs = {} if chunk_cache is None else {"rdcc_nbytes": int(chunk_cache)}
+
+    with h5py.File(filename, "r", **kwargs) as f:
+        index_map = {
+            name: _from_h5_compatible(f["index_map"][name][:])
+            for name in ["freq", "pol", "pixel"]
+        }
+
+        dset = f["map"]
+        if out.size == 0:
+            pass
+        elif (
+            num_threads is not None
+            and dset.chunks is not None
+            and chunkio.is_bitshuffle_lz4(dset)
+        ):
+            chunkio.read_chunks(dset, out, (start, 0, 0), num_threads)
+        else:
+            dset.read_direct(out, source_sel=np.s_[start:end])
+
+    return index_map
+
+
+class LoadMaps(_PrefetchMixin, task.MPILoggedTask):
     """Load a series of maps from files given in the tasks parameters.
 
     Maps are given as one, or a list of `File Groups` (see
     :mod:`draco.core.io`). Maps within the same group are added together
-    before being passed on.
+    before being passed on, by reading the local frequency slab of each map
+    straight into the first map of the group. Upcoming groups can be read
+    ahead in the background (see `prefetch`).
 
     Attributes
     ----------
@@ -166,61 +403,104 @@ class LoadMaps(task.MPILoggedTask):
 
         # Exit this task if we have eaten all the file groups
         if len(self.maps) == 0:
+            self._prefetch_close()
             raise pipeline.PipelineStopIteration
 
         group = self.maps.pop(0)
 
-        map_stack = None
+        first, rest = group["files"][0], group["files"][1:]
 
-        # Iterate over all the files in the group, load them into a Map
-        # container and add them all together
-        for mfile in group["files"]:
+        self.log.debug("Loading file %s", first)
 
-            self.log.debug("Loading file %s", mfile)
+        # Only the first map of each group is loaded as a container, the
+        # others are streamed into it
+        if self._use_prefetcher():
+            upcoming = [g["files"][0] for g in self.maps]
+            map_stack = self._prefetch_load(first, upcoming, axes="freq")
+        else:
+            map_stack = containers.Map.from_file(first, distributed_axis="freq")
+        map_stack.redistribute("freq")
 
-            current_map = containers.Map.from_file(mfile, distributed=True)
-            current_map.redistribute("freq")
+        if rest:
+            self._accumulate_maps(map_stack, rest)
 
-            # Start the stack if needed
-            if map_stack is None:
-                map_stack = current_map
+        # Assign a tag to the stack of maps
+        map_stack.attrs["tag"] = group["tag"]
 
-            # Otherwise, check that the new map has consistent frequencies,
-            # nside and pol and stack up.
-            else:
+        return map_stack
+
+    def _accumulate_maps(self, map_stack, files):
+        # Add the maps in each file onto the stack, reading only the local
+        # frequency slab of each directly into a buffer. The next file is read
+        # in a background thread while the current one is being added.
+        from concurrent.futures import ThreadPoolExecutor
+
+        local_map = map_stack.map[:]
+        start = local_map.local_offset[0]
+        end = start + local_map.local_shape[0]
+
+        # Two buffers so one can be filled while the other is being added
+        buffers = [np.empty_like(local_map.view(np.ndarray)) for _ in range(2)]
+
+        def _read(ii):
+            return _read_map_slab(
+                files[ii],
+                start,
+                end,
+                buffers[ii % 2],
+                self.chunk_cache_size,
+                0 if self.threaded_decompression else None,
+            )
+
+        with ThreadPoolExecutor(max_workers=1) as executor:
+
+            future = executor.submit(_read, 0)
+
+            for ii, mfile in enumerate(files):
+
+                self.log.debug("Loading file %s", mfile)
+
+                index_map = future.result()
+                if ii + 1 < len(files):
+                    future = executor.submit(_read, ii + 1)
 
-                if (current_map.freq != map_stack.freq).all():
+                # Check that the new map has consistent frequencies, nside
+                # and pol and stack up.
+                if (index_map["freq"]["centre"] != map_stack.freq).all():
                     raise RuntimeError("Maps do not have consistent frequencies.")
 
-                if (current_map.index_map["pol"] != map_stack.index_map["pol"]).all():
+                if (index_map["pol"] != map_stack.index_map["pol"]).all():
                     raise RuntimeError("Maps do not have the same polarisations.")
 
-                if (
-                    current_map.index_map["pixel"] != map_stack.index_map["pixel"]
-                ).all():
+                if (index_map["pixel"] != map_stack.index_map["pixel"]).all():
                     raise RuntimeError("Maps do not have the same pixelisation.")
 
-                map_stack.map[:] += current_map.map[:]
-
-        # Assign a tag to the stack of maps
-        map_stack.attrs["tag"] = group["tag"]
-
-        return map_stack
+                local_map += buffers[ii % 2]
 
 
-class LoadFilesFromParams(task.SingleTask):
+class LoadFilesFromParams(_PrefetchMixin, task.SingleTask):
     """Load data from files given in the tasks parameters.
 
+    Upcoming files can be read ahead in a background thread while the current
+    one is being processed by setting `prefetch`.
+
     Attributes
     ----------
     files : glob pattern, or list
         Can either be a glob pattern, or lists of actual files.
     distributed : bool, optional
         Whether the file should be loaded distributed across ranks.
+    distributed_axis : str or dict, optional
+        Name of the axis to distribute datasets over as they are read, either
+        for all datasets or as a dictionary of dataset name to axis name.
+        Each rank reads its section along that axis directly from the file,
+        avoiding a redistribute after loading. By default, datasets are
+        distributed over their first axis.
     """
 
     files = config.Property(proptype=_list_or_glob)
     distributed = config.Property(proptype=bool, default=True)
+    distributed_axis = config.Property(default=None)
 
     def process(self):
         """Load the given files in turn and pass on.
@@ -230,8 +510,6 @@ class LoadFilesFromParams(task.SingleTask):
         cont : subclass of `memh5.BasicCont`
         """
 
-        from caput import memh5
-
         # Garbage collect to workaround leaking memory from containers.
         # TODO: find actual source of leak
         import gc
@@ -239,6 +517,7 @@ class LoadFilesFromParams(task.SingleTask):
         gc.collect()
 
         if len(self.files) == 0:
+            self._prefetch_close()
             raise pipeline.PipelineStopIteration
 
         # Fetch and remove the first item in the list
@@ -246,9 +525,7 @@ class LoadFilesFromParams(task.SingleTask):
 
         self.log.info("Loading file %s" % file_)
 
-        cont = memh5.BasicCont.from_file(
-            file_, distributed=self.distributed, comm=self.comm
-        )
+        cont = self._load_file(file_)
 
         if "tag" not in cont.attrs:
             # Get the first part of the actual filename and use it as the tag
@@ -258,6 +535,22 @@ class LoadFilesFromParams(task.SingleTask):
 
         return cont
 
+    def _load_file(self, file_):
+        # Load the container from the given file
+        from caput import memh5
+
+        if self._use_prefetcher() or self.distributed_axis is not None:
+            return self._prefetch_load(
+                file_,
+                self.files,
+                distributed=self.distributed,
+                axes=self.distributed_axis,
+            )
+
+        return memh5.BasicCont.from_file(
+            file_, distributed=self.distributed, comm=self.comm
+        )
+
 
 # Define alias for old code
 LoadBasicCont = LoadFilesFromParams
@@ -304,6 +597,405 @@ class LoadFiles(LoadFilesFromParams):
         self.files = files
 
 
+class LoadCachedFiles(LoadFilesFromParams):
+    """Load data from files, preferring a fast uncompressed local cache.
+
+    Each file is cached with :meth:`containers.ContainerBase.to_cache` the
+    first time it is loaded, and subsequently reloaded by memory mapping the
+    cache, as long as the cache is newer than the source file.
+
+    Attributes
+    ----------
+    cache_dir : str
+        Directory to store the caches in.
+    update_cache : bool, optional
+        Write a cache for any file that does not have an up to date one.
+        Default is True.
+    """
+
+    cache_dir = config.Property(proptype=str)
+    update_cache = config.Property(proptype=bool, default=True)
+
+    def _load_file(self, file_):
+        # Load from the cache if it's up to date, otherwise load the file and
+        # (optionally) create the cache
+
+        from . import containers
+
+        cache = self._cache_path(file_)
+        meta = os.path.join(cache, "meta.h5")
+
+        # Only check the filesystem on rank=0 to ensure all ranks agree
+        use_cache = None
+        if self.comm is None or self.comm.rank == 0:
+            use_cache = os.path.exists(meta) and (
+                os.path.getmtime(meta) >= os.path.getmtime(file_)
+            )
+        if self.comm is not None:
+            use_cache = self.comm.bcast(use_cache, root=0)
+
+        if use_cache:
+            self.log.debug("Loading %s from cache %s", file_, cache)
+            return containers.ContainerBase.from_cache(cache, comm=self.comm)
+
+        cont = super(LoadCachedFiles, self)._load_file(file_)
+
+        if self.update_cache and isinstance(cont, containers.ContainerBase):
+            self.log.debug("Writing cache %s for %s", cache, file_)
+            cont.to_cache(cache)
+
+        return cont
+
+    def _cache_path(self, file_):
+        # Construct a cache path that is unique for each source file
+        import hashlib
+
+        file_ = os.path.abspath(file_)
+        digest = hashlib.md5(file_.encode("utf8")).hexdigest()[:8]
+        base = os.path.splitext(os.path.basename(file_))[0]
+
+        return os.path.join(self.cache_dir, "%s_%s" % (base, digest))
+
+
+class LoadFilesFromManifest(LoadFilesFromParams):
+    """Load the files in a manifest, selected on their time, LSD or frequency.
+
+    The manifest is an index of per-file metadata (see :func:`build_manifest`),
+    so the files to load can be chosen without opening any of them. The
+    selected files are loaded in order of their start time.
+
+    Attributes
+    ----------
+    manifest : str
+        Path of the manifest file.
+    directory : str, optional
+        If set, scan this directory and update the manifest before selecting
+        from it. Only new or modified files are opened.
+    pattern : str, optional
+        Glob pattern for the files in `directory`. Default is `*.h5`.
+    time_range : list, optional
+        Select files overlapping this `[start, end]` range of UNIX times.
+    lsd_range : list, optional
+        Select files overlapping this (inclusive) `[start, end]` range of
+        LSDs. Requires an observer to have been passed to :meth:`setup`, or
+        the manifest to already contain the LSDs of the files.
+    freq_range : list, optional
+        Select files with any frequencies within `[low, high]` (in MHz).
+    container : str, optional
+        Select only files holding this container type, given by class name,
+        e.g. `TimeStream`.
+    files : glob pattern, or list, optional
+        If set, only select from these files.
+    """
+
+    manifest = config.Property(proptype=str)
+    directory = config.Property(proptype=str, default=None)
+    pattern = config.Property(proptype=str, default="*.h5")
+
+    time_range = config.Property(proptype=list, default=None)
+    lsd_range = config.Property(proptype=list, default=None)
+    freq_range = config.Property(proptype=list, default=None)
+    container = config.Property(proptype=str, default=None)
+
+    def setup(self, observer=None):
+        """Update the manifest if requested, and select the files to load.
+
+        Parameters
+        ----------
+        observer : :class:`~caput.time.Observer`, optional
+            Used to calculate the LSDs of any newly indexed files. Note that
+            :class:`~drift.core.TransitTelescope` instances are also Observers.
+        """
+
+        # Extract the telescope if we were given a manager
+        if observer is not None:
+            try:
+                observer = get_telescope(observer)
+            except RuntimeError:
+                pass
+
+        if self.directory is not None:
+            manifest = build_manifest(
+                self.directory,
+                self.manifest,
+                pattern=self.pattern,
+                observer=observer,
+                comm=self.comm,
+            )
+        else:
+            manifest = load_manifest(self.manifest)
+
+        selected = select_from_manifest(
+            manifest,
+            time_range=self.time_range,
+            lsd_range=self.lsd_range,
+            freq_range=self.freq_range,
+            container=self.container,
+            observer=observer,
+        )
+
+        if self.files is not None:
+            requested = set(os.path.abspath(path) for path in self.files)
+            selected = [path for path in selected if path in requested]
+
+        self.files = selected
+
+        self.log.info(
+            "Selected %i of %i files from manifest %s",
+            len(self.files),
+            len(manifest["files"]),
+            self.manifest,
+        )
+
+
+MANIFEST_VERSION = 1
+
+
+def load_manifest(filename):
+    """Load a manifest file.
+
+    Parameters
+    ----------
+    filename : str
+        Path of the manifest.
+
+    Returns
+    -------
+    manifest : dict
+        The manifest, with the metadata of each file in `manifest["files"]`
+        keyed by absolute path. Empty if the file does not exist.
+    """
+    import json
+
+    if not os.path.exists(filename):
+        return {"version": MANIFEST_VERSION, "files": {}}
+
+    with open(filename, "r") as fh:
+        manifest = json.load(fh)
+
+    if manifest.get("version", None) != MANIFEST_VERSION:
+        return {"version": MANIFEST_VERSION, "files": {}}
+
+    return manifest
+
+
+def build_manifest(directory, filename=None, pattern="*.h5", observer=None, comm=None):
+    """Scan a directory and record the metadata of each file in a manifest.
+
+    The manifest is a JSON file holding the container class, dataset shapes,
+    axis lengths, time range, frequency range and LSD span of each file. If
+    the manifest already exists it is updated incrementally, only opening
+    files which are new, or have changed size or modification time since
+    they were last indexed. If any file can't be read a `RuntimeError` is
+    raised on all ranks.
+
+    Parameters
+    ----------
+    directory : str
+        Directory to scan.
+    filename : str, optional
+        Path of the manifest. Default is `manifest.json` in `directory`.
+    pattern : str, optional
+        Glob pattern for the files to index. Default is `*.h5`.
+    observer : :class:`~caput.time.Observer`, optional
+        If given, record the LSD span of each file with a time axis.
+    comm : MPI.Comm, optional
+        If given, the files are scanned in parallel over the ranks. Must be
+        called on all ranks.
+
+    Returns
+    -------
+    manifest : dict
+        The updated manifest (on all ranks).
+    """
+    import glob
+    import json
+
+    if filename is None:
+        filename = os.path.join(directory, "manifest.json")
+
+    rank, size = (comm.rank, comm.size) if comm is not None else (0, 1)
+
+    # Work out which files need to be (re)indexed on rank 0
+    if rank == 0:
+        manifest = load_manifest(filename)
+        old = manifest["files"]
+
+        paths = sorted(
+            os.path.abspath(path)
+            for path in glob.glob(os.path.join(directory, pattern))
+            if os.path.abspath(path) != os.path.abspath(filename)
+        )
+
+        files = {}
+        stale = []
+        for path in paths:
+            entry = old.get(path, None)
+            if entry is not None and (entry["mtime"], entry["size"]) == (
+                os.path.getmtime(path),
+                os.path.getsize(path),
+            ):
+                files[path] = entry
+            else:
+                stale.append(path)
+    else:
+        files, stale = None, None
+
+    if comm is not None:
+        stale = comm.bcast(stale, root=0)
+
+    # Index the stale files in parallel
+    entries, errors = {}, []
+    for path in stale[rank::size]:
+        try:
+            entries[path] = _file_metadata(path)
+        except Exception as e:
+            errors.append("%s (%s)" % (path, repr(e)))
+
+    # Make sure every rank raises if any file couldn't be indexed
+    if comm is not None:
+        errors = sum(comm.allgather(errors), [])
+    if errors:
+        raise RuntimeError("Could not index files: %s" % ", ".join(errors))
+
+    if comm is not None:
+        parts = comm.gather(entries, root=0)
+        if rank == 0:
+            for part in parts:
+                entries.update(part)
+
+    if rank == 0:
+        files.update(entries)
+
+        if observer is not None:
+            for entry in files.values():
+                if "time" in entry and "lsd" not in entry:
+                    entry["lsd"] = [
+                        int(observer.unix_to_lsd(entry["time"][0])),
+                        int(observer.unix_to_lsd(entry["time"][1])),
+                    ]
+
+        manifest = {"version": MANIFEST_VERSION, "files": files}
+
+        # Write atomically so a partial manifest is never read
+        tmpfile = filename + ".tmp"
+        with open(tmpfile, "w") as fh:
+            json.dump(manifest, fh, indent=1, sort_keys=True)
+        os.rename(tmpfile, filename)
+    else:
+        manifest = None
+
+    if comm is not None:
+        manifest = comm.bcast(manifest, root=0)
+
+    return manifest
+
+
+def select_from_manifest(
+    manifest,
+    time_range=None,
+    lsd_range=None,
+    freq_range=None,
+    container=None,
+    observer=None,
+):
+    """Select files from a manifest by their metadata.
+
+    Parameters
+    ----------
+    manifest : dict
+        A manifest as returned by :func:`load_manifest`.
+    time_range : list, optional
+        Select files overlapping this `[start, end]` range of UNIX times.
+    lsd_range : list, optional
+        Select files overlapping this (inclusive) `[start, end]` range of LSDs.
+    freq_range : list, optional
+        Select files with any frequencies within `[low, high]`.
+    container : str, optional
+        Select only files holding this container type (by class name).
+    observer : :class:`~caput.time.Observer`, optional
+        Used to calculate LSDs for files that don't have them recorded.
+
+    Returns
+    -------
+    files : list
+        The selected files, sorted by start time.
+    """
+
+    def _overlaps(span, rng):
+        return span is not None and span[0] <= rng[1] and span[1] >= rng[0]
+
+    selected = []
+
+    for path, entry in manifest["files"].items():
+
+        if container is not None:
+            clspath = entry.get("class", None) or ""
+            if clspath.split(".")[-1] != container:
+                continue
+
+        if time_range is not None and not _overlaps(entry.get("time"), time_range):
+            continue
+
+        if freq_range is not None and not _overlaps(entry.get("freq"), freq_range):
+            continue
+
+        if lsd_range is not None:
+            lsd = entry.get("lsd", None)
+            if lsd is None and observer is not None and "time" in entry:
+                lsd = [int(observer.unix_to_lsd(t)) for t in entry["time"]]
+            if not _overlaps(lsd, lsd_range):
+                continue
+
+        selected.append(path)
+
+    return sorted(
+        selected, key=lambda path: (manifest["files"][path].get("time", [0])[0], path)
+    )
+
+
+def _file_metadata(path):
+    # Read the metadata for a file to go into a manifest
+    import h5py
+
+    entry = {"mtime": os.path.getmtime(path), "size": os.path.getsize(path)}
+
+    with h5py.File(path, "r") as f:
+
+        clspath = f.attrs.get("__memh5_subclass", None)
+        if isinstance(clspath, bytes):
+            clspath = clspath.decode("utf8")
+        entry["class"] = clspath
+
+        if "lsd" in f.attrs:
+            lsd = np.atleast_1d(f.attrs["lsd"])
+            entry["lsd"] = [int(lsd.min()), int(lsd.max())]
+
+        entry["datasets"] = {
+            name: list(item.shape)
+            for name, item in f.items()
+            if isinstance(item, h5py.Dataset)
+        }
+
+        if "index_map" not in f:
+            return entry
+
+        index_map = f["index_map"]
+        entry["axes"] = {name: len(index_map[name]) for name in index_map}
+
+        if "time" in index_map and len(index_map["time"]):
+            time = index_map["time"][:]
+            time = time["ctime"] if time.dtype.names else time
+            entry["time"] = [float(time.min()), float(time.max())]
+
+        if "freq" in index_map and len(index_map["freq"]):
+            freq = index_map["freq"][:]
+            freq = freq["centre"] if freq.dtype.names else freq
+            entry["freq"] = [float(freq.min()), float(freq.max())]
+
+    return entry
+
+
 class Save(pipeline.TaskBase):
     """Save out the input, and pass it on.
 
@@ -314,9 +1006,22 @@ class Save(pipeline.TaskBase):
     ----------
     root : str
         Root of the file name to output to.
+    collective : bool, optional
+        Write distributed containers with collective MPI-IO (see
+        :meth:`containers.ContainerBase.to_hdf5_collective`). Default is False.
+    threaded_compression : bool, optional
+        Compress bitshuffle compressed datasets in a pool of threads (see
+        :meth:`containers.ContainerBase.to_hdf5_threaded`). Default is False.
+    truncate : bool, optional
+        Truncate the precision of the datasets using the presets in
+        `TRUNC_SPEC` as they are written (see :class:`Truncate`). The data
+        passed on keeps its full precision. Default is False.
     """
 
     root = config.Property(proptype=str)
+    collective = config.Property(proptype=bool, default=False)
+    threaded_compression = config.Property(proptype=bool, default=False)
+    truncate = config.Property(proptype=bool, default=False)
 
     count = 0
 
@@ -339,7 +1044,16 @@ class Save(pipeline.TaskBase):
 
         fname = "%s_%s.h5" % (self.root, str(tag))
 
-        data.to_hdf5(fname)
+        transforms = _truncation_transforms(data) if self.truncate else None
+
+        if transforms is not None:
+            data.to_hdf5_threaded(fname, transforms=transforms)
+        elif self.collective and hasattr(data, "to_hdf5_collective"):
+            data.to_hdf5_collective(fname)
+        elif self.threaded_compression and hasattr(data, "to_hdf5_threaded"):
+            data.to_hdf5_threaded(fname)
+        else:
+            data.to_hdf5(fname)
 
         return data
 
@@ -362,9 +1076,13 @@ class LoadBeamTransfer(pipeline.TaskBase):
     ----------
     product_directory : str
         Path to the saved Beam Transfer products.
+    cache_size : int, optional
+        If set, cache the beam transfer matrices as they are read in a process
+        wide cache with this budget in bytes (see :func:`cache_beamtransfer`).
     """
 
     product_directory = config.Property(proptype=str)
+    cache_size = config.Property(proptype=int, default=None)
 
     def setup(self):
         """Load the beam transfer matrices.
@@ -388,6 +1106,9 @@ class LoadBeamTransfer(pipeline.TaskBase):
 
         bt = beamtransfer.BeamTransfer(self.product_directory)
 
+        if self.cache_size is not None:
+            bt = cache_beamtransfer(bt, self.cache_size)
+
         tel = bt.telescope
 
         try:
@@ -404,9 +1125,13 @@ class LoadProductManager(pipeline.TaskBase):
     product_directory : str
         Path to the root of the products. This is the same as the output
         directory used by ``drift-makeproducts``.
+    cache_size : int, optional
+        If set, cache the beam transfer matrices as they are read in a process
+        wide cache with this budget in bytes (see :func:`cache_beamtransfer`).
     """
 
     product_directory = config.Property(proptype=str)
+    cache_size = config.Property(proptype=int, default=None)
 
     def setup(self):
         """Load the beam transfer matrices.
@@ -427,9 +1152,63 @@ class LoadProductManager(pipeline.TaskBase):
         # Load ProductManager and Timestream
         pm = manager.ProductManager.from_config(self.product_directory)
 
+        if self.cache_size is not None:
+            pm.beamtransfer = cache_beamtransfer(pm.beamtransfer, self.cache_size)
+
         return pm
 
 
+class LoadTelescopeSnapshot(pipeline.TaskBase):
+    """Load a lightweight snapshot of the telescope metadata.
+
+    The snapshot has the attributes of the telescope needed by most analysis
+    tasks (baselines, feed maps, frequencies, position, ...) and can be used
+    in place of a full `ProductManager` or `BeamTransfer` for them, but is
+    much faster to load. See :mod:`draco.core.telescope`.
+
+    Attributes
+    ----------
+    snapshot_directory : str
+        Path to the snapshot.
+    product_directory : str, optional
+        Path to the driftscan products. If the snapshot doesn't exist it is
+        made from the telescope in these products.
+    """
+
+    snapshot_directory = config.Property(proptype=str)
+    product_directory = config.Property(proptype=str, default=None)
+
+    def setup(self):
+        """Load the snapshot, making it first if needed.
+
+        Returns
+        -------
+        tel : TelescopeSnapshot
+            Object describing the telescope.
+        """
+
+        from caput import mpiutil
+
+        from . import telescope
+
+        if not telescope.is_snapshot(self.snapshot_directory):
+
+            if self.product_directory is None:
+                raise RuntimeError(
+                    "Telescope snapshot %s does not exist." % self.snapshot_directory
+                )
+
+            if mpiutil.rank0:
+                from drift.core import manager
+
+                pm = manager.ProductManager.from_config(self.product_directory)
+                telescope.save_snapshot(pm.telescope, self.snapshot_directory)
+
+            mpiutil.barrier()
+
+        return telescope.load_snapshot(self.snapshot_directory)
+
+
 class Truncate(task.SingleTask):
     """Precision truncate data prior to saving with bitshuffle compression.
 
@@ -455,6 +1234,8 @@ class Truncate(task.SingleTask):
         Maximum fractional increase in variance from numerical truncation.
     """
 
+    modifies_input = True
+
     dataset = config.Property(proptype=list, default=None)
     weight_dataset = config.Property(proptype=list, default=None)
     fixed_precision = config.Property(proptype=float, default=None)
@@ -462,7 +1243,8 @@ class Truncate(task.SingleTask):
 
     def _get_params(self, container):
         """Load truncation parameters from config or container defaults."""
-        if container in TRUNC_SPEC:
+        spec = _trunc_spec(container)
+        if spec is not None:
             self.log.info("Truncating from preset for container {}".format(container))
             for key in [
                 "dataset",
@@ -472,7 +1254,7 @@ class Truncate(task.SingleTask):
             ]:
                 attr = getattr(self, key)
                 if attr is None:
-                    setattr(self, key, TRUNC_SPEC[container][key])
+                    setattr(self, key, spec[key])
                 else:
                     self.log.info("Overriding container default for '{}'.".format(key))
         else:
@@ -512,51 +1294,87 @@ class Truncate(task.SingleTask):
             self.weight_dataset = [None] * len(self.dataset)
 
         for dset, wgt in zip(self.dataset, self.weight_dataset):
-            old_shape = data[dset].local_shape
-            val = np.ndarray.reshape(data[dset][:], data[dset][:].size)
-            if wgt is None:
-                if np.iscomplexobj(data[dset]):
-                    data[dset][:].real = bit_truncate_fixed(
-                        val.real, self.fixed_precision
-                    ).reshape(old_shape)
-                    data[dset][:].imag = bit_truncate_fixed(
-                        val.imag, self.fixed_precision
-                    ).reshape(old_shape)
-                else:
-                    data[dset][:] = bit_truncate_fixed(
-                        val, self.fixed_precision
-                    ).reshape(old_shape)
-            else:
-                if data[dset][:].shape != data[wgt][:].shape:
-                    raise pipeline.PipelineRuntimeError(
-                        "Dataset and weight arrays must have same shape ({} != {})".format(
-                            data[dset].shape, data[wgt].shape
-                        )
-                    )
-                invvar = np.ndarray.reshape(data[wgt][:], data[dset][:].size)
-                if np.iscomplexobj(data[dset]):
-                    data[dset][:].real = bit_truncate_weights(
-                        val.real,
-                        invvar * 2.0 / self.variance_increase,
-                        self.fixed_precision,
-                    ).reshape(old_shape)
-                    data[dset][:].imag = bit_truncate_weights(
-                        val.imag,
-                        invvar * 2.0 / self.variance_increase,
-                        self.fixed_precision,
-                    ).reshape(old_shape)
-                else:
-                    data[dset][:] = bit_truncate_weights(
-                        val, invvar / self.variance_increase, self.fixed_precision
-                    ).reshape(old_shape)
+            if wgt is not None:
+                self._check_shapes(data, dset, wgt)
+
+            _truncate_array(
+                data[dset][:],
+                data[wgt][:] if wgt is not None else None,
+                self.fixed_precision,
+                self.variance_increase,
+            )
 
         return data
 
+    @staticmethod
+    def _check_shapes(data, dset, wgt):
+        # Check the dataset and weights have the same shape
+        if data[dset][:].shape != data[wgt][:].shape:
+            raise pipeline.PipelineRuntimeError(
+                "Dataset and weight arrays must have same shape ({} != {})".format(
+                    data[dset].shape, data[wgt].shape
+                )
+            )
+
+
+def _truncate_array(val, wgt, fixed_precision, variance_increase):
+    # Truncate an array in place, relative to the inverse variance weights if
+    # given, otherwise to a fixed precision. The `variance_increase` should
+    # already include the factor of 3 for uniformly distributed errors.
+
+    if wgt is None:
+        truncate_fixed(val, fixed_precision)
+    else:
+        # The variance increase is split between the real and imaginary parts
+        scale = (2.0 if np.iscomplexobj(val) else 1.0) / variance_increase
+        truncate_weights(val, wgt, fixed_precision, scale=scale)
+
+
+def _trunc_spec(cls):
+    # Get the truncation presets for a container type, from the closest of its
+    # base classes in `TRUNC_SPEC`. Returns None if there are none.
+    for base in cls.__mro__:
+        if base in TRUNC_SPEC:
+            return TRUNC_SPEC[base]
+    return None
+
+
+def _truncation_transforms(cont):
+    # Get functions that truncate the datasets of `cont` according to the
+    # presets in `TRUNC_SPEC`, for passing to `ContainerBase.to_hdf5_threaded`.
+    # Returns None if there are no presets for the container.
+    spec = _trunc_spec(type(cont))
+    if spec is None:
+        return None
+
+    # Factor of 3 for variance over uniform distribution of truncation errors
+    variance_increase = 3 * spec["variance_increase"]
+    fixed_precision = spec["fixed_precision"]
+
+    def _make_func(wname):
+        wgt = cont[wname][:].view(np.ndarray) if wname is not None else None
+
+        def _func(part, sel):
+            w = wgt[sel] if wgt is not None else None
+            _truncate_array(part, w, fixed_precision, variance_increase)
+
+        return _func
+
+    return {
+        name: _make_func(wname)
+        for name, wname in zip(spec["dataset"], spec["weight_dataset"])
+    }
+
 
 def get_telescope(obj):
     """Return a telescope object out of the input (either `ProductManager`,
-    `BeamTransfer` or `TransitTelescope`).
+    `BeamTransfer`, `TransitTelescope` or `TelescopeSnapshot`).
     """
+    from .telescope import TelescopeSnapshot
+
+    if isinstance(obj, TelescopeSnapshot):
+        return obj
+
     from drift.core import telescope
 
     try:
@@ -581,3 +1399,281 @@ def get_beamtransfer(obj):
         return obj.beamtransfer
 
     raise RuntimeError("Could not get BeamTransfer instance out of %s" % repr(obj))
+
+
+# The BeamTransfer methods that read matrices from disk for a given m (and
+# optionally frequency)
+_BT_CACHED_METHODS = ["beam_m", "beam_svd", "beam_ut", "invbeam_svd"]
+
+
+def cache_beamtransfer(bt, cache_size=None, copy=True):
+    """Cache the matrices read by a BeamTransfer in the process wide cache.
+
+    The methods which read the beam transfer matrices (`beam_m`, `beam_svd`,
+    `beam_ut` and `invbeam_svd`) are replaced by versions which go through
+    :func:`draco.util.cache.global_cache`, keyed by the product directory,
+    method, `m` and frequency index, on a shallow copy of `bt` (see
+    :func:`cache_methods`). A request for a single frequency is served from
+    the cached matrices for all frequencies if they are present. The internal
+    projection routines of the copy use the cache too, and as the keys only
+    depend on the product directory, so does any other copy of the same
+    products.
+
+    Parameters
+    ----------
+    bt : BeamTransfer
+        The beam transfer manager to cache.
+    cache_size : int, optional
+        Set the budget of the process wide cache to this many bytes.
+    copy : bool, optional
+        Return writeable copies of the cached matrices, so callers can modify
+        them as with the uncached methods. If False, the cached arrays are
+        returned directly and are read only. Default is True.
+
+    Returns
+    -------
+    bt : BeamTransfer
+        A copy of `bt` using the cache.
+    """
+    return cache_methods(
+        bt,
+        _BT_CACHED_METHODS,
+        tag=os.path.abspath(bt.directory),
+        cache_size=cache_size,
+        freq_arg="fi",
+        copy=copy,
+    )
+
+
+def cache_methods(obj, names, tag=None, cache_size=None, freq_arg=None, copy=True):
+    """Cache the values returned by methods of an object taking `m` first.
+
+    The object is wrapped in a shallow copy, on which each method is replaced
+    by a version which goes through :func:`draco.util.cache.global_cache`,
+    keyed by `tag`, the method name, `m` and the remaining arguments. The
+    object itself, which may be shared with other tasks, is left untouched.
+    Other methods of the copy calling the cached ones use the cache too. The
+    replacements can also be used with :func:`prefetch_m` to load the values
+    for the next `m` in the background.
+
+    Parameters
+    ----------
+    obj : object
+        The object whose methods to cache, e.g. a `BeamTransfer` or
+        `KLTransform`.
+    names : list of str
+        Names of the methods to cache. Missing methods are skipped.
+    tag : hashable, optional
+        Identifies the object in the cache keys. Objects reading the same
+        files should use the same tag. By default the object's identity is
+        used.
+    cache_size : int, optional
+        Set the budget of the process wide cache to this many bytes.
+    freq_arg : str, optional
+        Name of an argument selecting a single frequency from the full value.
+        If given, such requests are served from the cached value for all
+        frequencies when it is present.
+    copy : bool, optional
+        Return writeable copies of the cached values. If False, the cached
+        arrays are returned directly and are read only. Default is True.
+
+    Returns
+    -------
+    obj : object
+        A shallow copy of the object, with the methods cached.
+    """
+    import copy as copy_
+
+    from ..util.cache import global_cache
+
+    cache = global_cache(cache_size)
+
+    if tag is None:
+        tag = "%s@%x" % (obj.__class__.__name__, id(obj))
+
+    obj = copy_.copy(obj)
+
+    for name in names:
+        method = getattr(obj, name, None)
+        if method is not None and not isinstance(method, _CachedMethod):
+            setattr(
+                obj, name, _CachedMethod(method, (tag, name), cache, freq_arg, copy)
+            )
+
+    obj._draco_cache = cache
+
+    return obj
+
+
+class _CachedMethod(object):
+    # Wraps a method taking `m` as its first argument to go through the cache.
+    # Values loaded by `prefetch` are held on to, regardless of the cache
+    # budget, until `release` is called for that `m`. The cache holds read only
+    # arrays, so unless `copy` is False the values are copied on the way out.
+
+    def __init__(self, method, tag, cache, freq_arg=None, copy=True):
+        self.method = method
+        self.tag = tag
+        self.cache = cache
+        self.freq_arg = freq_arg
+        self.copy = copy
+        self.prefetched = {}
+        self.__doc__ = method.__doc__
+
+    def _key(self, mi, args, kwargs):
+        import inspect
+
+        # Normalise the arguments so that equivalent calls share a key
+        try:
+            callargs = inspect.getcallargs(self.method, mi, *args, **kwargs)
+        except TypeError:
+            callargs = dict((("_%i" % i, a) for i, a in enumerate(args)), **kwargs)
+        callargs.pop("self", None)
+        callargs = sorted(
+            (k, tuple(sorted(v.items())) if isinstance(v, dict) else v)
+            for k, v in callargs.items()
+        )
+        return self.tag + (mi, tuple(callargs))
+
+    def _lookup(self, key):
+        value = self.prefetched.get(key, None)
+        return self.cache.lookup(key) if value is None else value
+
+    def __call__(self, mi, *args, **kwargs):
+        key = self._key(mi, args, kwargs)
+
+        value = self._lookup(key)
+
+        # Try to get a single frequency out of the value for all frequencies
+        if value is None and self.freq_arg is not None:
+            fi = dict(key[-1]).get(self.freq_arg, None)
+            if fi is not None:
+                full = self._lookup(self._key(mi, (), {self.freq_arg: None}))
+                if full is not None:
+                    value = full[fi]
+
+        if value is None:
+            value = self.cache.get_or_load(
+                key, lambda: self.method(mi, *args, **kwargs)
+            )
+
+        return _copy_value(value) if self.copy else value
+
+    def prefetch(self, mi, *args, **kwargs):
+        # Load the value for `mi` and hold on to it until released
+        key = self._key(mi, args, kwargs)
+        self.prefetched[key] = self.cache.get_or_load(
+            key, lambda: self.method(mi, *args, **kwargs)
+        )
+
+    def release(self, mi):
+        # Drop the prefetched values for `mi`
+        for key in list(self.prefetched):
+            if key[len(self.tag)] == mi:
+                self.prefetched.pop(key, None)
+
+    def nbytes(self, mi):
+        # Size of the prefetched values for `mi`
+        from ..util.cache import _nbytes
+
+        return sum(
+            _nbytes(value)
+            for key, value in list(self.prefetched.items())
+            if key[len(self.tag)] == mi
+        )
+
+
+def _copy_value(value):
+    # Copy the arrays in a cached value
+    if isinstance(value, np.ndarray):
+        return value.copy()
+    if isinstance(value, (tuple, list)):
+        return type(value)(_copy_value(v) for v in value)
+    return value
+
+
+def prefetch_m(items, *methods, **kwargs):
+    """Iterate over m's, loading the values needed for the next m in the background.
+
+    While the caller is processing one `m`, the values for the next one are
+    loaded on a background thread, so reading matrices from disk overlaps with
+    the computation. The values for each `m` are released once the caller
+    moves on to the next. Reading ahead means holding the values for two m's
+    at once, so it is only done while that fits within `max_bytes`, judged by
+    the size of the values for the last m loaded.
+
+    Parameters
+    ----------
+    items : iterable
+        The m's to iterate over. Each item is either an `m` or a tuple whose
+        last element is `m`, e.g. the `(local index, m)` pairs yielded by
+        `MPIArray.enumerate`.
+    *methods
+        Methods to prefetch, as cached by :func:`cache_methods` or
+        :func:`cache_beamtransfer`. Each is either the method itself, or a
+        `(method, kwargs)` pair giving extra keyword arguments to call it with.
+        Other methods are ignored.
+    max_bytes : int, optional
+        Memory limit for the values of the current and next m. By default, the
+        budget of the cache used by the methods.
+
+    Yields
+    ------
+    item
+        The items from `items`, in order.
+    """
+    from concurrent.futures import ThreadPoolExecutor
+
+    max_bytes = kwargs.pop("max_bytes", None)
+    if kwargs:
+        raise TypeError("Unexpected arguments %s" % ", ".join(kwargs))
+
+    items = list(items)
+    ms = [item[-1] if isinstance(item, tuple) else item for item in items]
+
+    methods = [m if isinstance(m, tuple) else (m, {}) for m in methods]
+    methods = [(m, kw) for m, kw in methods if isinstance(m, _CachedMethod)]
+
+    def _load(mi):
+        for method, kwargs in methods:
+            method.prefetch(mi, **kwargs)
+
+    def _release(mi):
+        for method, _ in methods:
+            method.release(mi)
+
+    if not methods or not items:
+        for item in items:
+            yield item
+        return
+
+    if max_bytes is None:
+        max_bytes = min(method.cache.max_bytes for method, _ in methods)
+
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        future = executor.submit(_load, ms[0])
+        nbytes = 0
+
+        try:
+            for i, item in enumerate(items):
+                if future is not None:
+                    future.result()
+                    future = None
+                    nbytes = sum(method.nbytes(ms[i]) for method, _ in methods)
+
+                # Read ahead if the values for this m and the next should fit
+                if i + 1 < len(items) and 2 * nbytes <= max_bytes:
+                    future = executor.submit(_load, ms[i + 1])
+
+                yield item
+
+                _release(ms[i])
+        finally:
+            # Wait for any outstanding load before releasing everything
+            if future is not None:
+                try:
+                    future.result()
+                except Exception:
+                    pass
+            for mi in ms:
+                _release(mi)
@@ -34,6 +34,8 @@ class ApplyGain(task.SingleTask):
         Not supported (ignored) for Sidereal Streams.
     """
 
+    modifies_input = True
+
     inverse = config.Property(proptype=bool, default=True)
     update_weight = config.Property(proptype=bool, default=False)
     smoothing_length = config.Property(proptype=float, default=None)
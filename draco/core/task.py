@@ -26,6 +26,8 @@ import numpy as np
 
 from caput import pipeline, config, memh5
 
+from .containers import ContainerBase
+
 
 class MPILogFilter(logging.Filter):
     """Filter log entries by MPI rank.
@@ -244,6 +246,13 @@ class SingleTask(MPILoggedTask, pipeline.BasicContMixin):
     "None" then the output will be written (using :meth:`write_output`) to the
     file ``self.output_root + self.output_filename``.
 
+    Tasks which modify their input containers in place must set the class
+    attribute `modifies_input` to True. Any of their inputs shared
+    copy-on-write with other containers (see
+    :meth:`~draco.core.containers.ContainerBase.cow_copy`) are then unshared
+    before :meth:`process` is called. Otherwise shared inputs are read-only,
+    and writing to them raises an error.
+
     Attributes
     ----------
     save : bool
@@ -257,6 +266,18 @@ class SingleTask(MPILoggedTask, pipeline.BasicContMixin):
         If NaN's are found, dump the container to disk.
     nan_skip : bool
         If NaN's are found, don't pass on the output.
+    collective_write : bool
+        Write distributed containers with collective MPI-IO, each rank
+        writing its own section in parallel. Requires h5py built with MPI,
+        otherwise the default serial path is used.
+    threaded_compression : bool
+        Compress bitshuffle compressed datasets in a pool of threads (with
+        `OMP_NUM_THREADS` threads per rank), writing them with direct chunk
+        writes. Ignored if `collective_write` is set.
+    truncate_on_write : bool
+        Truncate the precision of the output as it is written, using the
+        presets in :data:`draco.core.io.TRUNC_SPEC` (if there are any for the
+        output type). The output passed on keeps its full precision.
 
     Methods
     -------
@@ -277,11 +298,17 @@ class SingleTask(MPILoggedTask, pipeline.BasicContMixin):
     nan_skip = config.Property(default=True, proptype=bool)
     nan_dump = config.Property(default=True, proptype=bool)
 
+    collective_write = config.Property(default=False, proptype=bool)
+    threaded_compression = config.Property(default=False, proptype=bool)
+    truncate_on_write = config.Property(default=False, proptype=bool)
+
     _count = 0
 
     done = False
     _no_input = False
 
+    modifies_input = False
+
     def __init__(self):
         """Checks inputs and outputs and stuff."""
 
@@ -319,6 +346,13 @@ class SingleTask(MPILoggedTask, pipeline.BasicContMixin):
         except AttributeError:
             self.done = True
 
+        # Take private copies of any inputs shared copy-on-write with other
+        # containers if we are going to modify them in place
+        if self.modifies_input:
+            for inp in input:
+                if isinstance(inp, ContainerBase):
+                    inp.ensure_writeable()
+
         # Process input and fetch ouput
         if self._no_input:
             if len(input) > 0:
@@ -372,6 +406,44 @@ class SingleTask(MPILoggedTask, pipeline.BasicContMixin):
             self.log.info("No finish for task %s" % self.__class__.__name__)
             pass
 
+    def write_output(self, filename, output, truncate=True):
+        """Write the output to disk.
+
+        Uses :meth:`ContainerBase.to_hdf5_threaded` if `truncate_on_write`
+        or `threaded_compression` are set, or
+        :meth:`ContainerBase.to_hdf5_collective` if `collective_write` is.
+
+        Parameters
+        ----------
+        filename : str
+            File to write to.
+        output : memh5.BasicCont
+            The container to write.
+        truncate : bool, optional
+            Apply `truncate_on_write`. Set to False to always write at full
+            precision, as for NaN dumps.
+        """
+        from .io import _truncation_transforms
+
+        transforms = None
+        if truncate and self.truncate_on_write:
+            if isinstance(output, ContainerBase):
+                transforms = _truncation_transforms(output)
+            if transforms is None:
+                self.log.warning(
+                    "No truncation presets for %s, writing at full precision.",
+                    output.__class__.__name__,
+                )
+
+        if transforms is not None:
+            output.to_hdf5_threaded(filename, transforms=transforms)
+        elif self.collective_write and isinstance(output, ContainerBase):
+            output.to_hdf5_collective(filename)
+        elif self.threaded_compression and isinstance(output, ContainerBase):
+            output.to_hdf5_threaded(filename)
+        else:
+            super(SingleTask, self).write_output(filename, output)
+
     def _save_output(self, output):
         # Routine to write output if needed.
 
@@ -403,7 +475,11 @@ class SingleTask(MPILoggedTask, pipeline.BasicContMixin):
                 tag = output.attrs["tag"] if "tag" in output.attrs else self._count
                 outfile = "nandump_" + self.__class__.__name__ + "_" + str(tag) + ".h5"
                 self.log.debug("NaN found. Dumping %s", outfile)
-                self.write_output(outfile, output)
+
+                # Dump a read-only clone at full precision, so nothing in the
+                # write path can modify the output (or any container sharing
+                # its buffers)
+                self.write_output(outfile, _cow_copy(output), truncate=False)
 
             if nan_found and self.nan_skip:
                 self.log.debug("NaN found. Skipping output.")
@@ -470,19 +546,21 @@ class ReturnLastInputOnFinish(SingleTask):
     """Workaround for `caput.pipeline` issues.
 
     This caches its input on every call to `process` and then returns
-    the last one for a finish call.
+    the last one for a finish call. Containers are cached as a copy-on-write
+    clone, so they are unaffected by tasks later modifying the input in place
+    (see `SingleTask.modifies_input`).
     """
 
     x = None
 
     def process(self, x):
-        """Take a reference to the input.
+        """Take a copy-on-write clone of (or a reference to) the input.
 
         Parameters
         ----------
         x : object
         """
-        self.x = x
+        self.x = _cow_copy(x)
 
     def process_finish(self):
         """Return the last input to process.
@@ -499,20 +577,22 @@ class ReturnFirstInputOnFinish(SingleTask):
     """Workaround for `caput.pipeline` issues.
 
     This caches its input on the first call to `process` and
-    then returns it for a finish call.
+    then returns it for a finish call. Containers are cached as a
+    copy-on-write clone, so they are unaffected by tasks later modifying the
+    input in place (see `SingleTask.modifies_input`).
     """
 
     x = None
 
     def process(self, x):
-        """Take a reference to the input.
+        """Take a copy-on-write clone of (or a reference to) the input.
 
         Parameters
         ----------
         x : object
         """
         if self.x is None:
-            self.x = x
+            self.x = _cow_copy(x)
 
     def process_finish(self):
         """Return the last input to process.
@@ -543,3 +623,9 @@ class Delete(SingleTask):
         gc.collect()
 
         return None
+
+
+def _cow_copy(x):
+    # Return a copy-on-write clone of a container, or the object itself if it
+    # doesn't support it
+    return x.cow_copy() if isinstance(x, ContainerBase) else x
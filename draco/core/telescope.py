@@ -0,0 +1,220 @@
+"""A lightweight snapshot of the telescope metadata.
+
+Many tasks only need a few arrays describing the telescope (the baselines,
+the feed maps, the frequencies, ...) and its position, but getting them from
+driftscan means loading a whole `BeamTransfer` or `ProductManager`. A
+snapshot saves these once into a directory of `.npy` files plus a small JSON
+file, and loads them back as memory maps on first access.
+
+A :class:`TelescopeSnapshot` is an :class:`~caput.time.Observer` with the same
+attributes as the driftscan telescope it was made from, so it can be passed to
+any task which only uses those.
+
+Routines
+========
+
+.. autosummary::
+    :toctree:
+
+    TelescopeSnapshot
+    save_snapshot
+    load_snapshot
+    is_snapshot
+"""
+# === Start Python 2/3 compatibility
+from __future__ import absolute_import, division, print_function, unicode_literals
+from future.builtins import *  # noqa  pylint: disable=W0401, W0614
+from future.builtins.disabled import *  # noqa  pylint: disable=W0401, W0614
+
+# === End Python 2/3 compatibility
+
+import json
+import os
+
+import numpy as np
+
+from caput.time import Observer
+
+
+SNAPSHOT_VERSION = 1
+
+# Name of the file describing the snapshot. It is written last, so its
+# presence marks a complete snapshot.
+SNAPSHOT_FILE = "telescope.json"
+
+# The attributes below are those used by the tasks which accept a snapshot.
+# `test_telescope_snapshot.py` checks every telescope attribute used within
+# draco is listed, so add any new ones here.
+
+# Position of the telescope, passed to the `Observer`
+SNAPSHOT_POSITION = ["longitude", "latitude", "altitude", "lsd_start_day"]
+
+# Array attributes of the telescope saved into the snapshot
+SNAPSHOT_ARRAYS = [
+    "baselines",
+    "beamclass",
+    "feedconj",
+    "feedmap",
+    "feedmask",
+    "frequencies",
+    "input_index",
+    "redundancy",
+    "uniquepairs",
+]
+
+# Scalar attributes of the telescope saved into the snapshot
+SNAPSHOT_SCALARS = [
+    "lmax",
+    "mmax",
+    "nfeed",
+    "nfreq",
+    "npairs",
+    "num_pol_sky",
+    "stack_type",
+]
+
+
+class TelescopeSnapshot(Observer):
+    """The telescope metadata loaded from a snapshot.
+
+    The arrays are memory mapped from the snapshot directory the first time
+    they are accessed, and are read only. Attributes which weren't available
+    on the telescope the snapshot was made from raise an `AttributeError`.
+
+    Parameters
+    ----------
+    directory : str
+        The snapshot directory.
+
+    Attributes
+    ----------
+    directory : str
+        The snapshot directory.
+    telescope_class : str
+        Name of the class of the telescope the snapshot was made from.
+    """
+
+    def __init__(self, directory):
+
+        self.directory = directory
+
+        with open(os.path.join(directory, SNAPSHOT_FILE), "r") as fh:
+            meta = json.load(fh)
+
+        if meta.get("version", None) != SNAPSHOT_VERSION:
+            raise ValueError(
+                "Unsupported telescope snapshot version %s in %s"
+                % (meta.get("version", None), directory)
+            )
+
+        super(TelescopeSnapshot, self).__init__(
+            lon=meta["longitude"],
+            lat=meta["latitude"],
+            alt=meta["altitude"],
+            lsd_start=meta["lsd_start_day"],
+        )
+
+        self.telescope_class = meta["class"]
+
+        for name, value in meta["scalars"].items():
+            setattr(self, name, value)
+
+        self._array_names = set(meta["arrays"])
+
+    def __getattr__(self, name):
+        # Only called if the attribute isn't already set, so the arrays are
+        # only mapped once
+        if name.startswith("_") or name not in self._array_names:
+            raise AttributeError(
+                "Telescope snapshot %s has no attribute %s" % (self.directory, name)
+            )
+
+        arr = np.load(os.path.join(self.directory, name + ".npy"), mmap_mode="r")
+        setattr(self, name, arr)
+
+        return arr
+
+    def __repr__(self):
+        return "TelescopeSnapshot(%r)" % self.directory
+
+
+def save_snapshot(telescope, directory):
+    """Save a snapshot of the metadata of a telescope.
+
+    Attributes the telescope doesn't have are skipped.
+
+    Parameters
+    ----------
+    telescope : TransitTelescope
+        The telescope to save.
+    directory : str
+        Directory to save the snapshot into. Created if needed.
+    """
+
+    if not os.path.exists(directory):
+        os.makedirs(directory)
+
+    arrays = []
+    for name in SNAPSHOT_ARRAYS:
+        try:
+            arr = np.asarray(getattr(telescope, name))
+        except AttributeError:
+            continue
+
+        np.save(os.path.join(directory, name + ".npy"), arr)
+        arrays.append(name)
+
+    scalars = {}
+    for name in SNAPSHOT_SCALARS:
+        try:
+            value = getattr(telescope, name)
+        except AttributeError:
+            continue
+
+        # Convert numpy scalars into something JSON can hold
+        scalars[name] = value.item() if isinstance(value, np.generic) else value
+
+    meta = {
+        "version": SNAPSHOT_VERSION,
+        "class": telescope.__class__.__name__,
+        "arrays": arrays,
+        "scalars": scalars,
+    }
+    for name in SNAPSHOT_POSITION:
+        meta[name] = float(getattr(telescope, name))
+
+    # Write to a temporary file and move into place so the snapshot never
+    # appears complete before it is
+    filename = os.path.join(directory, SNAPSHOT_FILE)
+    with open(filename + ".tmp", "w") as fh:
+        json.dump(meta, fh, indent=2, sort_keys=True)
+    os.rename(filename + ".tmp", filename)
+
+
+def load_snapshot(directory):
+    """Load a telescope snapshot.
+
+    Parameters
+    ----------
+    directory : str
+        The snapshot directory.
+
+    Returns
+    -------
+    telescope : TelescopeSnapshot
+    """
+    return TelescopeSnapshot(directory)
+
+
+def is_snapshot(directory):
+    """Test if a directory contains a complete telescope snapshot.
+
+    Parameters
+    ----------
+    directory : str
+
+    Returns
+    -------
+    is_snapshot : bool
+    """
+    return os.path.exists(os.path.join(directory, SNAPSHOT_FILE))
@@ -32,6 +32,10 @@ from ..util import tools
 from caput.time import STELLAR_S
 
 
+# Size in bytes of the block of matrices unpacked at once by `SampleNoise`
+_UNPACK_BLOCK_BYTES = 2 ** 26
+
+
 class ReceiverTemperature(task.SingleTask):
     """Add a basic receiver temperature term into the data.
 
@@ -47,6 +51,8 @@ class ReceiverTemperature(task.SingleTask):
         The receiver temperature in Kelvin.
     """
 
+    modifies_input = True
+
     recv_temp = config.Property(proptype=float, default=0.0)
 
     def process(self, data):
@@ -79,6 +85,8 @@ class GaussianNoise(task.SingleTask):
         The temperature of the noise to add.
     """
 
+    modifies_input = True
+
     recv_temp = config.Property(proptype=float, default=50.0)
     ndays = config.Property(proptype=float, default=733.0)
     seed = config.Property(proptype=int, default=None)
@@ -166,6 +174,8 @@ class SampleNoise(task.SingleTask):
         Set the weights to the appropriate values.
     """
 
+    modifies_input = True
+
     sample_frac = config.Property(proptype=float, default=1.0)
     seed = config.Property(proptype=int, default=None)
     set_weights = config.Property(proptype=bool, default=True)
@@ -187,7 +197,6 @@ class SampleNoise(task.SingleTask):
         """
 
         from caput.time import STELLAR_S
-        from ..util import _fast_tools
 
         data_exp.redistribute("freq")
 
@@ -197,6 +206,12 @@ class SampleNoise(task.SingleTask):
         # loop fails if not all ranks enter the loop (as there is an implied MPI
         # Barrier)
         vis_data = data_exp.vis[:]
+        vis_local = vis_data.view(np.ndarray)
+        ntime = vis_local.shape[2]
+
+        # Number of time samples to unpack at once, limiting the matrices to
+        # around `_UNPACK_BLOCK_BYTES`
+        nblock = max(1, _UNPACK_BLOCK_BYTES // (vis_local.itemsize * nfeed ** 2))
 
         # Get the time interval
         if isinstance(data_exp, containers.SiderealStream):
@@ -215,19 +230,20 @@ class SampleNoise(task.SingleTask):
                 # Calculate the number of samples
                 nsamp = int(self.sample_frac * dt * df)
 
-                # Iterate over time
-                for lti, ti in vis_data.enumerate(2):
+                # Iterate over blocks of time samples, unpacking the
+                # visibilities of the whole block into full matrices at once
+                for ts in range(0, ntime, nblock):
+                    te = min(ts + nblock, ntime)
 
-                    # Unpack visibilites into full matrix
-                    vis_utv = vis_data[lfi, :, lti].view(np.ndarray).copy()
-                    vis_mat = np.zeros((nfeed, nfeed), dtype=vis_utv.dtype)
-                    _fast_tools._unpack_product_array_fast(
-                        vis_utv, vis_mat, np.arange(nfeed), nfeed
+                    vis_mat = tools.unpack_product_array(
+                        vis_local[lfi, np.newaxis, :, ts:te], nfeed=nfeed
                     )
 
-                    vis_samp = draw_complex_wishart(vis_mat, nsamp) / nsamp
+                    for ti in range(te - ts):
+                        vis_mat[0, ti] = draw_complex_wishart(vis_mat[0, ti], nsamp)
+                    vis_mat /= nsamp
 
-                    vis_data[lfi, :, lti] = vis_samp[np.triu_indices(nfeed)]
+                    vis_local[lfi, :, ts:te] = tools.pack_product_array(vis_mat)[0]
 
                 # Construct and set the correct weights in place
                 if self.set_weights:
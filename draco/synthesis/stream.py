@@ -44,7 +44,7 @@ class SimulateSidereal(task.SingleTask):
         bt : ProductManager or BeamTransfer
             Beam Transfer maanger.
         """
-        self.beamtransfer = io.get_beamtransfer(bt)
+        self.beamtransfer = io.cache_beamtransfer(io.get_beamtransfer(bt))
         self.telescope = io.get_telescope(bt)
 
     def process(self, map_):
@@ -115,8 +115,9 @@ class SimulateSidereal(task.SingleTask):
         vis_data[:] = 0.0
 
         # Iterate over m's local to this process and generate the corresponding
-        # visibilities
-        for mp, mi in vis_data.enumerate(axis=0):
+        # visibilities, reading the beam transfer matrices for the next m while
+        # the current one is projected
+        for mp, mi in io.prefetch_m(vis_data.enumerate(axis=0), bt.beam_m):
             vis_data[mp] = bt.project_vector_sky_to_telescope(
                 mi, col_alm[mp].view(np.ndarray)
             )
@@ -277,7 +278,9 @@ class MakeTimeStream(task.SingleTask):
         manager : ProductManager or BeamTransfer
             Beam Transfer and telescope manager
         """
-        self.sstream = sstream
+        # Hold a copy-on-write clone so we don't see the input being modified
+        # in place by later tasks
+        self.sstream = sstream.cow_copy()
         # Need an Observer object holding the geographic location of the telescope.
         self.observer = io.get_telescope(manager)
         # Initialise the current start time
@@ -304,14 +307,19 @@ class MakeTimeStream(task.SingleTask):
         # Make the timestream container
         tstream = containers.empty_timestream(axes_from=self.sstream, time=time)
 
-        # Make the interpolation array
+        # Make the interpolation array. This is banded, so only store the
+        # non-zero entries
         ra = self.observer.unix_to_lsa(tstream.time)
-        lza = regrid.lanczos_forward_matrix(self.sstream.ra, ra, periodic=True)
-        lza = lza.T.astype(np.complex64)
+        index, weight = regrid.lanczos_band_matrix(self.sstream.ra, ra, periodic=True)
 
         # Apply the interpolation matrix to construct the new timestream, place
         # the output directly into the container
-        np.dot(self.sstream.vis[:], lza, out=tstream.vis[:])
+        regrid.band_apply(
+            self.sstream.vis[:].view(np.ndarray),
+            index,
+            weight,
+            out=tstream.vis[:].view(np.ndarray),
+        )
 
         # Set the weights array to the maximum value for CHIME
         tstream.weight[:] = 1.0
@@ -10,8 +10,39 @@ cimport numpy as np
 from libc.stdint cimport int16_t, uint32_t
 from libc.math cimport sin
 from libc.math cimport cos
+from libc.math cimport sqrt
+from libc.stdlib cimport malloc, free
+
+from .chunkio import get_num_threads
 
 cdef inline int int_max(int a, int b) nogil: return a if a >= b else b
+cdef inline int int_min(int a, int b) nogil: return a if a <= b else b
+
+# Number of threads the kernels which take a `num_threads` argument use when
+# it is zero
+cdef int _default_threads = get_num_threads()
+
+
+ctypedef fused vis_t:
+    float
+    double
+    float complex
+    double complex
+
+ctypedef fused wgt_t:
+    float
+    double
+
+ctypedef fused complex_t:
+    float complex
+    double complex
+
+# Types of input flags. Boolean flags can be passed viewed as unsigned char.
+ctypedef fused flag_t:
+    unsigned char
+    int
+    float
+    double
 
 
 # A routine for quickly calculating the noise part of the banded
@@ -51,6 +82,308 @@ cpdef _band_wiener_covariance(double [:, ::1] Rn, double [::1] Ni,
     return np.asarray(Ci)
 
 
+cdef inline int _band_cholesky(double * ab, int m, int bw) nogil:
+    # Cholesky factorise, A = U^T U, a positive definite banded matrix in place.
+    # Both are stored in the LAPACK upper band format (column major, leading
+    # dimension bw + 1). Returns zero on success, otherwise the order of the
+    # first leading minor which is not positive definite (as LAPACK does).
+    cdef int i, j, k, ldab = bw + 1
+    cdef double t
+
+    for j in range(m):
+        for i in range(int_max(0, j - bw), j):
+            t = ab[j * ldab + bw + i - j]
+            for k in range(int_max(0, j - bw), i):
+                t = t - ab[i * ldab + bw + k - i] * ab[j * ldab + bw + k - j]
+            ab[j * ldab + bw + i - j] = t / ab[i * ldab + bw]
+
+        t = ab[j * ldab + bw]
+        for k in range(int_max(0, j - bw), j):
+            t = t - ab[j * ldab + bw + k - j] * ab[j * ldab + bw + k - j]
+        if t <= 0.0:
+            return j + 1
+        ab[j * ldab + bw] = sqrt(t)
+
+    return 0
+
+
+cdef inline int _band_cholesky_solve(const double * ab, double * x, int m, int bw) nogil:
+    # Solve U^T U x = b in place, where U is a Cholesky factor stored in the
+    # LAPACK upper band format (column major, leading dimension bw + 1)
+    cdef int i, j, ldab = bw + 1
+    cdef double t
+
+    # Forward substitution with U^T
+    for j in range(m):
+        t = x[j]
+        for i in range(int_max(0, j - bw), j):
+            t = t - ab[j * ldab + bw + i - j] * x[i]
+        x[j] = t / ab[j * ldab + bw]
+
+    # Back substitution with U
+    for i in range(m - 1, -1, -1):
+        t = x[i]
+        for j in range(i + 1, int_min(m, i + bw + 1)):
+            t = t - ab[j * ldab + bw + i - j] * x[j]
+        x[i] = t / ab[i * ldab + bw]
+
+    return 0
+
+
+@cython.wraparound(False)
+@cython.boundscheck(False)
+@cython.cdivision(True)
+def _band_wiener_solve(const Py_ssize_t[:, ::1] index, const double[:, ::1] weight,
+                       const wgt_t[:, ::1] Ni, const double[::1] Si,
+                       vis_t[:, ::1] xh, float[:, ::1] nw,
+                       const Py_ssize_t[::1] group_row, const Py_ssize_t[::1] row_order,
+                       const Py_ssize_t[::1] group_start, int bw,
+                       int num_threads=0):
+    """Solve the banded Wiener filter for many rows in parallel.
+
+    Rows are processed in groups which share the same noise weights. For each
+    group the banded inverse covariance is built and Cholesky factorised once,
+    and then used to solve for every row in the group. Groups are distributed
+    over threads.
+
+    Parameters
+    ----------
+    index, weight : np.ndarray[n, w]
+        The transfer matrix of the Wiener filter, given by the non-zero
+        entries of each of its `n` columns, `R[index[j, s], j] = weight[j, s]`.
+    Ni : np.ndarray[k, n]
+        Inverse noise weights of each row.
+    Si : np.ndarray[m]
+        Inverse signal variance.
+    xh : np.ndarray[k, m]
+        The dirty estimate for each row. Overwritten with the Wiener estimate.
+    nw : np.ndarray[k, m]
+        Array to write the diagonal of the inverse covariance of each row into.
+    group_row : np.ndarray[ngroup]
+        A row of `Ni` holding the noise weights of each group.
+    row_order : np.ndarray[k]
+        Rows sorted by group.
+    group_start : np.ndarray[ngroup + 1]
+        Start of each group in `row_order`.
+    bw : int
+        Bandwidth. Couplings further apart than this are ignored.
+    num_threads : int, optional
+        Number of threads to use. If zero, use the default number.
+
+    Returns
+    -------
+    info : np.ndarray[ngroup]
+        Zero for groups solved successfully. Otherwise the order of the first
+        leading minor of the covariance which is not positive definite, or -1
+        if the work buffers could not be allocated.
+    """
+
+    cdef int m = xh.shape[1]
+    cdef Py_ssize_t n = index.shape[0]
+    cdef Py_ssize_t nw_ = index.shape[1]
+    cdef Py_ssize_t ngroup = group_row.shape[0]
+    cdef int ldab = bw + 1
+
+    cdef int[::1] info = np.zeros(ngroup, dtype=np.int32)
+
+    cdef Py_ssize_t g, gr, ri, r, j, sa, sb
+    cdef Py_ssize_t alpha, beta
+    cdef int ginfo
+    cdef double ws
+    cdef double * ab
+    cdef double * x
+
+    if weight.shape[0] != n or weight.shape[1] != nw_:
+        raise ValueError("Transfer matrix indices and weights do not match.")
+    if Ni.shape[1] != n or Si.shape[0] != m:
+        raise ValueError("Noise and signal weights do not match the transfer matrix.")
+    if nw.shape[0] != xh.shape[0] or nw.shape[1] != m:
+        raise ValueError("Output arrays have the wrong shape.")
+    if row_order.shape[0] != xh.shape[0] or group_start.shape[0] != ngroup + 1:
+        raise ValueError("Grouping does not match the number of rows.")
+    if n and nw_ and (np.min(index) < 0 or np.max(index) >= m):
+        raise ValueError("Transfer matrix index out of bounds.")
+
+    if num_threads <= 0:
+        num_threads = _default_threads
+
+    with nogil, parallel(num_threads=num_threads):
+
+        # Per thread buffers for the banded matrix and a right hand side
+        ab = <double *> malloc(ldab * m * sizeof(double))
+        x = <double *> malloc(m * sizeof(double))
+
+        for g in prange(ngroup, schedule="dynamic"):
+
+            if ab == NULL or x == NULL:
+                info[g] = -1
+                continue
+
+            gr = group_row[g]
+
+            # Build the noise part of the inverse covariance in the upper band
+            # storage by summing the couplings through each data point, and add
+            # on the signal part
+            for beta in range(ldab * m):
+                ab[beta] = 0.0
+
+            for j in range(n):
+                for sa in range(nw_):
+                    ws = weight[j, sa] * Ni[gr, j]
+                    if ws == 0.0:
+                        continue
+                    alpha = index[j, sa]
+                    for sb in range(nw_):
+                        beta = index[j, sb]
+                        if beta >= alpha and beta - alpha <= bw:
+                            ab[beta * ldab + bw + alpha - beta] = (
+                                ab[beta * ldab + bw + alpha - beta] + ws * weight[j, sb]
+                            )
+
+            for beta in range(m):
+                ab[beta * ldab + bw] = ab[beta * ldab + bw] + Si[beta]
+
+            for ri in range(group_start[g], group_start[g + 1]):
+                r = row_order[ri]
+                for beta in range(m):
+                    nw[r, beta] = ab[beta * ldab + bw]
+
+            ginfo = _band_cholesky(ab, m, bw)
+            info[g] = ginfo
+
+            if ginfo == 0:
+                for ri in range(group_start[g], group_start[g + 1]):
+                    r = row_order[ri]
+
+                    # The covariance is real, so solve the real and imaginary
+                    # parts separately
+                    if vis_t is float or vis_t is double:
+                        for beta in range(m):
+                            x[beta] = xh[r, beta]
+                        _band_cholesky_solve(ab, x, m, bw)
+                        for beta in range(m):
+                            xh[r, beta] = <vis_t> x[beta]
+                    else:
+                        for beta in range(m):
+                            x[beta] = xh[r, beta].real
+                        _band_cholesky_solve(ab, x, m, bw)
+                        for beta in range(m):
+                            xh[r, beta] = x[beta] + 1j * xh[r, beta].imag
+
+                        for beta in range(m):
+                            x[beta] = xh[r, beta].imag
+                        _band_cholesky_solve(ab, x, m, bw)
+                        for beta in range(m):
+                            xh[r, beta] = xh[r, beta].real + 1j * x[beta]
+
+        free(ab)
+        free(x)
+
+    return np.asarray(info)
+
+
+@cython.wraparound(False)
+@cython.boundscheck(False)
+def _band_apply(const vis_t[:, ::1] data, const Py_ssize_t[:, ::1] index,
+                const double[:, ::1] weight, vis_t[:, ::1] out,
+                int num_threads=0):
+    """Apply a band matrix to each row of an array.
+
+    Calculates `out[r, i] = sum_s weight[i, s] * data[r, index[i, s]]`, in
+    parallel over the rows. The sum is accumulated in double precision, so
+    single precision data is only rounded once.
+
+    Parameters
+    ----------
+    data : np.ndarray[k, n]
+        Array to apply the matrix to.
+    index, weight : np.ndarray[p, w]
+        The non-zero entries of each row of the matrix.
+    out : np.ndarray[k, p]
+        Array to write the result into.
+    num_threads : int, optional
+        Number of threads to use. If zero, use the default number.
+    """
+    cdef Py_ssize_t nrow = data.shape[0]
+    cdef Py_ssize_t n = data.shape[1]
+    cdef Py_ssize_t p = index.shape[0]
+    cdef Py_ssize_t w = index.shape[1]
+
+    cdef Py_ssize_t r, i, s, k
+    cdef double tr, ti
+
+    if weight.shape[0] != p or weight.shape[1] != w:
+        raise ValueError("Band matrix indices and weights do not match.")
+    if out.shape[0] != nrow or out.shape[1] != p:
+        raise ValueError("Output array has the wrong shape.")
+    if p and w and (np.min(index) < 0 or np.max(index) >= n):
+        raise ValueError("Band matrix index out of bounds.")
+
+    if num_threads <= 0:
+        num_threads = _default_threads
+
+    for r in prange(nrow, nogil=True, schedule="static", num_threads=num_threads):
+        for i in range(p):
+            tr = 0.0
+            ti = 0.0
+            for s in range(w):
+                k = index[i, s]
+                if vis_t is float or vis_t is double:
+                    tr = tr + weight[i, s] * data[r, k]
+                else:
+                    tr = tr + weight[i, s] * data[r, k].real
+                    ti = ti + weight[i, s] * data[r, k].imag
+            if vis_t is float or vis_t is double:
+                out[r, i] = <vis_t> tr
+            else:
+                out[r, i] = <vis_t> (tr + 1j * ti)
+
+
+@cython.wraparound(False)
+@cython.boundscheck(False)
+def _band_apply_transpose(const vis_t[:, ::1] data, const Py_ssize_t[:, ::1] index,
+                          const double[:, ::1] weight, vis_t[:, ::1] out,
+                          int num_threads=0):
+    """Apply the transpose of a band matrix to each row of an array.
+
+    Calculates `out[r, index[i, s]] += weight[i, s] * data[r, i]`, in
+    parallel over the rows. The result is added to `out`.
+
+    Parameters
+    ----------
+    data : np.ndarray[k, p]
+        Array to apply the matrix to.
+    index, weight : np.ndarray[p, w]
+        The non-zero entries of each row of the matrix.
+    out : np.ndarray[k, n]
+        Array to add the result into.
+    num_threads : int, optional
+        Number of threads to use. If zero, use the default number.
+    """
+    cdef Py_ssize_t nrow = data.shape[0]
+    cdef Py_ssize_t n = out.shape[1]
+    cdef Py_ssize_t p = index.shape[0]
+    cdef Py_ssize_t w = index.shape[1]
+
+    cdef Py_ssize_t r, i, s, k
+
+    if weight.shape[0] != p or weight.shape[1] != w:
+        raise ValueError("Band matrix indices and weights do not match.")
+    if data.shape[1] != p or out.shape[0] != nrow:
+        raise ValueError("Array shapes do not match the band matrix.")
+    if p and w and (np.min(index) < 0 or np.max(index) >= n):
+        raise ValueError("Band matrix index out of bounds.")
+
+    if num_threads <= 0:
+        num_threads = _default_threads
+
+    for r in prange(nrow, nogil=True, schedule="static", num_threads=num_threads):
+        for i in range(p):
+            for s in range(w):
+                k = index[i, s]
+                out[r, k] = out[r, k] + <vis_t> weight[i, s] * data[r, i]
+
+
 def _unpack_product_array_fast(cython.numeric[::1] utv, cython.numeric[:, ::1] mat, cython.integral[::1] feeds, int nfeed):
     """Fast unpacking of a product array.
 
@@ -92,16 +425,155 @@ def _unpack_product_array_fast(cython.numeric[::1] utv, cython.numeric[:, ::1] m
 
 
 
+cdef inline vis_t _conj(vis_t x) nogil:
+    # Complex conjugate, which does nothing for real types
+    if vis_t is float or vis_t is double:
+        return x
+    else:
+        return x.conjugate()
+
+
+cdef inline Py_ssize_t _cmap(Py_ssize_t i, Py_ssize_t j, Py_ssize_t n) nogil:
+    # Product index of feeds i <= j
+    return (n * (n + 1)) // 2 - ((n - i) * (n - i + 1)) // 2 + (j - i)
+
+
 @cython.boundscheck(False)
 @cython.wraparound(False)
-def _calc_redundancy(float[:, ::1] input_flags, int16_t[:, ::1] prod_map, uint32_t[::1] stack_index,
-                     int nstack, float[:, ::1] redundancy):
+@cython.cdivision(True)
+def _unpack_product_array_batched(const vis_t[:, :, ::1] utv, vis_t[:, :, :, ::1] mat,
+                                  const Py_ssize_t[::1] feeds, Py_ssize_t nfeed, bint conj,
+                                  int num_threads=0):
+    """Unpack a block of product arrays into Hermitian matrices.
+
+    Parameters
+    ----------
+    utv : np.ndarray[nfreq, nprod, ntime]
+        Upper triangular products to unpack.
+    mat : np.ndarray[nfreq, ntime, lfeed, lfeed]
+        The output matrices.
+    feeds : np.ndarray[lfeed]
+        Indices of feeds to unpack into the matrices.
+    nfeed : int
+        Number of feeds contained in upper triangle.
+    conj : bool
+        Unpack the complex conjugate of the products.
+    num_threads : int, optional
+        Number of threads to use. If zero, use the default number.
+    """
+    cdef Py_ssize_t nfreq = utv.shape[0]
+    cdef Py_ssize_t ntime = utv.shape[2]
+    cdef Py_ssize_t lfeed = feeds.shape[0]
+
+    cdef Py_ssize_t ft, f, t, i, j, fi, fj
+    cdef vis_t val
+
+    if utv.shape[1] != (nfeed * (nfeed + 1)) // 2:
+        raise ValueError("Number of products does not match the number of feeds.")
+    if (mat.shape[0], mat.shape[1], mat.shape[2], mat.shape[3]) != (nfreq, ntime, lfeed, lfeed):
+        raise ValueError("Output array is wrong shape.")
+    if lfeed and (np.min(feeds) < 0 or np.max(feeds) >= nfeed):
+        raise ValueError("Feed index out of bounds.")
+
+    if num_threads <= 0:
+        num_threads = _default_threads
+
+    for ft in prange(nfreq * ntime, nogil=True, schedule="static", num_threads=num_threads):
+        f = ft // ntime
+        t = ft % ntime
+
+        for i in range(lfeed):
+            for j in range(i, lfeed):
+                fi = feeds[i]
+                fj = feeds[j]
+
+                # Fetch the product in the order it is stored
+                if fi <= fj:
+                    val = utv[f, _cmap(fi, fj, nfeed), t]
+                else:
+                    val = _conj(utv[f, _cmap(fj, fi, nfeed), t])
+
+                if conj:
+                    val = _conj(val)
+
+                mat[f, t, j, i] = _conj(val)
+                mat[f, t, i, j] = val
+
+
+@cython.boundscheck(False)
+@cython.wraparound(False)
+@cython.cdivision(True)
+def _pack_product_array_batched(const vis_t[:, :, :, ::1] mat, vis_t[:, :, ::1] utv,
+                                const Py_ssize_t[::1] feeds, Py_ssize_t nfeed, bint conj,
+                                int num_threads=0):
+    """Pack a block of Hermitian matrices into product arrays.
+
+    Only the products between the given feeds are written.
+
+    Parameters
+    ----------
+    mat : np.ndarray[nfreq, ntime, lfeed, lfeed]
+        The matrices to pack. Only the upper triangle is used.
+    utv : np.ndarray[nfreq, nprod, ntime]
+        The output product arrays.
+    feeds : np.ndarray[lfeed]
+        Indices of the feeds the matrices correspond to.
+    nfeed : int
+        Number of feeds contained in upper triangle.
+    conj : bool
+        Pack the complex conjugate of the matrices.
+    num_threads : int, optional
+        Number of threads to use. If zero, use the default number.
+    """
+    cdef Py_ssize_t nfreq = mat.shape[0]
+    cdef Py_ssize_t ntime = mat.shape[1]
+    cdef Py_ssize_t lfeed = feeds.shape[0]
+
+    cdef Py_ssize_t ft, f, t, i, j, fi, fj
+    cdef vis_t val
+
+    if utv.shape[1] != (nfeed * (nfeed + 1)) // 2:
+        raise ValueError("Number of products does not match the number of feeds.")
+    if (mat.shape[2], mat.shape[3]) != (lfeed, lfeed):
+        raise ValueError("Matrices do not match the number of feeds.")
+    if (utv.shape[0], utv.shape[2]) != (nfreq, ntime):
+        raise ValueError("Output array is wrong shape.")
+    if lfeed and (np.min(feeds) < 0 or np.max(feeds) >= nfeed):
+        raise ValueError("Feed index out of bounds.")
+
+    if num_threads <= 0:
+        num_threads = _default_threads
+
+    for ft in prange(nfreq * ntime, nogil=True, schedule="static", num_threads=num_threads):
+        f = ft // ntime
+        t = ft % ntime
+
+        for i in range(lfeed):
+            for j in range(i, lfeed):
+                fi = feeds[i]
+                fj = feeds[j]
+
+                val = mat[f, t, i, j]
+                if conj:
+                    val = _conj(val)
+
+                # Store the product in upper triangle order
+                if fi <= fj:
+                    utv[f, _cmap(fi, fj, nfeed), t] = val
+                else:
+                    utv[f, _cmap(fj, fi, nfeed), t] = _conj(val)
+
+
+@cython.boundscheck(False)
+@cython.wraparound(False)
+def _calc_redundancy(const flag_t[:, :] input_flags, const int16_t[:, :] prod_map,
+                     const uint32_t[:] stack_index, int nstack, float[:, ::1] redundancy):
     """Quickly calculate redundancy.
 
     Parameters
     ----------
     input_flags : np.ndarray[input, time]
-        The input flags. Must be zeros or ones.
+        The input flags. Must be zeros or ones, of any supported type.
     prod_map : np.ndarray[prod, 2]
         The product map.
     stack_index : np.ndarray[prod]
@@ -155,17 +627,76 @@ def _calc_redundancy(float[:, ::1] input_flags, int16_t[:, ::1] prod_map, uint32
                 redundancy[istack, jj] += input_flags[ia, jj] * input_flags[ib, jj]
 
 
+@cython.boundscheck(False)
+@cython.wraparound(False)
+def _calc_redundancy_stacked(const flag_t[:, :] input_flags, const int16_t[:, :] prod_map,
+                             const Py_ssize_t[::1] prod_order, const Py_ssize_t[::1] stack_start,
+                             float[:, ::1] redundancy,
+                             int num_threads=0):
+    """Calculate the redundancy in parallel over the stacks.
+
+    The products must be grouped by the stack they went into, such that each
+    thread accumulates the redundancy of a whole stack.
+
+    Parameters
+    ----------
+    input_flags : np.ndarray[input, time]
+        The input flags. Must be zeros or ones, of any supported type. Can be
+        a strided view.
+    prod_map : np.ndarray[prod, 2]
+        The product map.
+    prod_order : np.ndarray[nprod_stacked]
+        The products that went into a stack, ordered by stack.
+    stack_start : np.ndarray[nstack + 1]
+        The products in stack `i` are `prod_order[stack_start[i]:stack_start[i + 1]]`.
+    redundancy : np.ndarray[nstack, ntime]
+        Array in which to fill out the redundancy of each stack.
+    num_threads : int, optional
+        Number of threads to use. If zero, use the default number.
+    """
+
+    cdef Py_ssize_t istack, kk, pp, jj
+    cdef int ia, ib
+
+    cdef Py_ssize_t ninput = input_flags.shape[0]
+    cdef Py_ssize_t ntime = input_flags.shape[1]
+    cdef Py_ssize_t nstack = stack_start.shape[0] - 1
+
+    rshape = (redundancy.shape[0], redundancy.shape[1])
+    if rshape != (nstack, ntime):
+        raise RuntimeError("redundancy array shape %s incorrect, expected %s" %
+                           (repr(rshape), repr((nstack, ntime))))
+
+    if prod_map.shape[0] and (np.min(prod_map) < 0 or np.max(prod_map) >= ninput):
+        raise RuntimeError("Input index in prod_map out of bounds.")
+
+    if num_threads <= 0:
+        num_threads = _default_threads
+
+    for istack in prange(nstack, nogil=True, schedule="dynamic", num_threads=num_threads):
+        for kk in range(stack_start[istack], stack_start[istack + 1]):
+
+            pp = prod_order[kk]
+            ia = prod_map[pp, 0]
+            ib = prod_map[pp, 1]
+
+            for jj in range(ntime):
+                redundancy[istack, jj] += input_flags[ia, jj] * input_flags[ib, jj]
+
+
 cdef extern from "complex.h" nogil:
     double complex cexp(double complex)
 
 @cython.wraparound(False)
 @cython.boundscheck(False)
-cpdef beamform(float complex [:, :, ::1] vis,
-               double[:, :, ::1] weight,
-               double dec, double lat,
-               double[::1] cosha, double[::1] sinha,
-               double[:, ::1] u, double[:, ::1] v,
-               int[::1] f_index, int[::1] ra_index):
+@cython.cdivision(True)
+def beamform(const complex_t[:, :, :] vis,
+             const wgt_t[:, :, :] weight,
+             double dec, double lat,
+             const double[::1] cosha, const double[::1] sinha,
+             const double[:, ::1] u, const double[:, ::1] v,
+             const int[::1] f_index, const int[::1] ra_index,
+             int num_threads=0):
     """ Fringestop visibility data and sum over products.
     
     CAUTION! For efficiency reasons this routine does not
@@ -180,13 +711,17 @@ cpdef beamform(float complex [:, :, ::1] vis,
     
     to get a proper normalization.
 
+    See :func:`beamform_separable` for a faster version when the baselines
+    only take a few distinct values along each direction.
+
     Parameters
     ----------
     vis : complex np.ndarray[freq, RA/time, product/stack]
         Visibility data. Notice this is not in the usual order.
-        This order reduces data striding.
-    weight : double np.ndarray[freq, RA/time, product/stack]
-        The weights to be used for adding products.
+        This order reduces data striding. Can be a strided view, but is
+        fastest if the product axis is contiguous.
+    weight : float or double np.ndarray[freq, RA/time, product/stack]
+        The weights to be used for adding products. Can be a strided view.
     dec : double
         Source declination.
     lat : double
@@ -203,41 +738,337 @@ cpdef beamform(float complex [:, :, ::1] vis,
         Indices in the frequencies to process
     ra_index : int np.ndarray[HA]
         Indicies in the RA axis of the HA in cosha, sinha
+    num_threads : int, optional
+        Number of threads to use. If zero, use the default number.
     """
 
     cdef double cosdec, sindec, coslat, sinlat
-    cdef double fsphase
-    cdef int nfreq, nra, nprod
-    cdef int ii, jj, kk
+    cdef Py_ssize_t nfreq, nra, nprod
+    cdef Py_ssize_t ij, ii, jj, kk
     cdef int fi, ri
     cdef double pi
     nfreq, nra, nprod = len(f_index), len(ra_index), vis.shape[2]
     # To store the formed beams. Will only be populated at f_index 
     # frequency entries. Zero otherwise.
     cdef double[:, ::1] formed_beam = np.zeros((vis.shape[0], nra), dtype=np.float64)
-    cdef double phase, ut, vt, st, ct
+    cdef double phase, ut, vt, t
+    cdef complex_t vk
 
     pi = np.pi
     cosdec, sindec = cos(dec), sin(dec)
     coslat, sinlat = cos(lat), sin(lat)
 
-    for ii in prange(nfreq, nogil=True):
+    if num_threads <= 0:
+        num_threads = _default_threads
+
+    # Parallelise over both the frequencies and hour angles
+    for ij in prange(nfreq * nra, nogil=True, schedule="static", num_threads=num_threads):
+        ii = ij // nra
+        jj = ij % nra
+
         fi = f_index[ii]
+        ri = ra_index[jj]
 
-        for jj in range(nra):
+        ut = 2.0 * pi * cosdec * sinha[jj]
+        vt = -2.0 * pi * (coslat * sindec - sinlat * cosdec * cosha[jj])
 
-            ri = ra_index[jj]
+        # Only the real part of the fringestopped visibility is needed
+        t = 0.0
+        for kk in range(nprod):
+            phase = u[fi, kk] * ut + v[fi, kk] * vt
+            vk = vis[fi, ri, kk]
+            t = t + weight[fi, ri, kk] * (vk.real * cos(phase) - vk.imag * sin(phase))
+
+        formed_beam[fi, jj] = t
+
+    return np.asarray(formed_beam)
+
+
+@cython.wraparound(False)
+@cython.boundscheck(False)
+@cython.cdivision(True)
+def beamform_separable(const complex_t[:, :, :] vis,
+                       const wgt_t[:, :, :] weight,
+                       double dec, double lat,
+                       const double[::1] cosha, const double[::1] sinha,
+                       const double[:, ::1] u, const double[:, ::1] v,
+                       const Py_ssize_t[::1] u_index, const Py_ssize_t[::1] v_index,
+                       const int[::1] f_index, const int[::1] ra_index,
+                       int num_threads=0):
+    """Fringestop visibility data and sum over products using separable phases.
+
+    The same as :func:`beamform`, but with the baselines given as indices
+    into arrays of their distinct EW and NS components. As the fringestopping
+    phase is linear in the baseline it factorises into a phase for each
+    component, and these are calculated once per frequency and hour angle
+    rather than for every product. For a regular array such as CHIME this
+    reduces the number of trigonometric evaluations by orders of magnitude.
+
+    Parameters
+    ----------
+    vis : complex np.ndarray[freq, RA/time, product/stack]
+        Visibility data. Can be a strided view.
+    weight : float or double np.ndarray[freq, RA/time, product/stack]
+        The weights to be used for adding products. Can be a strided view.
+    dec : double
+        Source declination.
+    lat : double
+        Latitude of observation.
+    cosha : double np.ndarray[HA]
+        Cosine of hour angle array
+    sinha : double np.ndarray[HA]
+        Sine of hour angle array
+    u : double np.ndarray[freq, nu]
+        Distinct X-direction (EW) baselines in wavelengths.
+    v : double np.ndarray[freq, nv]
+        Distinct Y-direction (NS) baselines in wavelengths.
+    u_index, v_index : np.ndarray[product/stack]
+        Index of the EW and NS baseline of each product in `u` and `v`.
+    f_index : int np.ndarray[freq_to_process]
+        Indices in the frequencies to process
+    ra_index : int np.ndarray[HA]
+        Indicies in the RA axis of the HA in cosha, sinha
+    num_threads : int, optional
+        Number of threads to use. If zero, use the default number.
+
+    Returns
+    -------
+    formed_beam : np.ndarray[freq, HA]
+        The unnormalised formed beam.
+    """
+
+    cdef double cosdec, sindec, coslat, sinlat
+    cdef Py_ssize_t nfreq, nra, nprod, nu, nv
+    cdef Py_ssize_t ij, ii, jj, kk, a
+    cdef int fi, ri
+    cdef double pi
+    nfreq, nra, nprod = len(f_index), len(ra_index), vis.shape[2]
+    nu, nv = u.shape[1], v.shape[1]
+
+    cdef double[:, ::1] formed_beam = np.zeros((vis.shape[0], nra), dtype=np.float64)
+    cdef double ut, vt, t
+    cdef double complex z
+    cdef double complex * eu
+    cdef double complex * ev
+    cdef int[::1] failed = np.zeros(1, dtype=np.int32)
+
+    if u_index.shape[0] != nprod or v_index.shape[0] != nprod:
+        raise ValueError("Baseline indices do not match the number of products.")
+    if nprod and (np.min(u_index) < 0 or np.max(u_index) >= nu or
+                  np.min(v_index) < 0 or np.max(v_index) >= nv):
+        raise ValueError("Baseline index out of bounds.")
+
+    pi = np.pi
+    cosdec, sindec = cos(dec), sin(dec)
+    coslat, sinlat = cos(lat), sin(lat)
 
-            formed_beam[fi, jj] = 0.0
+    if num_threads <= 0:
+        num_threads = _default_threads
+
+    with nogil, parallel(num_threads=num_threads):
+
+        # Per thread buffers for the phase factors of each baseline component
+        eu = <double complex *> malloc(nu * sizeof(double complex))
+        ev = <double complex *> malloc(nv * sizeof(double complex))
+
+        for ij in prange(nfreq * nra, schedule="static"):
+
+            if eu == NULL or ev == NULL:
+                failed[0] = 1
+                continue
+
+            ii = ij // nra
+            jj = ij % nra
+
+            fi = f_index[ii]
+            ri = ra_index[jj]
 
             ut = 2.0 * pi * cosdec * sinha[jj]
             vt = -2.0 * pi * (coslat * sindec - sinlat * cosdec * cosha[jj])
 
+            for a in range(nu):
+                eu[a] = cos(u[fi, a] * ut) + 1j * sin(u[fi, a] * ut)
+            for a in range(nv):
+                ev[a] = cos(v[fi, a] * vt) + 1j * sin(v[fi, a] * vt)
+
+            t = 0.0
             for kk in range(nprod):
-                phase = u[fi, kk] * ut + v[fi, kk] * vt
-                st = sin(phase)
-                ct = cos(phase)
-                formed_beam[fi, jj] += weight[fi, ri, kk] * (vis[fi, ri, kk] * (ct + 1j * st)).real
+                z = eu[u_index[kk]] * ev[v_index[kk]]
+                t = t + weight[fi, ri, kk] * (
+                    vis[fi, ri, kk].real * z.real - vis[fi, ri, kk].imag * z.imag
+                )
+
+            formed_beam[fi, jj] = t
+
+        free(eu)
+        free(ev)
+
+    if failed[0]:
+        raise MemoryError("Could not allocate the phase factor buffers.")
 
     return np.asarray(formed_beam)
 
+
+
+ctypedef fused gain_t:
+    float
+    double
+    float complex
+    double complex
+
+
+@cython.boundscheck(False)
+@cython.wraparound(False)
+def _apply_gain(const vis_t[:, :, :] vis, const gain_t[:, :, :] gain, vis_t[:, :, :] out,
+                const Py_ssize_t[:, ::1] prod_map,
+                int num_threads=0):
+    """Apply per input gains to a set of visibilities in a single pass.
+
+    The arrays are reshaped such that the product (or input) axis is in the
+    middle, and all other axes are collapsed before and after it. They can be
+    strided views. Each
+    product is multiplied by `gain[i] * gain[j].conj()` where `(i, j)` are the
+    inputs of that product. The output may be the same array as the input.
+
+    Parameters
+    ----------
+    vis : np.ndarray[pre, nprod, post]
+        Visibility products.
+    gain : np.ndarray[pre, ninput, post]
+        The gains. Real gains can be applied to real or complex products,
+        complex gains only to complex products.
+    out : np.ndarray[pre, nprod, post]
+        Array to write the output into.
+    prod_map : np.ndarray[nprod, 2]
+        The inputs of each product.
+    num_threads : int, optional
+        Number of threads to use. If zero, use the default number.
+    """
+
+    cdef Py_ssize_t npre = vis.shape[0]
+    cdef Py_ssize_t nprod = vis.shape[1]
+    cdef Py_ssize_t npost = vis.shape[2]
+    cdef Py_ssize_t ninput = gain.shape[1]
+
+    cdef Py_ssize_t pp, aa, bb, ii, jj
+
+    if (vis_t is float or vis_t is double) and not (gain_t is float or gain_t is double):
+        raise TypeError("Cannot apply complex gains to real products.")
+    else:
+        if (gain.shape[0], gain.shape[2]) != (npre, npost):
+            raise ValueError("Gain array shape does not match the products.")
+        if (out.shape[0], out.shape[1], out.shape[2]) != (npre, nprod, npost):
+            raise ValueError("Output array is wrong shape.")
+        if prod_map.shape[0] != nprod:
+            raise ValueError("Length of prod_map does not match number of products.")
+        if nprod and (np.min(prod_map) < 0 or np.max(prod_map) >= ninput):
+            raise ValueError("Input index in prod_map out of bounds.")
+
+        if num_threads <= 0:
+            num_threads = _default_threads
+
+        for pp in prange(nprod, nogil=True, schedule="static", num_threads=num_threads):
+            ii = prod_map[pp, 0]
+            jj = prod_map[pp, 1]
+
+            for aa in range(npre):
+                for bb in range(npost):
+                    if gain_t is float or gain_t is double:
+                        out[aa, pp, bb] = vis[aa, pp, bb] * gain[aa, ii, bb] * gain[aa, jj, bb]
+                    else:
+                        out[aa, pp, bb] = (
+                            vis[aa, pp, bb] * gain[aa, ii, bb] * gain[aa, jj, bb].conjugate()
+                        )
+
+
+@cython.boundscheck(False)
+@cython.wraparound(False)
+def _weighted_accumulate(vis_t[::1] acc_v, wgt_t[::1] acc_w,
+                         const vis_t[::1] v, const wgt_t[::1] w,
+                         int num_threads=0):
+    """Accumulate weighted values and their weights in place.
+
+    Parameters
+    ----------
+    acc_v, acc_w : np.ndarray[n]
+        The accumulated values and weights.
+    v, w : np.ndarray[n]
+        The values and weights to add on.
+    num_threads : int, optional
+        Number of threads to use. If zero, use the default number.
+    """
+    cdef Py_ssize_t i, n = acc_v.shape[0]
+
+    if acc_w.shape[0] != n or v.shape[0] != n or w.shape[0] != n:
+        raise ValueError("Arrays must all be the same length.")
+
+    if num_threads <= 0:
+        num_threads = _default_threads
+
+    for i in prange(n, nogil=True, schedule="static", num_threads=num_threads):
+        acc_v[i] = acc_v[i] + v[i] * w[i]
+        acc_w[i] = acc_w[i] + w[i]
+
+
+@cython.boundscheck(False)
+@cython.wraparound(False)
+@cython.cdivision(True)
+def _divide_no_zero(const vis_t[::1] a, const wgt_t[::1] b, vis_t[::1] out,
+                    int num_threads=0):
+    """Divide `a` by `b`, giving zero where `b` is zero.
+
+    Parameters
+    ----------
+    a : np.ndarray[n]
+        The numerator.
+    b : np.ndarray[n]
+        The denominator.
+    out : np.ndarray[n]
+        Array to write the output into. Can be `a`.
+    num_threads : int, optional
+        Number of threads to use. If zero, use the default number.
+    """
+    cdef Py_ssize_t i, n = a.shape[0]
+
+    if b.shape[0] != n or out.shape[0] != n:
+        raise ValueError("Arrays must all be the same length.")
+
+    if num_threads <= 0:
+        num_threads = _default_threads
+
+    for i in prange(n, nogil=True, schedule="static", num_threads=num_threads):
+        if b[i] == 0:
+            out[i] = 0
+        else:
+            out[i] = a[i] / b[i]
+
+
+@cython.boundscheck(False)
+@cython.wraparound(False)
+@cython.cdivision(True)
+def _invert_no_zero(const vis_t[::1] x, vis_t[::1] out,
+                    int num_threads=0):
+    """Calculate the reciprocal of `x`, giving zero where `x` is zero.
+
+    Parameters
+    ----------
+    x : np.ndarray[n]
+        The array to invert.
+    out : np.ndarray[n]
+        Array to write the output into. Can be `x`.
+    num_threads : int, optional
+        Number of threads to use. If zero, use the default number.
+    """
+    cdef Py_ssize_t i, n = x.shape[0]
+
+    if out.shape[0] != n:
+        raise ValueError("Arrays must all be the same length.")
+
+    if num_threads <= 0:
+        num_threads = _default_threads
+
+    for i in prange(n, nogil=True, schedule="static", num_threads=num_threads):
+        if x[i] == 0:
+            out[i] = 0
+        else:
+            out[i] = 1 / x[i]
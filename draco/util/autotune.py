@@ -0,0 +1,546 @@
+"""Choose the number of threads the compiled kernels run with.
+
+The Cython kernels in :mod:`draco.util` are parallelised with OpenMP, but for
+small problems the cost of starting the threads can outweigh the gain. The
+autotuner times each kernel on a few problem sizes with different numbers of
+threads, and saves the fastest choice into a table for each host. When a
+kernel is called, it uses the number of threads tuned for the nearest problem
+size.
+
+The table is stored in `~/.cache/draco`, or in the directory given by the
+`DRACO_AUTOTUNE_DIR` environment variable. It is made by running::
+
+    $ python -m draco.util.autotune
+
+Until then the kernels use all threads. Setting `DRACO_AUTOTUNE=on` instead
+tunes each kernel missing from the table the first time it is used, unless
+there is more than one MPI process, as the processes on a node would disturb
+the timings.
+
+The table is ignored if the number of threads available has changed since it
+was made (e.g. a different `OMP_NUM_THREADS`).
+
+Routines
+========
+
+.. autosummary::
+    :toctree:
+
+    num_threads
+    tune
+    load_table
+    save_table
+    table_path
+"""
+# === Start Python 2/3 compatibility
+from __future__ import absolute_import, division, print_function, unicode_literals
+from future.builtins import *  # noqa  pylint: disable=W0401, W0614
+from future.builtins.disabled import *  # noqa  pylint: disable=W0401, W0614
+
+# === End Python 2/3 compatibility
+
+import json
+import math
+import os
+import socket
+import sys
+import tempfile
+import threading
+import timeit
+from collections import OrderedDict
+
+import numpy as np
+
+from .chunkio import get_num_threads
+
+
+TABLE_VERSION = 1
+
+# Problem sizes to tune at
+SIZES = [2 ** 10, 2 ** 13, 2 ** 16, 2 ** 19, 2 ** 22]
+
+
+def _bench_elementwise(size):
+    from . import _fast_tools
+
+    a = np.ones(size, dtype=np.complex64)
+    b = np.ones(size, dtype=np.float32)
+    out = np.empty_like(a)
+
+    return lambda nt: _fast_tools._divide_no_zero(a, b, out, num_threads=nt)
+
+
+def _bench_apply_gain(size):
+    from . import _fast_tools
+
+    nfeed = 16
+    prod_map = np.array(np.triu_indices(nfeed)).T.astype(np.intp).copy()
+    npost = max(size // len(prod_map), 1)
+
+    vis = np.ones((1, len(prod_map), npost), dtype=np.complex64)
+    gain = np.ones((1, nfeed, npost), dtype=np.complex64)
+
+    return lambda nt: _fast_tools._apply_gain(vis, gain, vis, prod_map, num_threads=nt)
+
+
+def _bench_product_array(size):
+    from . import _fast_tools
+
+    nfeed = 16
+    ntime = max(size // nfeed ** 2, 1)
+    feeds = np.arange(nfeed, dtype=np.intp)
+
+    utv = np.ones((1, nfeed * (nfeed + 1) // 2, ntime), dtype=np.complex64)
+    mat = np.empty((1, ntime, nfeed, nfeed), dtype=np.complex64)
+
+    return lambda nt: _fast_tools._unpack_product_array_batched(
+        utv, mat, feeds, nfeed, False, num_threads=nt
+    )
+
+
+def _bench_redundancy(size):
+    from . import _fast_tools
+
+    ninput, ntime = 64, 16
+    nprod = max(size // ntime, 1)
+    nstack = max(nprod // 16, 1)
+
+    rng = np.random.RandomState(0)
+    flags = np.ones((ninput, ntime), dtype=np.float32)
+    prod_map = rng.randint(0, ninput, size=(nprod, 2)).astype(np.int16)
+    prod_order = np.arange(nprod, dtype=np.intp)
+    stack_start = np.linspace(0, nprod, nstack + 1).astype(np.intp)
+    redundancy = np.zeros((nstack, ntime), dtype=np.float32)
+
+    return lambda nt: _fast_tools._calc_redundancy_stacked(
+        flags, prod_map, prod_order, stack_start, redundancy, num_threads=nt
+    )
+
+
+def _bench_truncate(size):
+    from . import truncate
+
+    val = np.ones((1, 1, size), dtype=np.float32)
+
+    return lambda nt: truncate._truncate_real_fixed(val, 1e-4, nt)
+
+
+def _bench_band_apply(size):
+    from . import _fast_tools
+
+    n, w = 256, 10
+    nrow = max(size // (n * w), 1)
+
+    data = np.ones((nrow, n), dtype=np.complex64)
+    index = (np.arange(n)[:, np.newaxis] + np.arange(w)) % n
+    weight = np.ones((n, w), dtype=np.float64)
+    out = np.empty_like(data)
+
+    return lambda nt: _fast_tools._band_apply(
+        data, index.astype(np.intp), weight, out, num_threads=nt
+    )
+
+
+def _bench_beamform(size):
+    # The size is the number of visibilities summed over
+    from . import _fast_tools
+
+    nfreq, nra = 4, 16
+    nprod = max(size // (nfreq * nra), 1)
+
+    vis = np.ones((nfreq, nra, nprod), dtype=np.complex64)
+    weight = np.ones((nfreq, nra, nprod), dtype=np.float32)
+    ha = np.linspace(-0.1, 0.1, nra)
+    u = np.ones((nfreq, nprod), dtype=np.float64)
+    f_index = np.arange(nfreq, dtype=np.int32)
+    ra_index = np.arange(nra, dtype=np.int32)
+
+    return lambda nt: _fast_tools.beamform(
+        vis,
+        weight,
+        0.5,
+        0.5,
+        np.cos(ha),
+        np.sin(ha),
+        u,
+        u,
+        f_index,
+        ra_index,
+        num_threads=nt,
+    )
+
+
+def _bench_beamform_separable(size):
+    # The size is the number of visibilities summed over
+    from . import _fast_tools
+
+    nfreq, nra, nu = 4, 16, 32
+    nprod = max(size // (nfreq * nra), 1)
+
+    vis = np.ones((nfreq, nra, nprod), dtype=np.complex64)
+    weight = np.ones((nfreq, nra, nprod), dtype=np.float32)
+    ha = np.linspace(-0.1, 0.1, nra)
+    u = np.ones((nfreq, nu), dtype=np.float64)
+    u_index = np.arange(nprod, dtype=np.intp) % nu
+    f_index = np.arange(nfreq, dtype=np.int32)
+    ra_index = np.arange(nra, dtype=np.int32)
+
+    return lambda nt: _fast_tools.beamform_separable(
+        vis,
+        weight,
+        0.5,
+        0.5,
+        np.cos(ha),
+        np.sin(ha),
+        u,
+        u,
+        u_index,
+        u_index,
+        f_index,
+        ra_index,
+        num_threads=nt,
+    )
+
+
+def _bench_wiener(size):
+    # The size is the total number of elements in the band matrices of all
+    # the groups
+    from . import _fast_tools
+
+    m, w, bw = 256, 4, 8
+    ngroup = max(size // (m * (bw + 1)), 1)
+
+    index = (np.arange(m)[:, np.newaxis] + np.arange(w)) % m
+    weight = np.ones((m, w), dtype=np.float64)
+    Ni = np.ones((ngroup, m), dtype=np.float64)
+    Si = np.ones(m, dtype=np.float64)
+    xh = np.ones((ngroup, m), dtype=np.complex64)
+    nw = np.empty((ngroup, m), dtype=np.float32)
+    rows = np.arange(ngroup + 1, dtype=np.intp)
+
+    return lambda nt: _fast_tools._band_wiener_solve(
+        index.astype(np.intp),
+        weight,
+        Ni,
+        Si,
+        xh,
+        nw,
+        rows[:-1],
+        rows[:-1],
+        rows,
+        bw,
+        num_threads=nt,
+    )
+
+
+# The tunable kernels. Each entry makes a function running the kernel on a
+# problem of the given size with a number of threads. The sizes are in the
+# same units as the callers pass to `num_threads`.
+KERNELS = OrderedDict(
+    [
+        ("elementwise", _bench_elementwise),
+        ("apply_gain", _bench_apply_gain),
+        ("product_array", _bench_product_array),
+        ("redundancy", _bench_redundancy),
+        ("truncate", _bench_truncate),
+        ("band_apply", _bench_band_apply),
+        ("wiener", _bench_wiener),
+        ("beamform", _bench_beamform),
+        ("beamform_separable", _bench_beamform_separable),
+    ]
+)
+
+
+def table_path():
+    """Get the path of the tuning table for this host.
+
+    Returns
+    -------
+    path : str
+    """
+    directory = os.environ.get("DRACO_AUTOTUNE_DIR", None)
+    if directory is None:
+        directory = os.path.join(os.path.expanduser("~"), ".cache", "draco")
+
+    return os.path.join(directory, "autotune_%s.json" % socket.gethostname())
+
+
+def load_table(path=None):
+    """Load a tuning table.
+
+    Parameters
+    ----------
+    path : str, optional
+        File to load. Default is :func:`table_path`.
+
+    Returns
+    -------
+    table : dict or None
+        The table, or None if it doesn't exist or can't be read.
+    """
+    path = table_path() if path is None else path
+
+    try:
+        with open(path, "r") as fh:
+            table = json.load(fh)
+    except (IOError, OSError, ValueError):
+        return None
+
+    if not isinstance(table, dict) or table.get("version", None) != TABLE_VERSION:
+        return None
+
+    return table
+
+
+def save_table(table, path=None):
+    """Save a tuning table.
+
+    Parameters
+    ----------
+    table : dict
+        The table, as returned by :func:`tune`.
+    path : str, optional
+        File to save into. Default is :func:`table_path`.
+    """
+    path = table_path() if path is None else path
+
+    directory = os.path.dirname(path)
+    if directory and not os.path.exists(directory):
+        os.makedirs(directory)
+
+    # Write to a temporary file in the same directory and move it into place,
+    # so that other processes never read a partial table
+    fd, tmp = tempfile.mkstemp(
+        prefix=os.path.basename(path) + ".", suffix=".tmp", dir=directory or "."
+    )
+    try:
+        with os.fdopen(fd, "w") as fh:
+            json.dump(table, fh, indent=2, sort_keys=True)
+        os.replace(tmp, path)
+    except BaseException:
+        os.remove(tmp)
+        raise
+
+
+def _candidate_threads(max_threads):
+    # One thread, powers of two, and all threads
+    threads = [1]
+    while threads[-1] * 2 < max_threads:
+        threads.append(threads[-1] * 2)
+    if max_threads > 1:
+        threads.append(max_threads)
+    return threads
+
+
+def _time(func, nt, min_time=2e-3, repeat=3):
+    # Best time of a call to `func(nt)`, over batches of calls long enough to
+    # time reliably
+    func(nt)
+
+    number = 1
+    while True:
+        elapsed = timeit.timeit(lambda: func(nt), number=number)
+        if elapsed >= min_time:
+            break
+        number *= 4
+
+    times = [elapsed] + timeit.repeat(
+        lambda: func(nt), number=number, repeat=repeat - 1
+    )
+
+    return min(times) / number
+
+
+def tune(kernels=None, sizes=None, threads=None, path=None, save=True):
+    """Time the kernels and make a table of the fastest number of threads.
+
+    Kernels already in the table at `path` (if it is for the same number of
+    threads) and not re-tuned are kept.
+
+    Parameters
+    ----------
+    kernels : list of str, optional
+        Names of the kernels to tune. Default is all of `KERNELS`.
+    sizes : list of int, optional
+        Problem sizes to tune at. Default is `SIZES`.
+    threads : list of int, optional
+        Numbers of threads to try. Default is one, the powers of two, and
+        all threads.
+    path : str, optional
+        File of the table. Default is :func:`table_path`.
+    save : bool, optional
+        Save the table. Default is True.
+
+    Returns
+    -------
+    table : dict
+        The tuning table.
+    """
+    kernels = list(KERNELS) if kernels is None else list(kernels)
+    sizes = SIZES if sizes is None else sorted(int(s) for s in sizes)
+
+    for name in kernels:
+        if name not in KERNELS:
+            raise ValueError("Unknown kernel %s" % name)
+
+    max_threads = get_num_threads()
+    threads = _candidate_threads(max_threads) if threads is None else list(threads)
+
+    table = load_table(path)
+    if table is None or table.get("max_threads", None) != max_threads:
+        table = {
+            "version": TABLE_VERSION,
+            "host": socket.gethostname(),
+            "max_threads": max_threads,
+            "kernels": {},
+        }
+
+    for name in kernels:
+        best = []
+        for size in sizes:
+            func = KERNELS[name](size)
+            times = [_time(func, nt) for nt in threads]
+            best.append(threads[int(np.argmin(times))])
+
+        table["kernels"][name] = {"sizes": list(sizes), "threads": best}
+
+    if save:
+        save_table(table, path)
+
+    return table
+
+
+# The tuning of each kernel used so far in this process
+_entries = {}
+_entries_lock = threading.Lock()
+
+
+def _tune_on_first_use():
+    # Whether to tune kernels which aren't in the table when first used. This
+    # must be asked for, as it takes a while.
+    if os.environ.get("DRACO_AUTOTUNE", "").lower() not in ["1", "on", "true", "yes"]:
+        return False
+
+    # Only look at the number of MPI processes if MPI is already in use, to
+    # avoid initialising it here
+    mpi = sys.modules.get("mpi4py.MPI", None)
+
+    return mpi is None or mpi.COMM_WORLD.size <= 1
+
+
+def _get_entry(kernel):
+    # Get the tuning of a kernel from the table, tuning it if it's missing and
+    # that was asked for. Returns None if there is none.
+    with _entries_lock:
+        if kernel in _entries:
+            return _entries[kernel]
+
+        max_threads = get_num_threads()
+
+        table = load_table()
+        if table is not None and table.get("max_threads", None) != max_threads:
+            table = None
+
+        entry = None if table is None else table["kernels"].get(kernel, None)
+        if entry is not None:
+            entry = (entry["sizes"], entry["threads"])
+
+        # Other calls use the defaults while the kernel is tuned, rather than
+        # wait for it
+        _entries[kernel] = entry
+
+    if entry is None and max_threads > 1 and _tune_on_first_use():
+        table = tune([kernel], save=False)
+        entry = table["kernels"][kernel]
+        entry = (entry["sizes"], entry["threads"])
+
+        # Keep using the tuning even if the table can't be saved
+        try:
+            save_table(table)
+        except (IOError, OSError):
+            pass
+
+        with _entries_lock:
+            _entries[kernel] = entry
+
+    return entry
+
+
+def num_threads(kernel, size):
+    """Get the number of threads to run a kernel with.
+
+    Parameters
+    ----------
+    kernel : str
+        Name of the kernel, one of `KERNELS`.
+    size : int
+        Size of the problem, in the units the kernel was tuned with.
+
+    Returns
+    -------
+    num_threads : int
+        Number of threads to use. Zero if the kernel hasn't been tuned, which
+        the kernels take to mean the default number of threads.
+    """
+    entry = _get_entry(kernel)
+
+    if entry is None:
+        return 0
+
+    # Use the tuning for the nearest size on a log scale
+    sizes, threads = entry
+    logsize = math.log(max(size, 1))
+    i = min(range(len(sizes)), key=lambda i: abs(math.log(sizes[i]) - logsize))
+
+    return threads[i]
+
+
+def main(argv=None):
+    """Tune the kernels from the command line and save the table."""
+    import argparse
+
+    parser = argparse.ArgumentParser(
+        prog="python -m draco.util.autotune",
+        description="Tune the number of threads used by the draco kernels.",
+    )
+    parser.add_argument(
+        "-k",
+        "--kernel",
+        action="append",
+        choices=list(KERNELS),
+        help="Kernel to tune. Can be given several times. Default is all.",
+    )
+    parser.add_argument(
+        "-s", "--sizes", type=int, nargs="+", help="Problem sizes to tune at."
+    )
+    parser.add_argument(
+        "-t", "--threads", type=int, nargs="+", help="Numbers of threads to try."
+    )
+    parser.add_argument(
+        "-o", "--output", help="File to save the table to (default %s)." % table_path()
+    )
+    parser.add_argument(
+        "--show", action="store_true", help="Only show the current table."
+    )
+    args = parser.parse_args(argv)
+
+    path = table_path() if args.output is None else args.output
+
+    if args.show:
+        table = load_table(path)
+        if table is None:
+            print("No tuning table at %s" % path)
+            return
+    else:
+        table = tune(args.kernel, args.sizes, args.threads, path=path)
+        print("Saved tuning table to %s" % path)
+
+    print("Host %s, %i threads" % (table["host"], table["max_threads"]))
+    for name, entry in sorted(table["kernels"].items()):
+        print("  %s" % name)
+        for size, nt in zip(entry["sizes"], entry["threads"]):
+            print("    size %10i: %i threads" % (size, nt))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,262 @@
+"""A memory-budgeted cache for large arrays.
+
+Routines
+========
+
+.. autosummary::
+    :toctree:
+
+    LRUCache
+    global_cache
+"""
+# === Start Python 2/3 compatibility
+from __future__ import absolute_import, division, print_function, unicode_literals
+from future.builtins import *  # noqa  pylint: disable=W0401, W0614
+from future.builtins.disabled import *  # noqa  pylint: disable=W0401, W0614
+
+# === End Python 2/3 compatibility
+
+import logging
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+
+logger = logging.getLogger(__name__)
+
+# Memory budget of the process wide cache if none is given when it's created
+DEFAULT_MAX_BYTES = 2 ** 30
+
+
+class LRUCache(object):
+    """A thread safe least recently used cache with a memory budget.
+
+    Values are arrays, or (nested) tuples and lists of arrays, and their size
+    is the total number of bytes in the arrays. When the total size would go
+    over the budget, the least recently used entries are evicted. Cached
+    arrays are made read only so they can't be modified by accident, and the
+    values returned by :meth:`lookup` and :meth:`get_or_load` are the cached
+    arrays themselves. Callers that need to modify them must take a copy.
+
+    Parameters
+    ----------
+    max_bytes : int
+        The memory budget in bytes.
+
+    Attributes
+    ----------
+    max_bytes : int
+        The memory budget in bytes.
+    nbytes : int
+        Current size of the cache in bytes.
+    hits, misses : int
+        Number of lookups which found, or did not find, an entry.
+    """
+
+    def __init__(self, max_bytes):
+        self.max_bytes = int(max_bytes)
+        self.nbytes = 0
+        self.hits = 0
+        self.misses = 0
+
+        self._data = OrderedDict()
+        self._loading = {}
+        self._lock = threading.RLock()
+
+    def __len__(self):
+        return len(self._data)
+
+    def __contains__(self, key):
+        return key in self._data
+
+    def lookup(self, key):
+        """Fetch an entry if it is in the cache.
+
+        Only successful lookups are counted (as hits).
+
+        Parameters
+        ----------
+        key : hashable
+
+        Returns
+        -------
+        value : array or None
+            The cached value, or None if it's not in the cache.
+        """
+        with self._lock:
+            if key not in self._data:
+                return None
+
+            self._touch(key)
+            self.hits += 1
+            return self._data[key][0]
+
+    def put(self, key, value):
+        """Add an entry to the cache, evicting old entries as needed.
+
+        Values larger than the whole budget are not cached. The arrays of a
+        cached value are made read only in place.
+
+        Parameters
+        ----------
+        key : hashable
+        value : array, or tuple or list of arrays
+        """
+        nbytes = _nbytes(value)
+
+        with self._lock:
+            self._remove(key)
+
+            if nbytes > self.max_bytes:
+                return
+
+            _set_readonly(value)
+            self._data[key] = (value, nbytes)
+            self.nbytes += nbytes
+
+            self._evict()
+
+    def get_or_load(self, key, loader):
+        """Fetch an entry from the cache, loading it if needed.
+
+        If another thread is already loading the same entry, wait for it to
+        finish rather than loading it again.
+
+        Parameters
+        ----------
+        key : hashable
+        loader : callable
+            Called with no arguments to produce the value on a miss.
+
+        Returns
+        -------
+        value
+            The value, with its arrays read only if it was cached.
+        """
+        while True:
+            with self._lock:
+                if key in self._data:
+                    self._touch(key)
+                    self.hits += 1
+                    return self._data[key][0]
+
+                event = self._loading.get(key, None)
+                if event is None:
+                    self.misses += 1
+                    event = self._loading[key] = threading.Event()
+                    break
+
+            # Wait for the other thread, then try again
+            event.wait()
+
+        try:
+            value = loader()
+            self.put(key, value)
+        finally:
+            with self._lock:
+                del self._loading[key]
+            event.set()
+
+        return value
+
+    def resize(self, max_bytes):
+        """Change the memory budget, evicting entries if needed.
+
+        Parameters
+        ----------
+        max_bytes : int
+        """
+        with self._lock:
+            self.max_bytes = int(max_bytes)
+            self._evict()
+
+    def clear(self):
+        """Remove all entries."""
+        with self._lock:
+            self._data.clear()
+            self.nbytes = 0
+
+    def stats(self):
+        """Get the cache statistics.
+
+        Returns
+        -------
+        stats : dict
+            The number of `hits` and `misses`, the number of `entries`, and
+            the size in bytes (`nbytes`) of the cache.
+        """
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "entries": len(self._data),
+                "nbytes": self.nbytes,
+            }
+
+    def _touch(self, key):
+        # Mark an entry as the most recently used
+        self._data[key] = self._data.pop(key)
+
+    def _remove(self, key):
+        if key in self._data:
+            self.nbytes -= self._data.pop(key)[1]
+
+    def _evict(self):
+        while self.nbytes > self.max_bytes and self._data:
+            self.nbytes -= self._data.popitem(last=False)[1][1]
+
+
+_global_cache = None
+_global_lock = threading.Lock()
+
+
+def global_cache(max_bytes=None):
+    """Get the process wide cache.
+
+    Parameters
+    ----------
+    max_bytes : int, optional
+        If given, set the memory budget of the cache to this. Otherwise a
+        newly created cache gets a budget of `DEFAULT_MAX_BYTES` (1 GB).
+
+    Returns
+    -------
+    cache : LRUCache
+    """
+    global _global_cache
+
+    with _global_lock:
+        if _global_cache is None:
+            if max_bytes is None:
+                max_bytes = DEFAULT_MAX_BYTES
+                logger.info(
+                    "Using the default budget of %i bytes for the global cache.",
+                    max_bytes,
+                )
+            _global_cache = LRUCache(max_bytes)
+        elif max_bytes is not None:
+            _global_cache.resize(max_bytes)
+
+        if _global_cache.max_bytes <= 0:
+            logger.warning("The global cache has no budget, so will cache nothing.")
+
+    return _global_cache
+
+
+def _nbytes(value):
+    # Total size of the arrays in a value
+    if isinstance(value, np.ndarray):
+        return value.nbytes
+    if isinstance(value, (tuple, list)):
+        return sum(_nbytes(v) for v in value)
+    return 0
+
+
+def _set_readonly(value):
+    # Make the arrays in a value read only
+    if isinstance(value, np.ndarray):
+        value.flags.writeable = False
+    elif isinstance(value, (tuple, list)):
+        for v in value:
+            _set_readonly(v)
@@ -0,0 +1,305 @@
+"""Routines for reading and writing compressed HDF5 chunks in parallel.
+
+HDF5 applies compression filters one chunk at a time, serially, inside each
+read or write call. For datasets compressed with bitshuffle/LZ4 these routines
+instead (de)compress the chunks in a pool of threads and transfer the raw
+chunks with HDF5 direct chunk reads and writes.
+
+Routines
+========
+
+.. autosummary::
+    :toctree:
+
+    get_num_threads
+    is_bitshuffle_lz4
+    compress_chunk
+    decompress_chunk
+    write_chunks
+    read_chunks
+"""
+# === Start Python 2/3 compatibility
+from __future__ import absolute_import, division, print_function, unicode_literals
+from future.builtins import *  # noqa  pylint: disable=W0401, W0614
+from future.builtins.disabled import *  # noqa  pylint: disable=W0401, W0614
+
+# === End Python 2/3 compatibility
+
+import itertools
+import os
+import struct
+from collections import deque
+
+import numpy as np
+
+
+# Filter ID and compression flag used by bitshuffle
+BSHUF_H5FILTER = 32008
+BSHUF_H5_COMPRESS_LZ4 = 2
+
+# Parameters used by bitshuffle to pick a default block size
+_BSHUF_TARGET_BLOCK_SIZE_B = 8192
+_BSHUF_MIN_RECOMMEND_BLOCK = 128
+_BSHUF_BLOCKED_MULT = 8
+
+
+def get_num_threads(n=None):
+    """Get the number of threads to use.
+
+    Parameters
+    ----------
+    n : int, optional
+        Requested number of threads. If not set (or zero), use the value of
+        `OMP_NUM_THREADS`, or if that is not set, the number of CPUs.
+
+    Returns
+    -------
+    n : int
+    """
+    import multiprocessing
+
+    if n:
+        return int(n)
+
+    return int(os.environ.get("OMP_NUM_THREADS", 0)) or multiprocessing.cpu_count()
+
+
+def is_bitshuffle_lz4(dset):
+    """Test if an HDF5 dataset is compressed with bitshuffle/LZ4 only.
+
+    Parameters
+    ----------
+    dset : h5py.Dataset
+
+    Returns
+    -------
+    is_bslz4 : bool
+    """
+    plist = dset.id.get_create_plist()
+
+    if plist.get_nfilters() != 1:
+        return False
+
+    code, _, opts, _ = plist.get_filter(0)
+
+    return code == BSHUF_H5FILTER and len(opts) > 4 and opts[4] == BSHUF_H5_COMPRESS_LZ4
+
+
+def _default_block_size(itemsize):
+    # The block size (in elements) bitshuffle uses by default
+    block = _BSHUF_TARGET_BLOCK_SIZE_B // itemsize
+    block = (block // _BSHUF_BLOCKED_MULT) * _BSHUF_BLOCKED_MULT
+    return max(block, _BSHUF_MIN_RECOMMEND_BLOCK)
+
+
+def compress_chunk(arr, block_size=0):
+    """Compress an array into the format used by the bitshuffle HDF5 filter.
+
+    Parameters
+    ----------
+    arr : np.ndarray
+        The array to compress.
+    block_size : int, optional
+        Block size in elements. Use the bitshuffle default if zero.
+
+    Returns
+    -------
+    buf : bytes
+        The compressed chunk including the filter header.
+    """
+    import bitshuffle
+
+    arr = np.ascontiguousarray(arr)
+    block_size = block_size or _default_block_size(arr.dtype.itemsize)
+
+    compressed = bitshuffle.compress_lz4(arr, block_size)
+    header = struct.pack(">QI", arr.nbytes, block_size * arr.dtype.itemsize)
+
+    return header + compressed.tobytes()
+
+
+def decompress_chunk(buf, shape, dtype):
+    """Decompress a chunk written by the bitshuffle HDF5 filter.
+
+    Parameters
+    ----------
+    buf : bytes
+        The raw chunk including the filter header.
+    shape : tuple
+        Shape of the chunk.
+    dtype : np.dtype
+        Type of the chunk.
+
+    Returns
+    -------
+    arr : np.ndarray
+    """
+    import bitshuffle
+
+    dtype = np.dtype(dtype)
+    _, block_bytes = struct.unpack(">QI", buf[:12])
+
+    compressed = np.frombuffer(buf, dtype=np.uint8, offset=12)
+
+    return bitshuffle.decompress_lz4(
+        compressed, tuple(shape), dtype, block_bytes // dtype.itemsize
+    )
+
+
+def _chunk_grid(chunks, start, stop):
+    # Iterate over the offsets of all chunks overlapping [start, stop)
+    ranges = [
+        range((a // c) * c, b, c) if b > a else range(0)
+        for a, b, c in zip(start, stop, chunks)
+    ]
+    return itertools.product(*ranges)
+
+
+def write_chunks(dset, data, offset=None, num_threads=None, func=None):
+    """Write an array into a bitshuffle compressed dataset a chunk at a time.
+
+    The chunks are compressed in a pool of threads and written with HDF5
+    direct chunk writes. Chunks only partly covered by the region written
+    (where it doesn't start or end on a chunk boundary or the edge of the
+    dataset) are instead written through the usual HDF5 filter pipeline,
+    which merges them with any data already in the chunk.
+
+    Parameters
+    ----------
+    dset : h5py.Dataset
+        Dataset to write into. Must be compressed with bitshuffle/LZ4 only.
+    data : np.ndarray
+        The data to write.
+    offset : tuple, optional
+        Position in the dataset to write the data at. Default is the origin.
+    num_threads : int, optional
+        Number of threads to use. See :func:`get_num_threads`.
+    func : callable, optional
+        A function called as `func(part, sel)` on a copy of each part of
+        `data` before it is compressed, where `sel` is the selection of the
+        part within `data`. It must modify `part` in place.
+    """
+    from concurrent.futures import ThreadPoolExecutor
+
+    chunks = dset.chunks
+    shape = dset.shape
+    offset = (0,) * len(shape) if offset is None else tuple(offset)
+    stop = tuple(o + n for o, n in zip(offset, data.shape))
+
+    block_size = dset.id.get_create_plist().get_filter(0)[2][3]
+    dtype = dset.dtype
+
+    def _compress(chunk_offset):
+        # Copy the chunk out of the data and compress it, padding partial
+        # chunks at the edge of the dataset. Chunks which the region only
+        # partly covers are returned uncompressed with their selection in the
+        # dataset.
+        sel = tuple(
+            slice(max(co, o) - o, min(co + c, e) - o)
+            for co, o, e, c in zip(chunk_offset, offset, stop, chunks)
+        )
+        part = data[sel]
+
+        if func is not None:
+            part = np.array(part)
+            func(part, sel)
+
+        whole = all(
+            co >= o and (co + c <= e or e == n)
+            for co, o, e, c, n in zip(chunk_offset, offset, stop, chunks, shape)
+        )
+        if not whole:
+            dsel = tuple(slice(o + s.start, o + s.stop) for o, s in zip(offset, sel))
+            return chunk_offset, None, dsel, part
+
+        chunk = np.zeros(chunks, dtype=dtype)
+        chunk[tuple(slice(0, n) for n in part.shape)] = part
+
+        return chunk_offset, compress_chunk(chunk, block_size), None, None
+
+    def _write(chunk_offset, buf, dsel, part):
+        if buf is None:
+            dset[dsel] = part
+        else:
+            dset.id.write_direct_chunk(chunk_offset, buf)
+
+    nthreads = get_num_threads(num_threads)
+
+    # Keep a bounded number of chunks in flight, writing them out in order on
+    # this thread as they are finished
+    with ThreadPoolExecutor(max_workers=nthreads) as executor:
+        pending = deque()
+
+        for chunk_offset in _chunk_grid(chunks, offset, stop):
+            pending.append(executor.submit(_compress, chunk_offset))
+
+            if len(pending) >= 2 * nthreads:
+                _write(*pending.popleft().result())
+
+        while pending:
+            _write(*pending.popleft().result())
+
+
+def read_chunks(dset, out, offset=None, num_threads=None):
+    """Read a region of a bitshuffle compressed dataset a chunk at a time.
+
+    The raw chunks are read with HDF5 direct chunk reads, then decompressed
+    in a pool of threads and copied straight into the output array.
+
+    Parameters
+    ----------
+    dset : h5py.Dataset
+        Dataset to read from. Must be compressed with bitshuffle/LZ4 only.
+    out : np.ndarray
+        Array to read into. Its shape gives the size of the region to read.
+    offset : tuple, optional
+        Position in the dataset of the start of the region. Default is the
+        origin.
+    num_threads : int, optional
+        Number of threads to use. See :func:`get_num_threads`.
+    """
+    from concurrent.futures import ThreadPoolExecutor
+
+    chunks = dset.chunks
+    offset = (0,) * len(dset.shape) if offset is None else tuple(offset)
+    stop = tuple(o + n for o, n in zip(offset, out.shape))
+    dtype = dset.dtype
+
+    def _decompress(chunk_offset, filter_mask, buf):
+        # Decompress the chunk and copy the overlap with the region into place
+        if buf is None:
+            chunk = np.full(chunks, dset.fillvalue, dtype=dtype)
+        elif filter_mask:
+            chunk = np.frombuffer(buf, dtype=dtype).reshape(chunks)
+        else:
+            chunk = decompress_chunk(buf, chunks, dtype)
+
+        csel, osel = [], []
+        for co, o, e, c in zip(chunk_offset, offset, stop, chunks):
+            lo, hi = max(co, o), min(co + c, e)
+            csel.append(slice(lo - co, hi - co))
+            osel.append(slice(lo - o, hi - o))
+
+        out[tuple(osel)] = chunk[tuple(csel)]
+
+    nthreads = get_num_threads(num_threads)
+
+    # The chunk reads happen on this thread, and are passed off to the pool
+    # for decompression
+    with ThreadPoolExecutor(max_workers=nthreads) as executor:
+        pending = deque()
+
+        for chunk_offset in _chunk_grid(chunks, offset, stop):
+            try:
+                filter_mask, buf = dset.id.read_direct_chunk(chunk_offset)
+            except (KeyError, ValueError, RuntimeError):
+                # The chunk has never been written
+                filter_mask, buf = 0, None
+
+            pending.append(executor.submit(_decompress, chunk_offset, filter_mask, buf))
+
+            if len(pending) >= 2 * nthreads:
+                pending.popleft().result()
+
+        while pending:
+            pending.popleft().result()
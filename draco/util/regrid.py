@@ -11,8 +11,10 @@ Tasks
     :toctree:
 
     band_wiener
+    band_apply
     lanczos_kernel
     lanczos_forward_matrix
+    lanczos_band_matrix
     lanczos_inverse_matrix
 """
 # === Start Python 2/3 compatibility
@@ -25,7 +27,7 @@ from future.builtins.disabled import *  # noqa  pylint: disable=W0401, W0614
 import numpy as np
 import scipy.linalg as la
 
-from ..util import _fast_tools
+from ..util import _fast_tools, autotune
 
 
 def band_wiener(R, Ni, Si, y, bw):
@@ -38,12 +40,18 @@ def band_wiener(R, Ni, Si, y, bw):
 
     Parameters
     ----------
-    R : np.ndarray[m, n]
-        Transfer matrix for the Wiener filter.
+    R : np.ndarray[m, n] or tuple
+        Transfer matrix for the Wiener filter. Either a dense matrix, or an
+        `(index, weight)` pair of arrays of shape `[n, w]` giving the non-zero
+        entries of each column, `R[index[j, s], j] = weight[j, s]`. This is
+        the band form of its transpose, as returned by
+        :func:`lanczos_band_matrix`.
     Ni : np.ndarray[k, n]
         Inverse noise matrix. Noise assumed to be uncorrelated (i.e. diagonal matrix).
-    Si : np.narray[m]
+    Si : np.narray[m] or float
         Inverse signal matrix. Signal model assumed to be uncorrelated (i.e. diagonal matrix).
+        If a scalar and `R` is in band form, `m` is taken as one more than the
+        largest index in `R`.
     y : np.ndarray[k, n]
         Data to apply to.
     bw : int
@@ -61,7 +69,21 @@ def band_wiener(R, Ni, Si, y, bw):
     y = np.atleast_2d(y)
 
     k = Ni.shape[0]
-    m = R.shape[0]
+
+    if isinstance(R, tuple):
+        index, weight = R
+        if np.ndim(Si):
+            m = len(Si)
+        else:
+            m = int(np.max(index)) + 1 if np.size(index) else 0
+    else:
+        m = R.shape[0]
+        index, weight = _dense_to_band(R.T)
+
+    Si = np.ascontiguousarray(np.broadcast_to(Si, (m,)), dtype=np.float64)
+
+    index = np.ascontiguousarray(index, dtype=np.intp)
+    weight = np.ascontiguousarray(weight, dtype=np.float64)
 
     # Initialise arrays
     xh = np.zeros((k, m), dtype=y.dtype)
@@ -71,31 +93,137 @@ def band_wiener(R, Ni, Si, y, bw):
     y *= Ni
 
     # Calculate dirty estimate (and output straight into xh)
-    R_s = R.astype(np.float32)
-    np.dot(y, R_s.T, out=xh)
+    if isinstance(R, tuple):
+        _fast_tools._band_apply_transpose(
+            np.ascontiguousarray(y),
+            index,
+            weight,
+            xh,
+            num_threads=autotune.num_threads("band_apply", y.size * index.shape[1]),
+        )
+    else:
+        R_s = R.astype(np.float32)
+        np.dot(y, R_s.T, out=xh)
+
+    # Rows with identical noise weights have the same covariance, so group them
+    # to only build and factorise it once per group
+    if Ni.dtype not in (np.float32, np.float64):
+        Ni = Ni.astype(np.float64)
+    Ni = np.ascontiguousarray(Ni)
+    group_row, row_order, group_start = _group_rows(Ni)
+
+    # Solve for the Wiener estimate of all rows in parallel
+    info = _fast_tools._band_wiener_solve(
+        index,
+        weight,
+        Ni,
+        Si,
+        xh,
+        nw,
+        group_row,
+        row_order,
+        group_start,
+        bw,
+        num_threads=autotune.num_threads("wiener", len(group_row) * m * (bw + 1)),
+    )
+
+    if (info < 0).any():
+        raise MemoryError("Could not allocate the Wiener filter work buffers.")
+
+    if info.any():
+        raise la.LinAlgError(
+            "%d-th leading minor not positive definite" % info[info > 0][0]
+        )
 
-    # Calculate the start and end indices of the summation
-    start_ind = (R != 0).argmax(axis=-1).astype(np.int32)
-    end_ind = R.shape[-1] - (R[..., ::-1] != 0).argmax(axis=-1)
-    end_ind = np.where((R == 0).all(axis=-1), 0, end_ind).astype(np.int32)
+    return xh, nw
 
-    # Iterate through and solve noise
-    for ki in range(k):
 
-        # Upcast noise weights to float type
-        Ni_ki = Ni[ki].astype(np.float64)
+def _group_rows(arr):
+    # Group the identical rows of a 2D array, keyed on their bytes. This is
+    # much cheaper than `np.unique(arr, axis=0)`. Return the first row of each
+    # group, the rows in order of their group, and where each group starts in
+    # that order.
+    first = {}
+    group = np.array(
+        [first.setdefault(row.tobytes(), ri) for ri, row in enumerate(arr)],
+        dtype=np.intp,
+    )
+    group_row, group = np.unique(group, return_inverse=True)
+    group = group.ravel()
 
-        # Calculate the Wiener noise weighting (i.e. inverse covariance)
-        Ci = _fast_tools._band_wiener_covariance(R, Ni_ki, start_ind, end_ind, bw)
+    row_order = np.argsort(group, kind="stable").astype(np.intp)
+    group_start = np.zeros(len(group_row) + 1, dtype=np.intp)
+    np.cumsum(np.bincount(group, minlength=len(group_row)), out=group_start[1:])
 
-        # Add on the signal covariance part
-        Ci[-1] += Si
+    return group_row.astype(np.intp), row_order, group_start
 
-        # Solve for the Wiener estimate
-        xh[ki] = la.solveh_banded(Ci, xh[ki])
-        nw[ki] = Ci[-1]
 
-    return xh, nw
+def band_apply(data, index, weight, out=None):
+    """Apply a band matrix along the last axis of an array.
+
+    Parameters
+    ----------
+    data : np.ndarray[..., n]
+        Array to apply the matrix to.
+    index, weight : np.ndarray[p, w]
+        The non-zero entries of each row of the matrix, `matrix[i, index[i, s]]
+        = weight[i, s]`, as returned by :func:`lanczos_band_matrix`.
+    out : np.ndarray[..., p], optional
+        Array to place the result in. If not set, a new array is created.
+
+    Returns
+    -------
+    out : np.ndarray[..., p]
+        The result, equivalent to `np.dot(data, matrix.T)`.
+    """
+
+    if data.dtype not in (np.float32, np.float64, np.complex64, np.complex128):
+        data = data.astype(np.float64)
+
+    shape = data.shape[:-1] + (index.shape[0],)
+
+    if out is None:
+        out = np.empty(shape, dtype=data.dtype)
+    elif out.shape != shape:
+        raise ValueError(
+            "Output array has shape %s, expected %s" % (str(out.shape), str(shape))
+        )
+
+    # Calculate into a temporary if the output can't be written directly
+    direct = out.dtype == data.dtype and out.flags.c_contiguous
+    res = out if direct else np.empty(shape, dtype=data.dtype)
+
+    data = np.ascontiguousarray(data)
+    _fast_tools._band_apply(
+        data.reshape(-1, data.shape[-1]),
+        np.ascontiguousarray(index, dtype=np.intp),
+        np.ascontiguousarray(weight, dtype=np.float64),
+        res.reshape(-1, shape[-1]),
+        num_threads=autotune.num_threads("band_apply", res.size * index.shape[1]),
+    )
+
+    if not direct:
+        out[:] = res
+
+    return out
+
+
+def _dense_to_band(matrix):
+    # Convert a dense matrix into the band form, with the non-zero entries of
+    # each row padded out to the same number with zero weights
+    nz = matrix != 0
+    count = nz.sum(axis=-1)
+    w = max(count.max() if count.size else 0, 1)
+
+    row, col = np.nonzero(nz)
+    pos = np.arange(len(row)) - np.repeat(np.cumsum(count) - count, count)
+
+    index = np.zeros((matrix.shape[0], w), dtype=np.intp)
+    weight = np.zeros((matrix.shape[0], w), dtype=np.float64)
+    index[row, pos] = col
+    weight[row, pos] = matrix[row, col]
+
+    return index, weight
 
 
 def lanczos_kernel(x, a):
@@ -148,6 +276,53 @@ def lanczos_forward_matrix(x, y, a=5, periodic=False):
     return lz_forward
 
 
+def lanczos_band_matrix(x, y, a=5, periodic=False):
+    """Lanczos interpolation matrix in band form.
+
+    This is the same matrix as :func:`lanczos_forward_matrix`, but only the
+    `2 a` entries of each row which can be non-zero are stored, so it takes
+    `O(n a)` time and memory to construct. Apply it with :func:`band_apply`.
+
+    Parameters
+    ----------
+    x : np.ndarray[m]
+        Points we have data at. Must be regularly spaced.
+    y : np.ndarray[n]
+        Point we want to interpolate data onto.
+    a : integer, optional
+        Lanczos width parameter.
+    periodic : boolean, optional
+        Treat input points as periodic.
+
+    Returns
+    -------
+    index : np.ndarray[n, 2 * a]
+        The positions in `x` of the entries of each row.
+    weight : np.ndarray[n, 2 * a]
+        The value of each entry.
+    """
+    x = np.asarray(x)
+    y = np.asarray(y)
+
+    m = len(x)
+    dx = x[1] - x[0]
+
+    # Position of each output point in units of the input spacing
+    pos = (y - x[0]) / dx
+
+    index = np.floor(pos).astype(np.intp)[:, np.newaxis] + np.arange(1 - a, a + 1)
+    weight = lanczos_kernel(index - pos[:, np.newaxis], a)
+
+    if periodic:
+        index %= m
+    else:
+        outside = (index < 0) | (index >= m)
+        weight[outside] = 0.0
+        index[outside] = 0
+
+    return index, weight
+
+
 def lanczos_inverse_matrix(x, y, a=5, cond=1e-1):
     """Regrid data using a maximum likelihood inverse Lanczos.
 
@@ -9,53 +9,75 @@ from future.builtins.disabled import *  # noqa  pylint: disable=W0401, W0614
 
 # === End Python 2/3 compatibility
 
+import itertools
+
 import numpy as np
 
-from ._fast_tools import _calc_redundancy
+from . import _fast_tools, autotune
+from .cache import LRUCache
 
 
 def cmap(i, j, n):
     """Given a pair of feed indices, return the pair index.
 
+    The feed indices can be scalars or arrays, in which case they are
+    broadcast against each other.
+
     Parameters
     ----------
-    i, j : integer
+    i, j : integer or np.ndarray of integers
         Feed index.
     n : integer
         Total number of feeds.
 
     Returns
     -------
-    pi : integer
+    pi : integer or np.ndarray of integers
         Pair index.
     """
-    if i <= j:
-        return (n * (n + 1) // 2) - ((n - i) * (n - i + 1) // 2) + (j - i)
-    else:
-        return cmap(j, i, n)
+    i, j = np.asarray(i), np.asarray(j)
+
+    # Make sure the first index is the smaller
+    i, j = np.minimum(i, j), np.maximum(i, j)
+
+    pi = (n * (n + 1) // 2) - ((n - i) * (n - i + 1) // 2) + (j - i)
+
+    return int(pi) if pi.ndim == 0 else pi
 
 
 def icmap(ix, n):
     """Inverse feed map.
 
+    The pair index can be a scalar or an array.
+
     Parameters
     ----------
-    ix : integer
+    ix : integer or np.ndarray of integers
         Pair index.
     n : integer
         Total number of feeds.
 
     Returns
     -------
-    fi, fj : integer
+    fi, fj : integer or np.ndarray of integers
         Feed indices.
     """
-    for ii in range(n):
-        if cmap(ii, n - 1, n) >= ix:
-            break
+    ix = np.asarray(ix, dtype=np.int64)
+
+    # Count the pairs from the end of the triangle, such that the rows (in
+    # reverse) start at the triangular numbers, and invert them
+    m = (n * (n + 1) // 2) - 1 - ix
+    r = ((np.sqrt(8 * m + 1) - 1) // 2).astype(np.int64)
+
+    # Correct for any rounding in the square root
+    r += (r + 1) * (r + 2) // 2 <= m
+    r -= r * (r + 1) // 2 > m
 
-    i = ii
+    i = n - 1 - r
     j = ix - cmap(i, i, n) + i
+
+    if ix.ndim == 0:
+        return int(i), int(j)
     return i, j
 
 
@@ -64,7 +86,9 @@ def apply_gain(vis, gain, axis=1, out=None, prod_map=None):
     triangular format.
 
     This allows us to apply the gains while minimising the intermediate
-    products created.
+    products created. Where possible this is done in a single parallel pass
+    by a compiled kernel, otherwise it falls back to looping over the
+    products.
 
     Parameters
     ----------
@@ -100,14 +124,18 @@ def apply_gain(vis, gain, axis=1, out=None, prod_map=None):
             raise ValueError(msg)
         # Could check prod_map contents as well, but the loop should give a
         # sensible error if this is wrong, and checking is expensive.
-    else:
-        prod_map = [icmap(pp, ninput) for pp in range(nprod)]
 
     if out is None:
         out = np.empty_like(vis)
     elif out.shape != vis.shape:
         raise Exception("Output array is wrong shape.")
 
+    if _apply_gain_fast(vis, gain, axis, out, prod_map):
+        return out
+
+    if prod_map is None:
+        prod_map = np.array(icmap(np.arange(nprod), ninput)).T
+
     # Define slices for use in gain & vis selection & combination
     gain_vis_slice = tuple(slice(None) for i in range(axis))
 
@@ -127,7 +155,63 @@ def apply_gain(vis, gain, axis=1, out=None, prod_map=None):
     return out
 
 
-def invert_no_zero(x):
+# Types supported by the compiled gain kernel
+_GAIN_KERNEL_TYPES = [np.float32, np.float64, np.complex64, np.complex128]
+
+
+def _apply_gain_fast(vis, gain, axis, out, prod_map):
+    # Try to apply the gains with the compiled kernel. This needs the arrays
+    # to be of the same shape other than along `axis`, of supported types,
+    # and to have a 3D view with the axes before and after `axis` collapsed
+    # (which strided views usually do). Return whether it succeeded.
+
+    axis = axis % vis.ndim
+
+    if gain.ndim != vis.ndim or (
+        gain.shape[:axis] + gain.shape[(axis + 1) :]
+        != vis.shape[:axis] + vis.shape[(axis + 1) :]
+    ):
+        return False
+
+    if vis.dtype != out.dtype or vis.dtype.type not in _GAIN_KERNEL_TYPES:
+        return False
+
+    if gain.dtype.type not in _GAIN_KERNEL_TYPES or (
+        np.iscomplexobj(gain) and not np.iscomplexobj(vis)
+    ):
+        return False
+
+    if prod_map is None:
+        prod_map = np.array(icmap(np.arange(vis.shape[axis]), gain.shape[axis])).T
+    elif getattr(prod_map, "dtype", None) is not None and prod_map.dtype.names:
+        # Structured arrays of input pairs, e.g. `input_a` and `input_b`
+        names = prod_map.dtype.names
+        prod_map = np.array([prod_map[names[0]], prod_map[names[1]]]).T
+    prod_map = np.ascontiguousarray(prod_map, dtype=np.intp).reshape(-1, 2)
+
+    # Collapse the axes before and after `axis`. Setting the shape of a view
+    # raises an AttributeError if this can't be done without a copy
+    views = []
+    for arr in (vis, gain, out):
+        shape = arr.shape
+        view = arr.view(np.ndarray)
+        try:
+            view.shape = (
+                int(np.prod(shape[:axis])),
+                shape[axis],
+                int(np.prod(shape[(axis + 1) :])),
+            )
+        except AttributeError:
+            return False
+        views.append(view)
+
+    nt = autotune.num_threads("apply_gain", vis.size)
+    _fast_tools._apply_gain(*views, prod_map=prod_map, num_threads=nt)
+
+    return True
+
+
+def invert_no_zero(x, out=None):
     """Return the reciprocal, but ignoring zeros.
 
     Where `x != 0` return 1/x, or just return 0. Importantly this routine does
@@ -136,14 +220,131 @@ def invert_no_zero(x):
     Parameters
     ----------
     x : np.ndarray
+    out : np.ndarray, optional
+        Array to place the output in. This can be `x` itself.
 
     Returns
     -------
     r : np.ndarray
         Return the reciprocal of x.
     """
+    x = np.asanyarray(x)
+
+    if x.ndim and x.dtype.type in _FUSED_TYPES:
+        r = np.empty(x.shape, dtype=x.dtype) if out is None else out
+        flat = _flatten(x, r) if r.dtype == x.dtype else None
+
+        if flat is not None:
+            nt = autotune.num_threads("elementwise", x.size)
+            _fast_tools._invert_no_zero(*flat, num_threads=nt)
+            return r
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        r = np.where(x == 0, 0.0, 1.0 / x)
+
+    if out is None:
+        return r
+
+    out[...] = r
+    return out
+
+
+def divide_no_zero(a, b, out=None):
+    """Divide `a` by `b`, but ignoring zeros.
+
+    Where `b != 0` return a/b, or just return 0. This does not produce a
+    warning about zero division, and avoids the temporary created by
+    multiplying by :func:`invert_no_zero`.
+
+    Parameters
+    ----------
+    a : np.ndarray
+        The numerator.
+    b : np.ndarray
+        The denominator. For the fast path this must be real and the same
+        shape as `a`, otherwise it is broadcast.
+    out : np.ndarray, optional
+        Array to place the output in. This can be `a` itself.
+
+    Returns
+    -------
+    r : np.ndarray
+        The ratio.
+    """
+    a, b = np.asanyarray(a), np.asanyarray(b)
+
+    if a.ndim and a.dtype.type in _FUSED_TYPES and b.dtype.type in _FUSED_REAL_TYPES:
+        r = np.empty(a.shape, dtype=a.dtype) if out is None else out
+        flat = _flatten(a, b, r) if r.dtype == a.dtype else None
+
+        if flat is not None:
+            nt = autotune.num_threads("elementwise", a.size)
+            _fast_tools._divide_no_zero(*flat, num_threads=nt)
+            return r
+
     with np.errstate(divide="ignore", invalid="ignore"):
-        return np.where(x == 0, 0.0, 1.0 / x)
+        r = np.where(b == 0, 0.0, a / b)
+
+    if out is None:
+        return r
+
+    out[...] = r
+    return out
+
+
+def weighted_accumulate(acc_vis, acc_weight, vis, weight):
+    """Add weighted values and their weights onto accumulators in place.
+
+    This is equivalent to `acc_vis += vis * weight` and
+    `acc_weight += weight`, but is done in a single pass without creating
+    temporaries.
+
+    Parameters
+    ----------
+    acc_vis : np.ndarray
+        The accumulated weighted values. Modified in place.
+    acc_weight : np.ndarray
+        The accumulated weights. Modified in place.
+    vis : np.ndarray
+        The values to add.
+    weight : np.ndarray
+        The weights of the values. Must be real.
+    """
+    if (
+        acc_vis.dtype == vis.dtype
+        and acc_weight.dtype == weight.dtype
+        and vis.dtype.type in _FUSED_TYPES
+        and weight.dtype.type in _FUSED_REAL_TYPES
+    ):
+        flat = _flatten(acc_vis, acc_weight, vis, weight)
+
+        if flat is not None:
+            nt = autotune.num_threads("elementwise", vis.size)
+            _fast_tools._weighted_accumulate(*flat, num_threads=nt)
+            return
+
+    acc_vis += vis * weight
+    acc_weight += weight
+
+
+# Types supported by the compiled elementwise kernels
+_FUSED_TYPES = (np.float32, np.float64, np.complex64, np.complex128)
+_FUSED_REAL_TYPES = (np.float32, np.float64)
+
+
+def _flatten(*arrays):
+    # Get flat views of the arrays if they can be passed to the compiled
+    # elementwise kernels, i.e. they are contiguous and of the same shape,
+    # otherwise return None
+    shape = arrays[0].shape
+
+    for arr in arrays:
+        if not isinstance(arr, np.ndarray):
+            return None
+        if arr.shape != shape or not arr.flags.c_contiguous:
+            return None
+
+    return [arr.view(np.ndarray).reshape(-1) for arr in arrays]
 
 
 def extract_diagonal(utmat, axis=1):
@@ -175,7 +376,7 @@ def extract_diagonal(utmat, axis=1):
         raise RuntimeError(msg)
 
     # Find indices of the diagonal
-    diag_ind = [cmap(ii, ii, nside) for ii in range(nside)]
+    diag_ind = cmap(np.arange(nside), np.arange(nside), nside)
 
     # Construct slice objects representing the axes before and after the product axis
     slice0 = (np.s_[:],) * axis
@@ -188,11 +389,113 @@ def extract_diagonal(utmat, axis=1):
     return diag_array
 
 
-def calculate_redundancy(input_flags, prod_map, stack_index, nstack):
+def unpack_product_array(utv, nfeed=None, feeds=None, conj=False, out=None):
+    """Unpack a block of products in upper triangular format into matrices.
+
+    Parameters
+    ----------
+    utv : np.ndarray[nfreq, nprod, ntime]
+        Products in upper triangular order.
+    nfeed : int, optional
+        Number of feeds contained in the upper triangle. Found from the number
+        of products if not given.
+    feeds : np.ndarray[lfeed], optional
+        Indices of a subset of feeds to unpack. Default is all feeds.
+    conj : bool, optional
+        Unpack the complex conjugate of the products.
+    out : np.ndarray[nfreq, ntime, lfeed, lfeed], optional
+        Array to place the output in. Must be C contiguous and of the same
+        type as `utv`.
+
+    Returns
+    -------
+    mat : np.ndarray[nfreq, ntime, lfeed, lfeed]
+        The Hermitian matrix of products at each frequency and time.
+    """
+    utv = np.ascontiguousarray(utv)
+    nfreq, nprod, ntime = utv.shape
+
+    if nfeed is None:
+        nfeed = int((2 * nprod) ** 0.5)
+
+    feeds = np.arange(nfeed) if feeds is None else feeds
+    feeds = np.ascontiguousarray(feeds, dtype=np.intp)
+
+    if out is None:
+        out = np.empty((nfreq, ntime, len(feeds), len(feeds)), dtype=utv.dtype)
+
+    _fast_tools._unpack_product_array_batched(
+        utv.view(np.ndarray),
+        out.view(np.ndarray),
+        feeds,
+        nfeed,
+        conj,
+        num_threads=autotune.num_threads("product_array", out.size),
+    )
+
+    return out
+
+
+def pack_product_array(mat, nfeed=None, feeds=None, conj=False, out=None):
+    """Pack a block of Hermitian matrices into upper triangular format.
+
+    Parameters
+    ----------
+    mat : np.ndarray[nfreq, ntime, lfeed, lfeed]
+        The matrices. Only the upper triangle is used.
+    nfeed : int, optional
+        Total number of feeds. Default is the size of `out`, or `lfeed`.
+    feeds : np.ndarray[lfeed], optional
+        Indices of the feeds the matrices correspond to. Default is all
+        feeds.
+    conj : bool, optional
+        Pack the complex conjugate of the matrices.
+    out : np.ndarray[nfreq, nprod, ntime], optional
+        Array to place the output in. Must be C contiguous and of the same
+        type as `mat`. Only the products between `feeds` are written.
+
+    Returns
+    -------
+    utv : np.ndarray[nfreq, nprod, ntime]
+        The products in upper triangular order.
+    """
+    mat = np.ascontiguousarray(mat)
+    nfreq, ntime, lfeed = mat.shape[:3]
+
+    if nfeed is None:
+        nfeed = lfeed if out is None else int((2 * out.shape[1]) ** 0.5)
+
+    feeds = np.arange(nfeed) if feeds is None else feeds
+    feeds = np.ascontiguousarray(feeds, dtype=np.intp)
+
+    if out is None:
+        nprod = nfeed * (nfeed + 1) // 2
+        out = np.zeros((nfreq, nprod, ntime), dtype=mat.dtype)
+
+    _fast_tools._pack_product_array_batched(
+        mat.view(np.ndarray),
+        out.view(np.ndarray),
+        feeds,
+        nfeed,
+        conj,
+        num_threads=autotune.num_threads("product_array", mat.size),
+    )
+
+    return out
+
+
+def calculate_redundancy(input_flags, prod_map, stack_index, nstack, cache=True):
     """Calculates the number of redundant baselines that were stacked
     to form each unique baseline, accounting for the fact that some fraction
     of the inputs are flagged as bad at any given time.
 
+    The calculation is parallelised over the stacks, and only done for the
+    time samples where the input flags changed from the previous sample. The
+    results are cached on the contents of the arguments, so repeated calls
+    with the same flags are cheap. Cache entries are found using a summary of
+    the arguments and then compared in full, as hashing them all costs about
+    as much as the calculation itself.
+
     Parameters
     ----------
     input_flags : np.ndarray [ninput, ntime]
@@ -212,6 +515,9 @@ def calculate_redundancy(input_flags, prod_map, stack_index, nstack):
     nstack: int
         Total number of unique baselines.
 
+    cache: bool, optional
+        Look up and store the result in a cache. Default is True.
+
     Returns
     -------
     redundancy : np.ndarray[nstack, ntime]
@@ -220,21 +526,115 @@ def calculate_redundancy(input_flags, prod_map, stack_index, nstack):
 
     """
     ninput, ntime = input_flags.shape
-    redundancy = np.zeros((nstack, ntime), dtype=np.float32)
+
+    # The kernel accepts the common flag types directly, including strided
+    # views, so only convert other types
+    input_flags = np.asarray(input_flags)
+    if input_flags.dtype == np.bool_:
+        input_flags = input_flags.view(np.uint8)
+    elif input_flags.dtype.type not in _FLAG_TYPES:
+        input_flags = input_flags.astype(np.float32)
+    pm = np.ascontiguousarray(prod_map.view(np.int16).reshape(-1, 2))
+    stack_index = np.ascontiguousarray(stack_index)
+
+    group, prod_order, stack_start = _group_by_stack(pm, stack_index, nstack)
+
+    if cache:
+        key = ("redundancy", group, _fingerprint(input_flags))
+        entry = _redundancy_cache.lookup(key)
+        if entry is not None and np.array_equal(entry[0], input_flags):
+            return entry[1].copy()
+        flags = np.array(input_flags)
 
     if not np.any(input_flags):
         input_flags = np.ones_like(input_flags)
 
-    input_flags = np.ascontiguousarray(input_flags)
-    pm = np.ascontiguousarray(prod_map.view(np.int16).reshape(-1, 2))
-    stack_index = np.ascontiguousarray(stack_index)
+    # Only calculate the time samples where the flags have changed from the
+    # previous sample
+    changed = np.ones(ntime, dtype=np.bool_)
+    changed[1:] = np.any(input_flags[:, 1:] != input_flags[:, :-1], axis=0)
+    time_index = np.flatnonzero(changed)
+
+    if len(time_index) < ntime:
+        input_flags = input_flags[:, time_index]
+
+    redundancy = np.zeros((nstack, len(time_index)), dtype=np.float32)
 
     # Call fast cython function to do calculation
-    _calc_redundancy(input_flags, pm, stack_index.copy(), nstack, redundancy)
+    _fast_tools._calc_redundancy_stacked(
+        input_flags,
+        pm,
+        prod_order,
+        stack_start,
+        redundancy,
+        num_threads=autotune.num_threads(
+            "redundancy", len(prod_order) * redundancy.shape[1]
+        ),
+    )
+
+    # Copy the redundancy of each calculated sample forward over the samples
+    # where the flags didn't change
+    if len(time_index) < ntime:
+        redundancy = redundancy[:, np.cumsum(changed) - 1]
+
+    if cache:
+        _redundancy_cache.put(key, (flags, redundancy.copy()))
 
     return redundancy
 
 
+# Cache of the results of `calculate_redundancy`
+_redundancy_cache = LRUCache(64 * 2 ** 20)
+
+# Input flag types supported by the redundancy kernel
+_FLAG_TYPES = (np.uint8, np.intc, np.float32, np.float64)
+
+
+def _group_by_stack(prod_map, stack_index, nstack):
+    # Order the products by the stack they went into, returning an id for the
+    # grouping, the order and the start of each stack within it. Products with
+    # a stack index out of range were not included in the stack. As the
+    # product map rarely changes, this is cached too. The id is unique to
+    # each cache entry, so can key results derived from the grouping.
+    key = ("group", nstack, _fingerprint(prod_map), _fingerprint(stack_index))
+
+    entry = _redundancy_cache.lookup(key)
+    if (
+        entry is not None
+        and np.array_equal(entry[1], prod_map)
+        and np.array_equal(entry[2], stack_index)
+    ):
+        return entry[0], entry[3], entry[4]
+
+    in_stack = np.flatnonzero(stack_index < nstack)
+    prod_order = in_stack[np.argsort(stack_index[in_stack], kind="stable")]
+    stack_start = np.searchsorted(stack_index[prod_order], np.arange(nstack + 1))
+
+    entry = (
+        next(_group_ids),
+        prod_map.copy(),
+        stack_index.copy(),
+        prod_order.astype(np.intp),
+        stack_start.astype(np.intp),
+    )
+    _redundancy_cache.put(key, entry)
+
+    return entry[0], entry[3], entry[4]
+
+
+_group_ids = itertools.count()
+
+
+def _fingerprint(arr, nsample=4096):
+    # A cheap summary of the contents of an array, from its sum and an evenly
+    # strided sample of its elements. Arrays with different contents can
+    # share a fingerprint, so anything found with it must be checked.
+    step = max(1, arr.size // nsample)
+    sample = arr.reshape(-1)[::step] if arr.flags.c_contiguous else arr[..., ::step]
+
+    return (arr.dtype.str, arr.shape, arr.sum().item(), hash(sample.tobytes()))
+
+
 def polarization_map(index_map, telescope, exclude_autos=True):
     """ Map the visibilities corresponding to entries in
         pol = ['XX', 'XY', 'YX', 'YY'].
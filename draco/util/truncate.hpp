@@ -117,3 +117,119 @@ inline float bit_truncate_float(float val, float err) {
 
     return tr_val_ptr[0];
 }
+
+
+// 2**63 + 2**62 will be used to check for overflow
+const uint64_t HIGH_BITS_64 = 13835058055282163712ULL;
+
+/**
+ *  @brief 64-bit version of `bit_truncate`.
+ *
+ *  @warning Undefined results for err < 0 and err > 2**62.
+ */
+inline int64_t bit_truncate_64(int64_t val, int64_t err) {
+    // *gran* is the granularity. It is the power of 2 that is *larger than* the
+    // maximum error *err*.
+    int64_t gran = err;
+    gran |= gran >> 1;
+    gran |= gran >> 2;
+    gran |= gran >> 4;
+    gran |= gran >> 8;
+    gran |= gran >> 16;
+    gran |= gran >> 32;
+    gran += 1;
+
+    // Bitmask selects bits to be rounded.
+    int64_t bitmask = gran - 1;
+
+    // Determine if there is a round-up/round-down tie.
+    // This operation gets the `gran = 1` case correct (non tie).
+    int64_t tie = ((val & bitmask) << 1) == gran;
+
+    // The acctual rounding.
+    int64_t val_t = (val - (gran >> 1)) | bitmask;
+    val_t += 1;
+    // There is a bit of extra bit twiddling for the err == 0.
+    val_t -= (err == 0);
+
+    // Break any tie by rounding to even.
+    val_t -= val_t & (tie * gran);
+
+    return val_t;
+}
+
+
+/**
+ *  @brief Count the number of leading zeros in a 64-bit binary number.
+ */
+inline int64_t count_zeros_64(int64_t x) {
+    x = x | (x >> 1);
+    x = x | (x >> 2);
+    x = x | (x >> 4);
+    x = x | (x >> 8);
+    x = x | (x >> 16);
+    x = x | (x >> 32);
+    return __builtin_popcountll(~x);
+}
+
+
+/**
+ * @brief Fast power of two double.
+ *
+ * Result is undefined for e < -1022.
+ *
+ * @param   e   Exponent
+ *
+ * @returns The result of 2^e
+ */
+inline double fast_pow_double(int16_t e) {
+    double* out_f;
+    // Construct double bitwise
+    uint64_t out_i = ((uint64_t)(1023 + e) << 52);
+    // Cast into double
+    out_f = (double*)&out_i;
+    return *out_f;
+}
+
+
+/**
+ *  @brief Truncate precision of a double by applying the algorithm of
+ *         `bit_truncate_64` to the mantissa.
+ *
+ *  See `bit_truncate_float` for the caveats about NaN and inf.
+ */
+inline double bit_truncate_double(double val, double err) {
+    // cast double memory into an int
+    int64_t* cast_val_ptr = (int64_t*)&val;
+    // extract the exponent and sign
+    int64_t val_pre = cast_val_ptr[0] >> 52;
+    // strip sign
+    int64_t val_pow = val_pre & 2047;
+    int64_t val_s = val_pre >> 11;
+    // extract mantissa. mask is 2**52 - 1. Add back the implicit 53rd bit
+    int64_t val_man = (cast_val_ptr[0] & 4503599627370495LL) + 4503599627370496LL;
+    // scale the error to the integer representation of the mantissa
+    // scale by 2**(52 + 1023 - pow)
+    int64_t int_err = (int64_t)(err * fast_pow_double(1075 - val_pow));
+    // make sure hasn't overflowed. if set to 2**62-1, will surely round to 0.
+    // must keep err < 2**62 for bit_truncate_64 to work
+    int_err = (int_err & HIGH_BITS_64) ? 4611686018427387903LL : int_err;
+
+    // truncate
+    int64_t tr_man = bit_truncate_64(val_man, int_err);
+
+    // count leading zeros
+    int64_t z_count = count_zeros_64(tr_man);
+    // adjust power after truncation to account for loss of implicit bit
+    val_pow -= z_count - 11;
+    // shift mantissa by same amount, remove implicit bit
+    tr_man = (tr_man << (z_count - 11)) & 4503599627370495LL;
+    // round to zero case
+    val_pow = ((z_count != 64) ? val_pow : 0);
+    // restore sign and exponent
+    int64_t tr_val = tr_man | ((val_pow | (val_s << 11)) << 52);
+    // cast back to double
+    double* tr_val_ptr = (double*)&tr_val;
+
+    return tr_val_ptr[0];
+}
@@ -1,44 +1,362 @@
 cimport cython
 from cython.parallel import prange
 
+from libc.math cimport fabs
+
 import numpy as np
 cimport numpy as cnp
 
+from . import autotune
+from .chunkio import get_num_threads
+
 cdef extern from "truncate.hpp":
     inline float bit_truncate_float(float val, float err) nogil
+    inline double bit_truncate_double(double val, double err) nogil
+
+ctypedef fused real_t:
+    float
+    double
+
+ctypedef fused wgt_t:
+    float
+    double
+
+ctypedef float complex complex64_t
+ctypedef double complex complex128_t
+
+ctypedef fused complex_t:
+    complex64_t
+    complex128_t
+
+# Number of threads the kernels use when `num_threads` is zero
+cdef int _default_threads = get_num_threads()
+
 
 def bit_truncate(float val, float err):
     return bit_truncate_float(val, err)
 
+def bit_truncate_64(double val, double err):
+    return bit_truncate_double(val, err)
+
 @cython.boundscheck(False)
 @cython.wraparound(False)
-def bit_truncate_weights(float[:] val, float[:] wgt, float fallback):
-    cdef int n = val.shape[0]
-    if val.ndim != 1:
-        raise ValueError("Input array must be 1-d.")
+def bit_truncate_weights(real_t[:] val, const wgt_t[:] wgt, double fallback, int num_threads=0):
+    cdef Py_ssize_t n = val.shape[0]
     if wgt.shape[0] != n:
         raise ValueError(
             "Weight and value arrays must have same "
-            "shape ({:d} != {:d})".format(wgt.shape, n)
+            "shape ({:d} != {:d})".format(wgt.shape[0], n)
         )
 
-    cdef int i = 0
+    cdef Py_ssize_t i = 0
+    # Single precision values use a single precision error, as in the
+    # original float32 only kernels
+    cdef float fallback_f = fallback
+
+    if num_threads <= 0:
+        num_threads = _default_threads
+
+    for i in prange(n, nogil=True, num_threads=num_threads):
+        if real_t is float:
+            if wgt[i] != 0:
+                val[i] = bit_truncate_float(val[i], 1. / wgt[i]**0.5)
+            else:
+                val[i] = bit_truncate_float(val[i], fabs(fallback_f * val[i]))
+        else:
+            if wgt[i] != 0:
+                val[i] = bit_truncate_double(val[i], 1. / wgt[i]**0.5)
+            else:
+                val[i] = bit_truncate_double(val[i], fabs(fallback * val[i]))
+
+    return np.asarray(val)
+
+@cython.boundscheck(False)
+@cython.wraparound(False)
+def bit_truncate_fixed(real_t[:] val, double prec, int num_threads=0):
+    cdef Py_ssize_t n = val.shape[0]
+    cdef Py_ssize_t i = 0
+    cdef float prec_f = prec
+
+    if num_threads <= 0:
+        num_threads = _default_threads
 
-    for i in prange(n, nogil=True):
-        if wgt[i] != 0:
-            val[i] = bit_truncate_float(val[i], 1. / wgt[i]**0.5)
+    for i in prange(n, nogil=True, num_threads=num_threads):
+        if real_t is float:
+            val[i] = bit_truncate_float(val[i], fabs(prec_f * val[i]))
         else:
-            val[i] = bit_truncate_float(val[i], fallback * val[i])
+            val[i] = bit_truncate_double(val[i], fabs(prec * val[i]))
 
     return np.asarray(val)
 
+def _slabs_3d(*arrs):
+    # Split arrays of the same shape into a list of matching 3D views. Leading
+    # axes are added to arrays with fewer dimensions. For more dimensions the
+    # leading axes are merged together if this can be done without a copy for
+    # all the arrays, and otherwise we recurse over the first axis.
+    arrs = [np.asarray(arr) for arr in arrs]
+    shape = arrs[0].shape
+
+    if len(shape) <= 3:
+        return [tuple(arr[(np.newaxis,) * (3 - len(shape))] for arr in arrs)]
+
+    try:
+        views = []
+        for arr in arrs:
+            view = arr.view()
+            view.shape = (-1,) + shape[-2:]
+            views.append(view)
+        return [tuple(views)]
+    except AttributeError:
+        pass
+
+    slabs = []
+    for i in range(shape[0]):
+        slabs += _slabs_3d(*[arr[i] for arr in arrs])
+    return slabs
+
+
+@cython.boundscheck(False)
+@cython.wraparound(False)
+def _truncate_real_weights(
+    real_t[:, :, :] val,
+    const wgt_t[:, :, :] wgt,
+    double scale,
+    double fallback,
+    int num_threads=0,
+):
+    cdef Py_ssize_t n0 = val.shape[0], n1 = val.shape[1], n2 = val.shape[2]
+    cdef Py_ssize_t ij, i, j, k
+    cdef double w
+    cdef float fallback_f = fallback
+
+    if num_threads <= 0:
+        num_threads = _default_threads
+
+    for ij in prange(n0 * n1, nogil=True, num_threads=num_threads):
+        i = ij // n1
+        j = ij % n1
+        for k in range(n2):
+            w = wgt[i, j, k] * scale
+            if real_t is float:
+                if w != 0:
+                    val[i, j, k] = bit_truncate_float(val[i, j, k], 1.0 / w**0.5)
+                else:
+                    val[i, j, k] = bit_truncate_float(
+                        val[i, j, k], fabs(fallback_f * val[i, j, k])
+                    )
+            else:
+                if w != 0:
+                    val[i, j, k] = bit_truncate_double(val[i, j, k], 1.0 / w**0.5)
+                else:
+                    val[i, j, k] = bit_truncate_double(
+                        val[i, j, k], fabs(fallback * val[i, j, k])
+                    )
+
+
+@cython.boundscheck(False)
+@cython.wraparound(False)
+def _truncate_real_fixed(real_t[:, :, :] val, double prec, int num_threads=0):
+    cdef Py_ssize_t n0 = val.shape[0], n1 = val.shape[1], n2 = val.shape[2]
+    cdef Py_ssize_t ij, i, j, k
+    cdef float prec_f = prec
+
+    if num_threads <= 0:
+        num_threads = _default_threads
+
+    for ij in prange(n0 * n1, nogil=True, num_threads=num_threads):
+        i = ij // n1
+        j = ij % n1
+        for k in range(n2):
+            if real_t is float:
+                val[i, j, k] = bit_truncate_float(
+                    val[i, j, k], fabs(prec_f * val[i, j, k])
+                )
+            else:
+                val[i, j, k] = bit_truncate_double(
+                    val[i, j, k], fabs(prec * val[i, j, k])
+                )
+
+
+@cython.boundscheck(False)
+@cython.wraparound(False)
+def _truncate_complex_weights(
+    complex_t[:, :, :] val,
+    const wgt_t[:, :, :] wgt,
+    double scale,
+    double fallback,
+    int num_threads=0,
+):
+    cdef Py_ssize_t n0 = val.shape[0], n1 = val.shape[1], n2 = val.shape[2]
+    cdef Py_ssize_t ij, i, j, k
+    cdef double w
+    cdef float fallback_f = fallback
+    cdef float * vf
+    cdef double * vd
+
+    if num_threads <= 0:
+        num_threads = _default_threads
+
+    for ij in prange(n0 * n1, nogil=True, num_threads=num_threads):
+        i = ij // n1
+        j = ij % n1
+        for k in range(n2):
+            w = wgt[i, j, k] * scale
+            # Operate on the real and imaginary parts interleaved in memory
+            if complex_t is complex64_t:
+                vf = <float *> &val[i, j, k]
+                if w != 0:
+                    vf[0] = bit_truncate_float(vf[0], 1.0 / w**0.5)
+                    vf[1] = bit_truncate_float(vf[1], 1.0 / w**0.5)
+                else:
+                    vf[0] = bit_truncate_float(vf[0], fabs(fallback_f * vf[0]))
+                    vf[1] = bit_truncate_float(vf[1], fabs(fallback_f * vf[1]))
+            else:
+                vd = <double *> &val[i, j, k]
+                if w != 0:
+                    vd[0] = bit_truncate_double(vd[0], 1.0 / w**0.5)
+                    vd[1] = bit_truncate_double(vd[1], 1.0 / w**0.5)
+                else:
+                    vd[0] = bit_truncate_double(vd[0], fabs(fallback * vd[0]))
+                    vd[1] = bit_truncate_double(vd[1], fabs(fallback * vd[1]))
+
+
 @cython.boundscheck(False)
 @cython.wraparound(False)
-def bit_truncate_fixed(float[:] val, float prec):
-    cdef int n = val.shape[0]
-    cdef int i = 0
+def _truncate_complex_fixed(complex_t[:, :, :] val, double prec, int num_threads=0):
+    cdef Py_ssize_t n0 = val.shape[0], n1 = val.shape[1], n2 = val.shape[2]
+    cdef Py_ssize_t ij, i, j, k
+    cdef float prec_f = prec
+    cdef float * vf
+    cdef double * vd
+
+    if num_threads <= 0:
+        num_threads = _default_threads
+
+    for ij in prange(n0 * n1, nogil=True, num_threads=num_threads):
+        i = ij // n1
+        j = ij % n1
+        for k in range(n2):
+            if complex_t is complex64_t:
+                vf = <float *> &val[i, j, k]
+                vf[0] = bit_truncate_float(vf[0], fabs(prec_f * vf[0]))
+                vf[1] = bit_truncate_float(vf[1], fabs(prec_f * vf[1]))
+            else:
+                vd = <double *> &val[i, j, k]
+                vd[0] = bit_truncate_double(vd[0], fabs(prec * vd[0]))
+                vd[1] = bit_truncate_double(vd[1], fabs(prec * vd[1]))
+
+
+# Map of the supported types to the real type of their components
+_REAL_TYPE = {
+    np.dtype(np.float32): np.float32,
+    np.dtype(np.float64): np.float64,
+    np.dtype(np.complex64): np.float32,
+    np.dtype(np.complex128): np.float64,
+}
+
+
+def _check_type(val):
+    if val.dtype not in _REAL_TYPE:
+        raise TypeError("Can not truncate arrays of type %s." % val.dtype)
+    return _REAL_TYPE[val.dtype]
+
+
+def truncate_weights(val, wgt, fallback, scale=1.0):
+    """Truncate an array in place, relative to inverse variance weights.
+
+    Each element (or the real and imaginary parts of each element) is
+    truncated with an error of `1 / sqrt(scale * wgt)`, in a single parallel
+    pass. Where the weight is zero, it is truncated to a relative precision of
+    `fallback`.
+
+    Parameters
+    ----------
+    val : np.ndarray
+        Array to truncate, of type float32, float64, complex64 or complex128.
+        Can be non-contiguous, but must be writeable.
+    wgt : np.ndarray
+        Inverse variance weights. Must be broadcastable against `val`. Weights
+        of type float32 or float64 are not copied.
+    fallback : float
+        Relative precision to use for zero weights.
+    scale : float, optional
+        Factor to multiply the weights by.
+
+    Returns
+    -------
+    val : np.ndarray
+        The truncated array (the same object as the input).
+    """
+    real_type = _check_type(val)
+
+    # Weights of either float type are used directly, whatever the type of
+    # the values
+    wgt = np.asarray(wgt)
+    if wgt.dtype not in (np.float32, np.float64):
+        wgt = wgt.astype(real_type)
+    wgt = np.broadcast_to(wgt, val.shape)
+
+    nt = autotune.num_threads("truncate", val.size)
+
+    if np.iscomplexobj(val):
+        kernel = _truncate_complex_weights
+    else:
+        kernel = _truncate_real_weights
+
+    for v, w in _slabs_3d(val, wgt):
+        kernel(v, w, scale, fallback, nt)
+
+    return val
+
+
+def truncate_fixed(val, prec):
+    """Truncate an array in place to a fixed relative precision.
+
+    Each element (or the real and imaginary parts of each element) is
+    truncated to a relative precision of `prec`, in a single parallel pass.
+
+    Parameters
+    ----------
+    val : np.ndarray
+        Array to truncate, of type float32, float64, complex64 or complex128.
+        Can be non-contiguous, but must be writeable.
+    prec : float
+        Relative precision to truncate to.
+
+    Returns
+    -------
+    val : np.ndarray
+        The truncated array (the same object as the input).
+    """
+    _check_type(val)
+
+    nt = autotune.num_threads("truncate", val.size)
+
+    kernel = _truncate_complex_fixed if np.iscomplexobj(val) else _truncate_real_fixed
+
+    for (v,) in _slabs_3d(val):
+        kernel(v, prec, nt)
+
+    return val
+
+
+def bit_truncate_complex_weights(val, wgt, float fallback, float scale=1.0):
+    """Truncate a complex array in place, relative to inverse variance weights.
+
+    See :func:`truncate_weights`.
+    """
+    if not np.iscomplexobj(val):
+        raise ValueError("Array must be complex (got %s)." % val.dtype)
+
+    return truncate_weights(val, wgt, fallback, scale)
+
+
+def bit_truncate_complex_fixed(val, float prec):
+    """Truncate a complex array in place to a fixed relative precision.
 
-    for i in range(n):
-        val[i] = bit_truncate_float(val[i], prec * val[i])
+    See :func:`truncate_fixed`.
+    """
+    if not np.iscomplexobj(val):
+        raise ValueError("Array must be complex (got %s)." % val.dtype)
 
-    return np.asarray(val)
\ No newline at end of file
+    return truncate_fixed(val, prec)
@@ -0,0 +1,137 @@
+"""Tests of applying per input gains to visibilities."""
+
+import itertools
+
+import numpy as np
+import pytest
+
+from draco.util import tools
+
+NINPUT = 6
+NPROD = NINPUT * (NINPUT + 1) // 2
+
+
+def _random(shape, dtype, seed=0):
+    rng = np.random.RandomState(seed)
+    arr = rng.standard_normal(shape)
+    if np.issubdtype(dtype, np.complexfloating):
+        arr = arr + 1.0j * rng.standard_normal(shape)
+    return arr.astype(dtype)
+
+
+def _reference(vis, gain, axis, prod_map=None):
+    # Apply the gains one product at a time in double precision
+    vis = np.moveaxis(vis, axis, 0).astype(np.complex128)
+    gain = np.moveaxis(gain, axis, 0).astype(np.complex128)
+
+    if prod_map is None:
+        prod_map = list(itertools.combinations_with_replacement(range(NINPUT), 2))
+
+    out = np.empty_like(vis)
+    for pp, (ii, ij) in enumerate(prod_map):
+        out[pp] = vis[pp] * gain[ii] * gain[ij].conj()
+
+    return np.moveaxis(out, 0, axis)
+
+
+def _rtol(dtype):
+    return 1e-5 if dtype in (np.float32, np.complex64) else 1e-12
+
+
+@pytest.mark.parametrize("vis_dtype", [np.complex64, np.complex128])
+@pytest.mark.parametrize(
+    "gain_dtype", [np.float32, np.float64, np.complex64, np.complex128]
+)
+def test_apply_gain_types(vis_dtype, gain_dtype):
+    vis = _random((4, NPROD, 5), vis_dtype)
+    gain = _random((4, NINPUT, 5), gain_dtype, seed=1)
+
+    out = tools.apply_gain(vis, gain)
+
+    assert out.dtype == vis_dtype
+    assert np.allclose(out, _reference(vis, gain, 1), rtol=_rtol(vis_dtype), atol=0)
+
+
+@pytest.mark.parametrize("dtype", [np.float32, np.float64])
+def test_apply_gain_real(dtype):
+    vis = _random((3, NPROD, 4), dtype)
+    gain = _random((3, NINPUT, 4), dtype, seed=1)
+
+    out = tools.apply_gain(vis, gain)
+
+    assert out.dtype == dtype
+    assert np.allclose(out, _reference(vis, gain, 1).real, rtol=_rtol(dtype), atol=0)
+
+
+@pytest.mark.parametrize("axis", [0, 1, 2, -1])
+def test_apply_gain_axis(axis):
+    shape = [3, 4, 5]
+    shape[axis] = NPROD
+    vis = _random(shape, np.complex128)
+    shape[axis] = NINPUT
+    gain = _random(shape, np.complex128, seed=1)
+
+    out = tools.apply_gain(vis, gain, axis=axis)
+
+    assert np.allclose(out, _reference(vis, gain, axis), rtol=1e-12, atol=0)
+
+
+@pytest.mark.parametrize("dtype", [np.complex64, np.complex128])
+def test_apply_gain_strided(dtype):
+    # Strided views of larger arrays, which can still be collapsed to 3D
+    vis_full = _random((4, NPROD, 10), dtype)
+    gain_full = _random((4, 2 * NINPUT, 10), dtype, seed=1)
+    vis = vis_full[::2, :, ::2]
+    gain = gain_full[::2, ::2, ::2]
+    assert not vis.flags.c_contiguous
+
+    # Write into a strided output too
+    out_full = np.zeros((4, NPROD, 10), dtype=dtype)
+    out = out_full[1::2, :, 1::2]
+    tools.apply_gain(vis, gain, out=out)
+
+    assert np.allclose(out, _reference(vis, gain, 1), rtol=_rtol(dtype), atol=0)
+    assert np.all(out_full[::2] == 0.0)
+
+
+def test_apply_gain_non_collapsible():
+    # A transposed view can't be collapsed without a copy, so falls back to
+    # the loop, and must give the same answer
+    vis = _random((5, NPROD, 3, 4), np.complex128).transpose(3, 1, 2, 0)
+    gain = _random((5, NINPUT, 3, 4), np.complex128, seed=1).transpose(3, 1, 2, 0)
+
+    out = tools.apply_gain(vis, gain)
+
+    assert np.allclose(out, _reference(vis, gain, 1), rtol=1e-12, atol=0)
+
+
+@pytest.mark.parametrize("dtype", [np.complex64, np.complex128])
+def test_apply_gain_in_place(dtype):
+    vis = _random((3, NPROD, 4), dtype)
+    gain = _random((3, NINPUT, 4), np.float64, seed=1)
+    expected = _reference(vis, gain, 1)
+
+    out = tools.apply_gain(vis, gain, out=vis)
+
+    assert out is vis
+    assert np.allclose(vis, expected, rtol=_rtol(dtype), atol=0)
+
+
+def test_apply_gain_prod_map():
+    # A subset of products, in a different order, given as a structured array
+    # as found in an index map
+    pairs = [(3, 1), (0, 0), (2, 5), (5, 5), (1, 4)]
+    prod_map = np.array(pairs, dtype=[("input_a", "<u2"), ("input_b", "<u2")])
+    vis = _random((3, len(pairs), 4), np.complex64)
+    gain = _random((3, NINPUT, 4), np.complex64, seed=1)
+
+    out = tools.apply_gain(vis, gain, prod_map=prod_map)
+    expected = _reference(vis, gain, 1, prod_map=pairs)
+    assert np.allclose(out, expected, rtol=1e-5, atol=0)
+
+    # And as a plain array of pairs
+    out = tools.apply_gain(vis, gain, prod_map=np.array(pairs))
+    assert np.allclose(out, expected, rtol=1e-5, atol=0)
+
+    with pytest.raises(ValueError):
+        tools.apply_gain(vis, gain, prod_map=prod_map[:-1])
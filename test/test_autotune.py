@@ -0,0 +1,153 @@
+"""Tests of the kernel thread count tuning table."""
+
+import json
+import os
+
+import pytest
+
+from draco.util import autotune
+
+
+@pytest.fixture
+def table_dir(tmpdir, monkeypatch):
+    # An empty table directory, and no tuning cached in this process
+    monkeypatch.setenv("DRACO_AUTOTUNE_DIR", str(tmpdir))
+    monkeypatch.delenv("DRACO_AUTOTUNE", raising=False)
+    monkeypatch.setattr(autotune, "_entries", {})
+    monkeypatch.setattr(autotune, "get_num_threads", lambda: 4)
+    return tmpdir
+
+
+def _table(max_threads=4, **kernels):
+    return {
+        "version": autotune.TABLE_VERSION,
+        "host": "test",
+        "max_threads": max_threads,
+        "kernels": {
+            name: {"sizes": [10, 1000, 100000], "threads": threads}
+            for name, threads in kernels.items()
+        },
+    }
+
+
+def test_table_path(table_dir):
+    path = autotune.table_path()
+    assert os.path.dirname(path) == str(table_dir)
+    assert os.path.basename(path).startswith("autotune_")
+
+
+def test_save_load_table(table_dir):
+    path = str(table_dir.join("sub", "table.json"))
+    table = _table(elementwise=[1, 2, 4])
+
+    autotune.save_table(table, path)
+    assert autotune.load_table(path) == table
+
+    # Overwriting leaves no temporary files behind
+    table["kernels"]["elementwise"]["threads"] = [1, 1, 4]
+    autotune.save_table(table, path)
+    assert autotune.load_table(path) == table
+    assert os.listdir(os.path.dirname(path)) == ["table.json"]
+
+
+def test_save_table_failure(table_dir):
+    path = str(table_dir.join("table.json"))
+    autotune.save_table(_table(elementwise=[1, 2, 4]), path)
+
+    # A table which can't be written leaves the old one in place
+    with pytest.raises(TypeError):
+        autotune.save_table({"version": object()}, path)
+
+    assert autotune.load_table(path) == _table(elementwise=[1, 2, 4])
+    assert os.listdir(str(table_dir)) == ["table.json"]
+
+
+@pytest.mark.parametrize(
+    "contents",
+    [
+        None,
+        "{not json",
+        "[1, 2, 3]",
+        json.dumps(dict(_table(), version=autotune.TABLE_VERSION + 1)),
+    ],
+)
+def test_load_table_invalid(table_dir, contents):
+    path = str(table_dir.join("table.json"))
+    if contents is not None:
+        with open(path, "w") as fh:
+            fh.write(contents)
+
+    assert autotune.load_table(path) is None
+
+
+def test_num_threads(table_dir):
+    autotune.save_table(_table(elementwise=[1, 2, 4]))
+
+    # The nearest tuned size on a log scale
+    assert autotune.num_threads("elementwise", 0) == 1
+    assert autotune.num_threads("elementwise", 50) == 1
+    assert autotune.num_threads("elementwise", 200) == 2
+    assert autotune.num_threads("elementwise", 10 ** 7) == 4
+
+
+def _no_tune(*args, **kwargs):
+    raise AssertionError("Kernels should not be tuned")
+
+
+def test_num_threads_fallback(table_dir, monkeypatch):
+    # Without a table, or when a kernel is missing from it, the default
+    # number of threads is used, and nothing is tuned unless asked for
+    monkeypatch.setattr(autotune, "tune", _no_tune)
+
+    assert autotune.num_threads("elementwise", 100) == 0
+
+    monkeypatch.setattr(autotune, "_entries", {})
+    autotune.save_table(_table(apply_gain=[1, 2, 4]))
+    assert autotune.num_threads("elementwise", 100) == 0
+    assert autotune.num_threads("apply_gain", 20) == 1
+
+
+def test_num_threads_changed(table_dir, monkeypatch):
+    # A table made with a different number of threads is ignored
+    monkeypatch.setattr(autotune, "tune", _no_tune)
+    autotune.save_table(_table(max_threads=8, elementwise=[1, 2, 8]))
+
+    assert autotune.num_threads("elementwise", 10 ** 7) == 0
+
+
+def test_num_threads_opt_in(table_dir, monkeypatch):
+    # With tuning asked for, a missing kernel is tuned once and saved
+    calls = []
+
+    def _tune(kernels, save=True):
+        calls.append(kernels)
+        return _table(**{kernels[0]: [2, 2, 4]})
+
+    monkeypatch.setattr(autotune, "tune", _tune)
+    monkeypatch.setenv("DRACO_AUTOTUNE", "on")
+
+    assert autotune.num_threads("elementwise", 100) == 2
+    assert autotune.num_threads("elementwise", 10 ** 7) == 4
+    assert calls == [["elementwise"]]
+
+    assert autotune.load_table()["kernels"]["elementwise"]["threads"] == [2, 2, 4]
+
+    # Not with a single thread
+    monkeypatch.setattr(autotune, "_entries", {})
+    monkeypatch.setattr(autotune, "get_num_threads", lambda: 1)
+    assert autotune.num_threads("apply_gain", 100) == 0
+    assert len(calls) == 1
+
+
+def test_tune(table_dir):
+    path = str(table_dir.join("table.json"))
+
+    table = autotune.tune(["elementwise"], sizes=[16, 256], threads=[1, 2], path=path)
+
+    entry = table["kernels"]["elementwise"]
+    assert entry["sizes"] == [16, 256]
+    assert all(nt in (1, 2) for nt in entry["threads"])
+    assert autotune.load_table(path) == table
+
+    with pytest.raises(ValueError):
+        autotune.tune(["unknown"], path=path)
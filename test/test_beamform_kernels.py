@@ -0,0 +1,140 @@
+"""Tests of the kernels fringestopping and summing visibilities over products."""
+
+import numpy as np
+import pytest
+
+from draco.util._fast_tools import beamform, beamform_separable
+
+DEC, LAT = 0.6, 0.85
+
+
+def _cylinder(ncyl=3, nfeed=8, nfreq=4, nra=16, seed=0):
+    # Stacked baselines of a cylinder telescope, whose EW and NS components
+    # each take only a few distinct values
+    du, dv = np.meshgrid(
+        np.arange(ncyl) * 22.0, np.arange(-nfeed + 1, nfeed) * 0.3, indexing="ij"
+    )
+    baselines = np.array([du.ravel(), dv.ravel()])
+    nprod = baselines.shape[1]
+
+    wavenumber = np.linspace(800.0, 400.0, nfreq)[:, np.newaxis] * 1e6 / 3e8
+    rng = np.random.RandomState(seed)
+    vis = rng.standard_normal((nfreq, nra, nprod)) + 1.0j * rng.standard_normal(
+        (nfreq, nra, nprod)
+    )
+    weight = rng.uniform(0.0, 3.0, size=(nfreq, nra, nprod))
+
+    return baselines, wavenumber, vis, weight
+
+
+def _separable(baselines, wavenumber):
+    u, u_index = np.unique(baselines[0], return_inverse=True)
+    v, v_index = np.unique(baselines[1], return_inverse=True)
+    return (
+        np.ascontiguousarray(u[np.newaxis, :] * wavenumber),
+        np.ascontiguousarray(v[np.newaxis, :] * wavenumber),
+        u_index.astype(np.intp),
+        v_index.astype(np.intp),
+    )
+
+
+def _reference(vis, weight, ha, u, v, f_index, ra_index):
+    # Fringestop with the phase of each product directly
+    ut = 2.0 * np.pi * np.cos(DEC) * np.sin(ha)
+    vt = (
+        -2.0
+        * np.pi
+        * (np.cos(LAT) * np.sin(DEC) - np.sin(LAT) * np.cos(DEC) * np.cos(ha))
+    )
+
+    out = np.zeros((vis.shape[0], len(ra_index)))
+    for fi in f_index:
+        phase = u[fi, np.newaxis, :] * ut[:, np.newaxis]
+        phase += v[fi, np.newaxis, :] * vt[:, np.newaxis]
+        out[fi] = np.sum(
+            weight[fi, ra_index] * (vis[fi, ra_index] * np.exp(1.0j * phase)).real,
+            axis=-1,
+        )
+    return out
+
+
+def _args(nra, nha, nfreq):
+    ha = np.linspace(-0.2, 0.2, nha)
+    f_index = np.arange(0, nfreq, 2, dtype=np.int32)
+    ra_index = np.arange(nra // 4, nra // 4 + nha, dtype=np.int32)
+    return ha, f_index, ra_index
+
+
+@pytest.mark.parametrize("vis_dtype", [np.complex64, np.complex128])
+@pytest.mark.parametrize("weight_dtype", [np.float32, np.float64])
+def test_separable_matches_direct(vis_dtype, weight_dtype):
+    baselines, wavenumber, vis, weight = _cylinder()
+    vis, weight = vis.astype(vis_dtype), weight.astype(weight_dtype)
+    ha, f_index, ra_index = _args(vis.shape[1], 7, vis.shape[0])
+
+    u = np.ascontiguousarray(baselines[0] * wavenumber)
+    v = np.ascontiguousarray(baselines[1] * wavenumber)
+    args = (DEC, LAT, np.cos(ha), np.sin(ha))
+
+    direct = beamform(vis, weight, *args, u, v, f_index, ra_index)
+    separable = beamform_separable(
+        vis, weight, *args, *_separable(baselines, wavenumber), f_index, ra_index
+    )
+    expected = _reference(vis, weight, ha, u, v, f_index, ra_index)
+
+    assert np.allclose(direct, expected, rtol=1e-10, atol=1e-10)
+    assert np.allclose(separable, direct, rtol=1e-10, atol=1e-10)
+
+    # Frequencies not processed are zero
+    assert np.all(separable[1::2] == 0.0) and np.all(direct[1::2] == 0.0)
+
+
+def test_separable_strided():
+    # Strided views of the visibilities and weights give the same answer
+    baselines, wavenumber, vis, weight = _cylinder()
+    ha, f_index, ra_index = _args(vis.shape[1], 5, vis.shape[0])
+    sep = _separable(baselines, wavenumber)
+    args = (DEC, LAT, np.cos(ha), np.sin(ha))
+
+    vis_full = np.zeros(vis.shape[:2] + (2 * vis.shape[2],), dtype=vis.dtype)
+    vis_full[..., ::2] = vis
+    weight_t = np.ascontiguousarray(weight.transpose(2, 1, 0)).transpose(2, 1, 0)
+
+    expected = beamform_separable(vis, weight, *args, *sep, f_index, ra_index)
+    result = beamform_separable(
+        vis_full[..., ::2], weight_t, *args, *sep, f_index, ra_index
+    )
+
+    assert np.allclose(result, expected, rtol=1e-12, atol=1e-12)
+
+
+@pytest.mark.parametrize("num_threads", [1, 2])
+def test_separable_threads(num_threads):
+    baselines, wavenumber, vis, weight = _cylinder()
+    ha, f_index, ra_index = _args(vis.shape[1], 7, vis.shape[0])
+    sep = _separable(baselines, wavenumber)
+    args = (DEC, LAT, np.cos(ha), np.sin(ha))
+
+    expected = beamform_separable(vis, weight, *args, *sep, f_index, ra_index)
+    result = beamform_separable(
+        vis, weight, *args, *sep, f_index, ra_index, num_threads=num_threads
+    )
+
+    assert np.array_equal(result, expected)
+
+
+def test_separable_bad_index():
+    baselines, wavenumber, vis, weight = _cylinder()
+    ha, f_index, ra_index = _args(vis.shape[1], 3, vis.shape[0])
+    u, v, u_index, v_index = _separable(baselines, wavenumber)
+    args = (DEC, LAT, np.cos(ha), np.sin(ha))
+
+    with pytest.raises(ValueError, match="out of bounds"):
+        beamform_separable(
+            vis, weight, *args, u, v, u_index + u.shape[1], v_index, f_index, ra_index
+        )
+
+    with pytest.raises(ValueError, match="number of products"):
+        beamform_separable(
+            vis, weight, *args, u, v, u_index[1:], v_index, f_index, ra_index
+        )
@@ -0,0 +1,170 @@
+"""Tests of the memory budgeted LRU cache."""
+
+import threading
+
+import numpy as np
+import pytest
+
+from draco.util import cache
+
+
+def _arr(nbytes, fill=0):
+    return np.full(nbytes, fill, dtype=np.uint8)
+
+
+def test_eviction_order():
+    c = cache.LRUCache(300)
+    for key in "abc":
+        c.put(key, _arr(100))
+
+    # Use `a` so that `b` is now the least recently used
+    c.lookup("a")
+    c.put("d", _arr(100))
+
+    assert "b" not in c
+    assert all(key in c for key in "acd")
+
+    # Loading through `get_or_load` also counts as a use
+    c.get_or_load("c", lambda: None)
+    c.put("e", _arr(100))
+    assert "a" not in c
+    assert all(key in c for key in "cde")
+
+
+def test_byte_budget():
+    c = cache.LRUCache(250)
+
+    c.put("a", _arr(100))
+    c.put("b", (_arr(50), [_arr(50), _arr(20)]))
+    assert c.nbytes == 220
+
+    c.put("c", _arr(100))
+    assert c.nbytes <= 250
+    assert "a" not in c and "b" in c and "c" in c
+
+    # Values larger than the whole budget are not cached at all
+    c.put("big", _arr(300))
+    assert "big" not in c
+    assert c.nbytes == 220
+
+    # Replacing an entry doesn't double count it
+    c.put("c", _arr(10))
+    assert c.nbytes == 130
+
+    c.resize(100)
+    assert c.nbytes <= 100
+    assert "c" in c and "b" not in c
+
+    c.clear()
+    assert c.nbytes == 0 and len(c) == 0
+
+
+def test_values_read_only():
+    c = cache.LRUCache(1000)
+
+    value = (_arr(10), [_arr(10)])
+    c.put("a", value)
+
+    for arr in [value[0], value[1][0], c.lookup("a")[0], c.get_or_load("a", None)[0]]:
+        assert not arr.flags.writeable
+        with pytest.raises(ValueError):
+            arr[0] = 1
+
+    # Loaded values are read only too
+    loaded = c.get_or_load("b", lambda: _arr(10))
+    assert not loaded.flags.writeable
+
+    # Unless they were too big to cache
+    loaded = c.get_or_load("c", lambda: _arr(2000))
+    assert loaded.flags.writeable
+
+
+def test_get_or_load_concurrent():
+    c = cache.LRUCache(1000)
+
+    started = threading.Event()
+    release = threading.Event()
+    calls = []
+
+    def _loader():
+        calls.append(threading.current_thread().name)
+        started.set()
+        release.wait()
+        return _arr(10, fill=7)
+
+    results = {}
+
+    def _get(name):
+        results[name] = c.get_or_load("key", _loader)
+
+    first = threading.Thread(target=_get, args=("first",), name="first")
+    first.start()
+    started.wait()
+
+    # The second thread must wait for the first to finish loading
+    second = threading.Thread(target=_get, args=("second",), name="second")
+    second.start()
+    second.join(0.1)
+    assert second.is_alive()
+
+    release.set()
+    first.join()
+    second.join()
+
+    assert calls == ["first"]
+    assert results["first"] is results["second"]
+    assert c.stats()["misses"] == 1
+    assert c.stats()["hits"] == 1
+
+
+def test_get_or_load_exception():
+    c = cache.LRUCache(1000)
+
+    started = threading.Event()
+    release = threading.Event()
+    errors = []
+
+    def _bad_loader():
+        started.set()
+        release.wait()
+        raise IOError("failed")
+
+    def _get_bad():
+        try:
+            c.get_or_load("key", _bad_loader)
+        except IOError as e:
+            errors.append(e)
+
+    results = []
+
+    first = threading.Thread(target=_get_bad)
+    first.start()
+    started.wait()
+
+    # A thread waiting on the failed load tries again itself
+    second = threading.Thread(
+        target=lambda: results.append(c.get_or_load("key", lambda: _arr(10, 3)))
+    )
+    second.start()
+    second.join(0.1)
+    assert second.is_alive()
+
+    release.set()
+    first.join()
+    second.join()
+
+    assert len(errors) == 1
+    assert np.all(results[0] == 3)
+    assert "key" in c
+    assert not c._loading
+
+
+def test_global_cache_default(monkeypatch):
+    monkeypatch.setattr(cache, "_global_cache", None)
+
+    gc = cache.global_cache()
+    assert gc.max_bytes == cache.DEFAULT_MAX_BYTES
+    assert cache.global_cache() is gc
+
+    cache.global_cache(100)
+    assert gc.max_bytes == 100
@@ -0,0 +1,100 @@
+"""Tests of the memory mappable container cache."""
+
+import os
+
+import numpy as np
+import pytest
+
+pytest.importorskip("caput.memh5")
+
+from draco.core import containers, io
+
+
+def _make_stream():
+    ss = containers.SiderealStream(
+        freq=np.linspace(800.0, 400.0, 4), input=3, ra=8, distributed=True
+    )
+    rng = np.random.RandomState(0)
+    ss.vis[:] = rng.standard_normal(ss.vis.local_shape) + 1.0j * rng.standard_normal(
+        ss.vis.local_shape
+    )
+    ss.weight[:] = rng.uniform(size=ss.weight.local_shape)
+    ss.input_flags[:] = rng.uniform(size=ss.input_flags.shape)
+    ss.attrs["tag"] = "cache_test"
+    ss.vis.attrs["units"] = "Jy"
+    return ss
+
+
+def _assert_containers_equal(a, b):
+    assert type(a) is type(b)
+    assert set(a.datasets) == set(b.datasets)
+
+    for name, dset in a.datasets.items():
+        assert np.array_equal(
+            dset[:].view(np.ndarray), b.datasets[name][:].view(np.ndarray)
+        )
+        assert dset.dtype == b.datasets[name].dtype
+        assert dict(dset.attrs).get("units") == dict(b.datasets[name].attrs).get(
+            "units"
+        )
+
+    for name, imap in a.index_map.items():
+        assert np.array_equal(imap[:], b.index_map[name][:])
+
+    assert a.attrs["tag"] == b.attrs["tag"]
+
+
+def test_cache_round_trip(tmpdir):
+    ss = _make_stream()
+    cache = str(tmpdir.join("ss_cache"))
+
+    ss.to_cache(cache)
+    loaded = containers.ContainerBase.from_cache(cache, comm=ss.comm)
+
+    _assert_containers_equal(ss, loaded)
+
+
+def test_cache_is_copy_on_write(tmpdir):
+    ss = _make_stream()
+    cache = str(tmpdir.join("ss_cache"))
+    ss.to_cache(cache)
+
+    loaded = containers.ContainerBase.from_cache(cache, comm=ss.comm)
+    loaded.vis[:] = 0.0
+    loaded.input_flags[:] = 0.0
+
+    # Writes to the loaded container must not reach the cache on disk
+    reloaded = containers.ContainerBase.from_cache(cache, comm=ss.comm)
+    _assert_containers_equal(ss, reloaded)
+
+
+def test_load_cached_files_stale(tmpdir):
+    ss = _make_stream()
+    fname = str(tmpdir.join("ss.h5"))
+    ss.save(fname)
+
+    def _load():
+        task = io.LoadCachedFiles()
+        task.read_config({"files": [fname], "cache_dir": str(tmpdir.join("cache"))})
+        return task.process()
+
+    # First load writes the cache
+    _assert_containers_equal(ss, _load())
+    assert len(os.listdir(str(tmpdir.join("cache")))) == 1
+
+    # Rewrite the source file with different data, and make sure it is newer
+    # than the cache, so the stale cache is not used
+    ss.vis[:] *= 2.0
+    ss.save(fname)
+    cache = os.path.join(
+        str(tmpdir.join("cache")), os.listdir(str(tmpdir.join("cache")))[0]
+    )
+    meta = os.path.join(cache, "meta.h5")
+    mtime = os.path.getmtime(meta)
+    os.utime(fname, (mtime + 10, mtime + 10))
+
+    _assert_containers_equal(ss, _load())
+
+    # The cache was refreshed, so now loads from it give the new data too
+    os.utime(fname, (mtime, mtime))
+    _assert_containers_equal(ss, _load())
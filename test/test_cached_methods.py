@@ -0,0 +1,151 @@
+"""Tests of the cached m-indexed methods and their prefetching."""
+
+import threading
+
+import numpy as np
+import pytest
+
+pytest.importorskip("caput.config")
+
+from draco.core import io
+from draco.util import cache
+
+
+class _Products(object):
+    # Stands in for a BeamTransfer, with per m matrices for 4 frequencies
+    nfreq = 4
+
+    def __init__(self, size=8, fail=()):
+        self.size = size
+        self.fail = fail
+        self.calls = []
+        self.lock = threading.Lock()
+
+    def beam_m(self, mi, fi=None):
+        with self.lock:
+            self.calls.append((mi, fi))
+        if mi in self.fail:
+            raise IOError("failed to read m=%i" % mi)
+        full = (
+            np.arange(self.nfreq * self.size, dtype=np.float64).reshape(self.nfreq, -1)
+            + 1000 * mi
+        )
+        return full if fi is None else full[fi]
+
+    def project(self, mi):
+        # Uses another method internally, like the projection routines
+        return self.beam_m(mi).sum()
+
+
+@pytest.fixture
+def fresh_cache(monkeypatch):
+    monkeypatch.setattr(cache, "_global_cache", None)
+    return cache.global_cache(10**6)
+
+
+def test_cache_methods_wraps(fresh_cache):
+    obj = _Products()
+    cached = io.cache_methods(obj, ["beam_m", "missing"], freq_arg="fi")
+
+    # The original object is left untouched
+    assert "beam_m" not in obj.__dict__
+    assert isinstance(cached, _Products)
+    assert cached is not obj
+    assert isinstance(cached.beam_m, io._CachedMethod)
+
+    # Internal calls on the copy go through the cache
+    cached.project(1)
+    cached.project(1)
+    assert obj.calls == [(1, None)]
+
+
+def test_cached_method_keys(fresh_cache):
+    obj = _Products()
+    cached = io.cache_methods(obj, ["beam_m"], tag="products", freq_arg="fi")
+    method = cached.beam_m
+
+    # Equivalent calls share a key
+    key = method._key(2, (1,), {})
+    assert key == method._key(2, (), {"fi": 1})
+    assert key[:2] == ("products", "beam_m")
+    assert key != method._key(2, (), {"fi": 0})
+    assert key != method._key(3, (1,), {})
+    assert method._key(2, (), {}) == method._key(2, (None,), {})
+
+    # A call for a single frequency is served from the full value if cached
+    full = cached.beam_m(2)
+    assert np.array_equal(cached.beam_m(2, fi=3), full[3])
+    assert np.array_equal(cached.beam_m(2, 1), full[1])
+    assert obj.calls == [(2, None)]
+
+    # But loaded on its own otherwise
+    cached.beam_m(5, fi=1)
+    assert obj.calls[-1] == (5, 1)
+
+
+def test_cached_method_copies(fresh_cache):
+    cached = io.cache_methods(_Products(), ["beam_m"])
+    value = cached.beam_m(0)
+    value[:] = -1
+    assert np.all(cached.beam_m(0) >= 0)
+
+    cached = io.cache_methods(_Products(), ["beam_m"], copy=False)
+    assert not cached.beam_m(0).flags.writeable
+
+
+def test_prefetch_m_order(fresh_cache):
+    obj = _Products()
+    cached = io.cache_methods(obj, ["beam_m"], freq_arg="fi")
+
+    items = [(0, 3), (1, 5), (2, 4)]
+    seen = []
+    for li, mi in io.prefetch_m(items, cached.beam_m):
+        seen.append((li, mi))
+
+        # The current m is held, and the next one is loaded at most
+        assert set(k[2] for k in cached.beam_m.prefetched) <= {mi} | set(
+            m for _, m in items[li + 1 : li + 2]
+        )
+
+        for fi in range(obj.nfreq):
+            cached.beam_m(mi, fi=fi)
+
+    assert seen == items
+
+    # Each m is read once, in order, and everything is released at the end
+    assert obj.calls == [(3, None), (5, None), (4, None)]
+    assert cached.beam_m.prefetched == {}
+
+
+def test_prefetch_m_exception(fresh_cache):
+    obj = _Products(fail=(5,))
+    cached = io.cache_methods(obj, ["beam_m"])
+
+    seen = []
+    with pytest.raises(IOError, match="m=5"):
+        for mi in io.prefetch_m([3, 5, 4], cached.beam_m):
+            seen.append(mi)
+
+    assert seen == [3]
+    assert cached.beam_m.prefetched == {}
+
+
+def test_prefetch_m_memory_limit(fresh_cache):
+    nbytes = 4 * 8 * 8
+
+    # Two m's don't fit, so there is no reading ahead
+    obj = _Products(size=8)
+    cached = io.cache_methods(obj, ["beam_m"], tag="small")
+    ms = list(io.prefetch_m([0, 1, 2], cached.beam_m, max_bytes=nbytes))
+    assert ms == [0, 1, 2]
+    assert [m for m, _ in obj.calls] == [0]
+
+    # But with room for two they are
+    obj = _Products(size=8)
+    cached = io.cache_methods(obj, ["beam_m"], tag="large")
+    ms = list(io.prefetch_m([0, 1, 2], cached.beam_m, max_bytes=2 * nbytes))
+    assert ms == [0, 1, 2]
+    assert [m for m, _ in obj.calls] == [0, 1, 2]
+
+    with pytest.raises(TypeError):
+        list(io.prefetch_m([0], cached.beam_m, bad=1))
@@ -0,0 +1,132 @@
+"""Tests of the threaded direct chunk reads and writes."""
+
+import numpy as np
+import pytest
+
+h5py = pytest.importorskip("h5py")
+bitshuffle_h5 = pytest.importorskip("bitshuffle.h5")
+
+from draco.util import chunkio
+
+
+def _create(f, name, shape, dtype, chunks):
+    return f.create_dataset(
+        name,
+        shape=shape,
+        dtype=dtype,
+        chunks=chunks,
+        compression=bitshuffle_h5.H5FILTER,
+        compression_opts=(0, bitshuffle_h5.H5_COMPRESS_LZ4),
+    )
+
+
+def _data(shape, dtype, seed=0):
+    rng = np.random.RandomState(seed)
+    data = rng.poisson(20.0, size=shape) + 1.0j * rng.poisson(20.0, size=shape)
+    return (
+        data.astype(dtype) if np.dtype(dtype).kind == "c" else data.real.astype(dtype)
+    )
+
+
+def _slabs(n, nranks):
+    sizes = [n // nranks + (1 if ri < n % nranks else 0) for ri in range(nranks)]
+    starts = np.cumsum([0] + sizes[:-1])
+    return list(zip(starts, sizes))
+
+
+@pytest.mark.parametrize("dtype", [np.float32, np.complex64, np.float64])
+def test_write_chunks_matches_filter(tmpdir, dtype):
+    # Chunks that don't divide the shape, so there are partial edge chunks
+    shape, chunks = (37, 11, 9), (8, 4, 9)
+    data = _data(shape, dtype)
+
+    with h5py.File(str(tmpdir.join("test.h5")), "w") as f:
+        direct = _create(f, "direct", shape, dtype, chunks)
+        filtered = _create(f, "filtered", shape, dtype, chunks)
+
+        assert chunkio.is_bitshuffle_lz4(direct)
+
+        chunkio.write_chunks(direct, data, num_threads=3)
+        filtered[:] = data
+
+    with h5py.File(str(tmpdir.join("test.h5")), "r") as f:
+        # Read back through the normal HDF5 filter pipeline
+        assert np.array_equal(f["direct"][:], data)
+
+        # The raw chunks are byte for byte what the filter itself writes
+        for offset in chunkio._chunk_grid(chunks, (0, 0, 0), shape):
+            mask_d, buf_d = f["direct"].id.read_direct_chunk(offset)
+            mask_f, buf_f = f["filtered"].id.read_direct_chunk(offset)
+            assert mask_d == mask_f == 0
+            assert buf_d == buf_f, offset
+
+
+@pytest.mark.parametrize("nranks", [2, 3, 5])
+def test_write_chunks_split_between_ranks(tmpdir, nranks):
+    # Write the slabs of several ranks in turn, as `to_hdf5_threaded` does,
+    # such that some chunks straddle two (or more) slabs
+    shape, chunks = (41, 6, 5), (8, 6, 5)
+    data = _data(shape, np.complex64, seed=1)
+
+    fname = str(tmpdir.join("test.h5"))
+    with h5py.File(fname, "w") as f:
+        _create(f, "vis", shape, np.complex64, chunks)
+
+    for start, size in _slabs(shape[0], nranks):
+        with h5py.File(fname, "r+") as f:
+            chunkio.write_chunks(
+                f["vis"], data[start : start + size], (start, 0, 0), num_threads=2
+            )
+
+    with h5py.File(fname, "r") as f:
+        assert np.array_equal(f["vis"][:], data)
+
+
+def test_write_chunks_transform(tmpdir):
+    shape, chunks = (20, 7), (6, 7)
+    data = _data(shape, np.float32, seed=2)
+    sels = []
+
+    def _func(part, sel):
+        sels.append(sel)
+        part *= 2
+
+    with h5py.File(str(tmpdir.join("test.h5")), "w") as f:
+        dset = _create(f, "data", shape, np.float32, chunks)
+        chunkio.write_chunks(dset, data[3:], (3, 0), num_threads=2, func=_func)
+
+        # The transform is applied to copies, leaving the input untouched
+        assert np.array_equal(dset[3:], 2 * data[3:])
+        assert np.all(dset[:3] == 0)
+        assert np.array_equal(data, _data(shape, np.float32, seed=2))
+
+    assert sum(s[0].stop - s[0].start for s in sels) == shape[0] - 3
+
+
+@pytest.mark.parametrize("nranks", [1, 3, 4])
+def test_read_chunks_along_axis(tmpdir, nranks):
+    # Read slabs along the last axis, which don't line up with the chunks
+    shape, chunks = (9, 5, 23), (4, 5, 6)
+    data = _data(shape, np.complex64, seed=3)
+
+    with h5py.File(str(tmpdir.join("test.h5")), "w") as f:
+        _create(f, "vis", shape, np.complex64, chunks)[:] = data
+
+    with h5py.File(str(tmpdir.join("test.h5")), "r") as f:
+        for start, size in _slabs(shape[2], nranks):
+            out = np.empty(shape[:2] + (size,), dtype=np.complex64)
+            chunkio.read_chunks(f["vis"], out, (0, 0, start), num_threads=2)
+            assert np.array_equal(out, data[:, :, start : start + size])
+
+
+def test_read_chunks_unwritten(tmpdir):
+    shape, chunks = (10, 4), (3, 4)
+
+    with h5py.File(str(tmpdir.join("test.h5")), "w") as f:
+        dset = _create(f, "data", shape, np.float32, chunks)
+        dset[:3] = 1.0
+
+    with h5py.File(str(tmpdir.join("test.h5")), "r") as f:
+        out = np.empty(shape, dtype=np.float32)
+        chunkio.read_chunks(f["data"], out, num_threads=2)
+        assert np.array_equal(out, f["data"][:])
@@ -0,0 +1,89 @@
+"""Tests of copy-on-write container clones."""
+
+import gc
+
+import numpy as np
+import pytest
+
+pytest.importorskip("caput.memh5")
+
+from draco.core import containers
+
+
+def _make_stream():
+    ss = containers.SiderealStream(
+        freq=np.linspace(800.0, 400.0, 4), input=3, ra=8, distributed=True
+    )
+    ss.vis[:] = np.arange(ss.vis.local_array.size).reshape(ss.vis.local_shape)
+    ss.weight[:] = 1.0
+    ss.input_flags[:] = 1.0
+    return ss
+
+
+def test_clone_shares_buffers():
+    ss = _make_stream()
+    clone = ss.cow_copy()
+
+    assert np.shares_memory(ss.vis[:], clone.vis[:])
+    assert np.array_equal(ss.vis[:], clone.vis[:])
+    assert type(clone) is type(ss)
+
+
+def test_original_is_read_only_while_shared():
+    ss = _make_stream()
+    expected = ss.vis[:].copy()
+    clone = ss.cow_copy()
+
+    # Writes to either container must fail rather than leak into the other
+    with pytest.raises(ValueError):
+        ss.vis[:] = 0.0
+    with pytest.raises(ValueError):
+        clone.vis[:] = 0.0
+
+    assert np.array_equal(clone.vis[:], expected)
+    assert np.array_equal(ss.vis[:], expected)
+
+
+def test_clone_does_not_see_original_writes():
+    ss = _make_stream()
+    expected = ss.vis[:].copy()
+    clone = ss.cow_copy()
+
+    ss.ensure_writeable()
+    ss.vis[:] = 0.0
+    ss.input_flags[:] = 0.0
+
+    assert np.array_equal(clone.vis[:], expected)
+    assert np.all(clone.input_flags[:] == 1.0)
+    assert not np.shares_memory(ss.vis[:], clone.vis[:])
+
+
+def test_original_does_not_see_clone_writes():
+    ss = _make_stream()
+    expected = ss.vis[:].copy()
+    clone = ss.cow_copy()
+
+    clone.ensure_writeable(["vis"])
+    clone.vis[:] = 0.0
+
+    assert np.array_equal(ss.vis[:], expected)
+
+    # The unshared dataset is writeable in place again in the original, but
+    # the others are still shared
+    ss.vis[:] = 1.0
+    with pytest.raises(ValueError):
+        ss.weight[:] = 0.0
+
+
+def test_last_holder_is_writeable():
+    ss = _make_stream()
+    vis = ss.vis[:]
+    clone = ss.cow_copy()
+
+    del clone
+    gc.collect()
+
+    # Only one container left, so it writes in place without a copy
+    ss.vis[:] = 2.0
+    assert np.shares_memory(ss.vis[:], vis)
+    assert np.all(vis == 2.0)
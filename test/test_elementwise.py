@@ -0,0 +1,147 @@
+"""Tests of the fused elementwise accumulation and division routines."""
+
+import numpy as np
+import pytest
+
+from draco.util import tools
+
+VIS_TYPES = [np.complex64, np.complex128, np.float32, np.float64]
+WEIGHT_TYPES = [np.float32, np.float64]
+
+
+def _random(shape, dtype, seed=0):
+    rng = np.random.RandomState(seed)
+    arr = rng.standard_normal(shape)
+    if np.issubdtype(dtype, np.complexfloating):
+        arr = arr + 1.0j * rng.standard_normal(shape)
+    return arr.astype(dtype)
+
+
+def _weights(shape, dtype, seed=1):
+    # Positive weights with some zeros
+    w = np.random.RandomState(seed).uniform(0.5, 2.0, size=shape)
+    w.flat[::7] = 0.0
+    return w.astype(dtype)
+
+
+def _rtol(dtype):
+    return 1e-6 if dtype in (np.float32, np.complex64) else 1e-14
+
+
+@pytest.mark.parametrize("vis_dtype", VIS_TYPES)
+@pytest.mark.parametrize("weight_dtype", WEIGHT_TYPES)
+def test_weighted_accumulate(vis_dtype, weight_dtype):
+    shape = (4, 5, 6)
+    acc_v = _random(shape, vis_dtype, seed=2)
+    acc_w = _weights(shape, weight_dtype, seed=3)
+    v = _random(shape, vis_dtype)
+    w = _weights(shape, weight_dtype)
+
+    expected_v = acc_v + v * w
+    expected_w = acc_w + w
+
+    tools.weighted_accumulate(acc_v, acc_w, v, w)
+
+    assert acc_v.dtype == vis_dtype and acc_w.dtype == weight_dtype
+    assert np.allclose(acc_v, expected_v, rtol=_rtol(vis_dtype), atol=0)
+    assert np.array_equal(acc_w, expected_w)
+
+
+@pytest.mark.parametrize("vis_dtype", [np.complex64, np.complex128])
+@pytest.mark.parametrize("weight_dtype", WEIGHT_TYPES)
+def test_weighted_accumulate_strided(vis_dtype, weight_dtype):
+    # Strided views can't use the kernel, but must give the same answer, and
+    # only modify the viewed elements
+    acc_v_full = _random((4, 10), vis_dtype, seed=2)
+    acc_w_full = _weights((4, 10), weight_dtype, seed=3)
+    acc_v, acc_w = acc_v_full[:, ::2], acc_w_full[:, ::2]
+    v = _random((4, 10), vis_dtype)[:, 1::2]
+    w = _weights((5, 4), weight_dtype).T
+
+    expected_v = acc_v_full.copy()
+    expected_v[:, ::2] += v * w
+    expected_w = acc_w_full.copy()
+    expected_w[:, ::2] += w
+
+    tools.weighted_accumulate(acc_v, acc_w, v, w)
+
+    assert np.allclose(acc_v_full, expected_v, rtol=_rtol(vis_dtype), atol=0)
+    assert np.array_equal(acc_w_full, expected_w)
+
+
+def test_weighted_accumulate_broadcast():
+    # Weights broadcast against the values use the fallback
+    acc_v = np.zeros((3, 4), dtype=np.complex64)
+    acc_w = np.zeros((3, 4), dtype=np.float32)
+    v = _random((3, 4), np.complex64)
+    w = np.array([1.0, 2.0, 0.0, 3.0], dtype=np.float32)
+
+    tools.weighted_accumulate(acc_v, acc_w, v, w)
+
+    assert np.allclose(acc_v, v * w, rtol=1e-6, atol=0)
+    assert np.array_equal(acc_w, np.broadcast_to(w, (3, 4)))
+
+
+@pytest.mark.parametrize("vis_dtype", VIS_TYPES)
+@pytest.mark.parametrize("weight_dtype", WEIGHT_TYPES)
+def test_divide_no_zero(vis_dtype, weight_dtype):
+    a = _random((5, 6), vis_dtype)
+    b = _weights((5, 6), weight_dtype)
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        expected = np.where(b == 0, 0.0, a / b)
+
+    result = tools.divide_no_zero(a, b)
+
+    assert result.dtype == vis_dtype
+    assert np.allclose(result, expected, rtol=_rtol(vis_dtype), atol=0)
+    assert np.all(result[b == 0] == 0.0)
+
+    # In place
+    out = tools.divide_no_zero(a, b, out=a)
+    assert out is a
+    assert np.allclose(a, expected, rtol=_rtol(vis_dtype), atol=0)
+
+
+@pytest.mark.parametrize("vis_dtype", [np.complex64, np.complex128])
+@pytest.mark.parametrize("weight_dtype", WEIGHT_TYPES)
+def test_divide_no_zero_strided(vis_dtype, weight_dtype):
+    a = _random((6, 8), vis_dtype)[::2, ::2]
+    b = _weights((4, 3), weight_dtype).T
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        expected = np.where(b == 0, 0.0, a / b)
+
+    # Write into a strided view of a larger output
+    out_full = np.ones((3, 8), dtype=vis_dtype)
+    out = out_full[:, 1::2]
+    tools.divide_no_zero(a, b, out=out)
+
+    assert np.allclose(out, expected, rtol=_rtol(vis_dtype), atol=0)
+    assert np.all(out_full[:, ::2] == 1.0)
+
+
+def test_divide_no_zero_broadcast():
+    a = _random((3, 4), np.complex128)
+    b = np.array([2.0, 0.0, 4.0, 1.0])
+
+    result = tools.divide_no_zero(a, b)
+
+    assert np.allclose(result[:, [0, 2, 3]], a[:, [0, 2, 3]] / b[[0, 2, 3]])
+    assert np.all(result[:, 1] == 0.0)
+
+
+@pytest.mark.parametrize("dtype", VIS_TYPES)
+def test_invert_no_zero(dtype):
+    x = _random((4, 5), dtype)
+    x[1, 2] = 0.0
+
+    result = tools.invert_no_zero(x)
+
+    assert result.dtype == dtype
+    assert result[1, 2] == 0.0
+    mask = x != 0
+    assert np.allclose(result[mask], 1.0 / x[mask], rtol=_rtol(dtype), atol=0)
+
+    # Strided input uses the fallback
+    assert np.allclose(tools.invert_no_zero(x[:, ::2]), result[:, ::2])
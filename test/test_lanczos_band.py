@@ -0,0 +1,130 @@
+"""Tests of the banded Lanczos interpolation operators."""
+
+import numpy as np
+import pytest
+
+from draco.util import regrid
+
+
+def _to_dense(index, weight, m):
+    matrix = np.zeros((index.shape[0], m))
+    np.add.at(matrix, (np.arange(index.shape[0])[:, np.newaxis], index), weight)
+    return matrix
+
+
+def _random(shape, dtype, seed=0):
+    rng = np.random.RandomState(seed)
+    arr = rng.standard_normal(shape)
+    if np.issubdtype(dtype, np.complexfloating):
+        arr = arr + 1.0j * rng.standard_normal(shape)
+    return arr.astype(dtype)
+
+
+@pytest.mark.parametrize("a", [2, 5])
+def test_band_matrix_matches_forward(a):
+    # Points inside the grid and beyond its edges, where the kernel is
+    # truncated
+    x = np.linspace(10.0, 30.0, 41)
+    y = np.concatenate(
+        [
+            [8.0, 9.9, 10.0],
+            np.sort(np.random.RandomState(0).uniform(10.0, 30.0, 50)),
+            [30.0, 31.7],
+        ]
+    )
+
+    index, weight = regrid.lanczos_band_matrix(x, y, a)
+
+    assert index.shape == weight.shape == (len(y), 2 * a)
+    assert np.allclose(
+        _to_dense(index, weight, len(x)),
+        regrid.lanczos_forward_matrix(x, y, a),
+        rtol=0,
+        atol=1e-14,
+    )
+
+
+@pytest.mark.parametrize("a", [2, 5])
+def test_band_matrix_periodic(a):
+    # RA in degrees, with points just either side of the wrap
+    x = np.arange(0.0, 360.0, 2.0)
+    y = np.array([0.0, 0.3, 1.0, 3.5, 179.0, 355.1, 358.0, 359.9])
+
+    index, weight = regrid.lanczos_band_matrix(x, y, a, periodic=True)
+    dense = _to_dense(index, weight, len(x))
+
+    assert np.all((index >= 0) & (index < len(x)))
+    assert np.allclose(
+        dense,
+        regrid.lanczos_forward_matrix(x, y, a, periodic=True),
+        rtol=0,
+        atol=1e-14,
+    )
+
+    # The points near the wrap couple to both ends of the grid
+    assert dense[-1, 0] != 0.0 and dense[-1, -1] != 0.0
+    assert dense[1, 0] != 0.0 and dense[1, -1] != 0.0
+
+    # The same as interpolating the data repeated on either side
+    f = np.random.RandomState(2).standard_normal(len(x))
+    x_ext = np.concatenate([x - 360.0, x, x + 360.0])
+    ext = regrid.lanczos_band_matrix(x_ext, y, a)
+    assert np.allclose(
+        regrid.band_apply(f, index, weight),
+        regrid.band_apply(np.tile(f, 3), *ext),
+        rtol=1e-12,
+        atol=1e-12,
+    )
+
+
+@pytest.mark.parametrize("dtype", [np.float32, np.float64, np.complex64, np.complex128])
+def test_band_apply(dtype):
+    x = np.arange(0.0, 360.0, 1.5)
+    y = np.sort(np.random.RandomState(1).uniform(0.0, 360.0, 300))
+    index, weight = regrid.lanczos_band_matrix(x, y, periodic=True)
+    forward = regrid.lanczos_forward_matrix(x, y, periodic=True)
+
+    data = _random((3, 4, len(x)), dtype)
+    exact = np.dot(data.astype(np.complex128), forward.T)
+    if not np.issubdtype(dtype, np.complexfloating):
+        exact = exact.real
+
+    result = regrid.band_apply(data, index, weight)
+
+    assert result.dtype == dtype and result.shape == (3, 4, len(y))
+
+    if dtype in (np.float32, np.complex64):
+        # Accumulated in double precision, so only rounded once at the end
+        assert np.allclose(result, exact, rtol=1.2e-7, atol=1e-12)
+
+        # Which is closer than the dense single precision product
+        dense = np.dot(data, forward.T.astype(dtype))
+        assert np.abs(result - exact).max() <= np.abs(dense - exact).max()
+    else:
+        assert np.allclose(result, exact, rtol=1e-12, atol=1e-12)
+
+
+def test_band_apply_out():
+    x = np.arange(20.0)
+    y = np.linspace(2.0, 17.0, 11)
+    index, weight = regrid.lanczos_band_matrix(x, y, a=3)
+    data = _random((4, 20), np.complex64)
+    expected = regrid.band_apply(data, index, weight)
+
+    # A strided output of a different type
+    out_full = np.zeros((4, 22), dtype=np.complex128)
+    out = out_full[:, ::2]
+    assert regrid.band_apply(data, index, weight, out=out) is out
+    assert np.allclose(out, expected, rtol=1e-6)
+    assert np.all(out_full[:, 1::2] == 0.0)
+
+    # Integer data is interpolated as floating point
+    result = regrid.band_apply(np.arange(20), index, weight)
+    assert result.dtype == np.float64
+    assert np.allclose(result, np.dot(regrid.lanczos_forward_matrix(x, y, a=3), x))
+
+    with pytest.raises(ValueError, match="shape"):
+        regrid.band_apply(data, index, weight, out=np.zeros((4, 10), np.complex64))
+
+    with pytest.raises(ValueError, match="out of bounds"):
+        regrid.band_apply(data[:, :10], index, weight)
@@ -0,0 +1,205 @@
+"""Tests of the file manifest."""
+
+import json
+import os
+
+import h5py
+import numpy as np
+import pytest
+
+pytest.importorskip("caput.memh5")
+
+from draco.core import containers, io
+from draco.analysis import sidereal
+
+
+class _Observer(object):
+    # Sidereal days of exactly 86400 s starting at zero
+    def unix_to_lsd(self, t):
+        return np.asarray(t) / 86400.0
+
+
+def _write_file(path, start, freq, clspath="draco.core.containers.TimeStream"):
+    with h5py.File(path, "w") as f:
+        f.attrs["__memh5_subclass"] = clspath
+        imap = f.create_group("index_map")
+        imap["time"] = np.array(
+            [(t, 0) for t in np.linspace(start, start + 1000.0, 11)],
+            dtype=[("ctime", np.float64), ("fpga_count", np.uint64)],
+        )
+        imap["freq"] = np.array(
+            [(fr, 0.4) for fr in freq],
+            dtype=[("centre", np.float64), ("width", np.float64)],
+        )
+        f["vis"] = np.zeros((len(freq), 11), dtype=np.complex64)
+
+
+@pytest.fixture
+def directory(tmpdir):
+    _write_file(str(tmpdir.join("a.h5")), 100000.0, [600.0, 601.0])
+    _write_file(str(tmpdir.join("b.h5")), 10000.0, [400.0, 401.0])
+    _write_file(
+        str(tmpdir.join("c.h5")),
+        200000.0,
+        [600.0],
+        clspath="draco.core.containers.SiderealStream",
+    )
+    return tmpdir
+
+
+def test_build_manifest(directory):
+    manifest = io.build_manifest(str(directory))
+
+    assert os.path.exists(str(directory.join("manifest.json")))
+    assert manifest == io.load_manifest(str(directory.join("manifest.json")))
+
+    entry = manifest["files"][str(directory.join("a.h5"))]
+    assert entry["class"] == "draco.core.containers.TimeStream"
+    assert entry["time"] == [100000.0, 101000.0]
+    assert entry["freq"] == [600.0, 601.0]
+    assert entry["axes"] == {"time": 11, "freq": 2}
+    assert entry["datasets"] == {"vis": [2, 11]}
+    assert len(manifest["files"]) == 3
+
+
+def test_build_manifest_incremental(directory, monkeypatch):
+    io.build_manifest(str(directory))
+
+    opened = []
+    metadata = io._file_metadata
+
+    def _file_metadata(path):
+        opened.append(os.path.basename(path))
+        return metadata(path)
+
+    monkeypatch.setattr(io, "_file_metadata", _file_metadata)
+
+    # Nothing has changed, so nothing is reopened
+    io.build_manifest(str(directory))
+    assert opened == []
+
+    # Only the new and modified files are opened
+    _write_file(str(directory.join("d.h5")), 300000.0, [500.0])
+    _write_file(str(directory.join("a.h5")), 110000.0, [600.0, 601.0, 602.0])
+
+    manifest = io.build_manifest(str(directory))
+    assert sorted(opened) == ["a.h5", "d.h5"]
+    assert manifest["files"][str(directory.join("a.h5"))]["time"][0] == 110000.0
+
+    # Removed files are dropped
+    os.remove(str(directory.join("d.h5")))
+    manifest = io.build_manifest(str(directory))
+    assert str(directory.join("d.h5")) not in manifest["files"]
+
+
+def test_build_manifest_bad_file(directory):
+    with open(str(directory.join("bad.h5")), "w") as fh:
+        fh.write("not an HDF5 file")
+
+    with pytest.raises(RuntimeError, match="bad.h5"):
+        io.build_manifest(str(directory))
+
+
+def test_select_from_manifest(directory):
+    manifest = io.build_manifest(str(directory))
+    path = lambda name: str(directory.join(name))
+
+    # Sorted by start time
+    assert io.select_from_manifest(manifest) == [
+        path("b.h5"),
+        path("a.h5"),
+        path("c.h5"),
+    ]
+
+    assert io.select_from_manifest(manifest, time_range=[100500, 250000]) == [
+        path("a.h5"),
+        path("c.h5"),
+    ]
+    assert io.select_from_manifest(manifest, freq_range=[350.0, 450.0]) == [
+        path("b.h5")
+    ]
+    assert io.select_from_manifest(manifest, container="SiderealStream") == [
+        path("c.h5")
+    ]
+
+    # LSDs are calculated from the times without an observer in the manifest
+    assert io.select_from_manifest(
+        manifest, lsd_range=[1, 1], observer=_Observer()
+    ) == [path("a.h5")]
+    assert io.select_from_manifest(manifest, lsd_range=[1, 1]) == []
+
+    # And are stored if given when building
+    manifest = io.build_manifest(str(directory), observer=_Observer())
+    assert manifest["files"][path("c.h5")]["lsd"] == [2, 2]
+    assert io.select_from_manifest(manifest, lsd_range=[2, 5]) == [path("c.h5")]
+
+
+def test_load_files_from_manifest(directory):
+    manifest = str(directory.join("manifest.json"))
+
+    task = io.LoadFilesFromManifest()
+    task.read_config(
+        {
+            "manifest": manifest,
+            "directory": str(directory),
+            "freq_range": [550.0, 650.0],
+        }
+    )
+    task.setup()
+    assert task.files == [str(directory.join("a.h5")), str(directory.join("c.h5"))]
+
+    # The files given in the config restrict the selection
+    task = io.LoadFilesFromManifest()
+    task.read_config(
+        {
+            "manifest": manifest,
+            "freq_range": [550.0, 650.0],
+            "files": [str(directory.join("c.h5")), str(directory.join("b.h5"))],
+        }
+    )
+    task.setup()
+    assert task.files == [str(directory.join("c.h5"))]
+
+
+def _timestream(start, end):
+    time = np.linspace(start, end, 8)
+    ts = containers.TimeStream(freq=2, input=2, time=time)
+    ts.vis[:] = 1.0
+    return ts
+
+
+@pytest.mark.parametrize("use_manifest", [False, True])
+def test_sidereal_grouper_manifest(tmpdir, monkeypatch, use_manifest):
+    # Two files on day 0 and one on day 1
+    spans = [(1000.0, 20000.0), (20000.0, 40000.0), (90000.0, 110000.0)]
+
+    manifest = str(tmpdir.join("manifest.json"))
+    files = {
+        "f%i.h5" % ii: {"time": list(span), "mtime": 0, "size": 0}
+        for ii, span in enumerate(spans)
+    }
+    with open(manifest, "w") as fh:
+        json.dump({"version": io.MANIFEST_VERSION, "files": files}, fh)
+
+    monkeypatch.setattr(io, "get_telescope", lambda obj: obj)
+
+    grouper = sidereal.SiderealGrouper()
+    grouper.read_config({"manifest": manifest} if use_manifest else {})
+    grouper.setup(_Observer())
+
+    out = [grouper.process(_timestream(*span)) for span in spans]
+    final = grouper.process_finish()
+
+    if use_manifest:
+        # Each day is passed on as soon as its last file arrives
+        assert out[0] is None
+        assert out[1].attrs["lsd"] == 0
+        assert out[2].attrs["lsd"] == 1
+        assert final is None
+    else:
+        assert out[0] is None and out[1] is None
+        assert out[2].attrs["lsd"] == 0
+        assert final.attrs["lsd"] == 1
+
+    day0 = out[1] if use_manifest else out[2]
+    assert len(day0.time) == 16
@@ -0,0 +1,112 @@
+"""Tests of the background file read ahead."""
+
+import threading
+
+import pytest
+
+pytest.importorskip("caput.memh5")
+
+from draco.core import containers, io
+
+
+class _FakeCont(object):
+    def __init__(self, local):
+        self.local = local
+        self.attrs = {}
+
+
+@pytest.fixture
+def reads(monkeypatch):
+    # Replace the file reading routines with ones that record the order the
+    # files are read in, without touching the disk
+    log = []
+    errors = {}
+    gates = {}
+
+    def _read_local(filename, rank, size, **kwargs):
+        if filename in gates:
+            gates[filename].wait()
+        log.append(filename)
+        if filename in errors:
+            raise errors[filename]
+        return filename
+
+    monkeypatch.setattr(containers, "_read_local", _read_local)
+    monkeypatch.setattr(containers, "_local_nbytes", lambda *args, **kwargs: 10)
+    monkeypatch.setattr(
+        containers,
+        "_container_from_local",
+        lambda local, *args, **kwargs: _FakeCont(local),
+    )
+
+    return log, errors, gates
+
+
+def test_prefetch_order(reads):
+    log, _, _ = reads
+    files = ["a", "b", "c", "d"]
+
+    pf = io._FilePrefetcher(None, 2)
+    try:
+        for ii, fname in enumerate(files):
+            assert pf.get(fname, files[ii + 1 :]).local == fname
+    finally:
+        pf.close()
+
+    # Every file is read exactly once, in order
+    assert log == files
+
+
+def test_prefetch_memory_cap(reads):
+    pf = io._FilePrefetcher(None, 5, memory=25)
+    try:
+        pf.get("a", ["b", "c", "d", "e"])
+
+        # Only two files of 10 bytes fit in the budget
+        assert list(pf._pending) == ["b", "c"]
+    finally:
+        pf.close()
+
+
+def test_prefetch_error_propagates(reads):
+    _, errors, _ = reads
+    errors["b"] = IOError("bad file")
+
+    pf = io._FilePrefetcher(None, 2)
+    try:
+        pf.get("a", ["b", "c"])
+
+        # The error raised in the worker thread is raised by the fetch
+        with pytest.raises(IOError, match="bad file"):
+            pf.get("b", ["c"])
+
+        assert pf.get("c").local == "c"
+    finally:
+        pf.close()
+
+
+def test_prefetch_shutdown_on_early_finish(reads, tmpdir):
+    log, _, gates = reads
+    files = [str(tmpdir.join("%s.h5" % name)) for name in "abcd"]
+
+    # Block the read ahead of the second file, so the third stays queued
+    gates[files[1]] = threading.Event()
+
+    task = io.LoadFilesFromParams()
+    task.read_config({"files": list(files), "prefetch": 2})
+    task.process()
+
+    prefetcher = task._prefetcher
+    assert set(prefetcher._pending) == set(files[1:3])
+    executor = prefetcher._executor
+
+    # Finish while the second file is still being read, letting it complete
+    # shortly after the queued read has been cancelled
+    threading.Timer(0.1, gates[files[1]].set).start()
+    task.finish()
+
+    # The read ahead was stopped without reading the queued file
+    assert task._prefetcher is None
+    assert prefetcher._executor is None
+    assert executor._shutdown
+    assert files[2] not in log
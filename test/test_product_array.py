@@ -0,0 +1,129 @@
+"""Tests of packing and unpacking products in upper triangular order."""
+
+import numpy as np
+import pytest
+
+from draco.util import tools
+
+NFEED = 6
+NPROD = NFEED * (NFEED + 1) // 2
+TYPES = [np.complex64, np.complex128, np.float32, np.float64]
+
+
+def _random(shape, dtype, seed=0):
+    rng = np.random.RandomState(seed)
+    arr = rng.standard_normal(shape)
+    if np.issubdtype(dtype, np.complexfloating):
+        arr = arr + 1.0j * rng.standard_normal(shape)
+    return arr.astype(dtype)
+
+
+def _products(shape, dtype, seed=0):
+    # Random products with real autos, as for real data
+    utv = _random(shape, dtype, seed)
+    autos = [tools.cmap(i, i, NFEED) for i in range(NFEED)]
+    utv[:, autos] = utv[:, autos].real
+    return utv
+
+
+def _reference_unpack(utv, feeds, conj):
+    # Build each Hermitian matrix one element at a time
+    nfreq, _, ntime = utv.shape
+    mat = np.zeros((nfreq, ntime, len(feeds), len(feeds)), dtype=utv.dtype)
+
+    for i, fi in enumerate(feeds):
+        for j, fj in enumerate(feeds):
+            val = utv[:, tools.cmap(fi, fj, NFEED)]
+            if fi > fj:
+                val = val.conj()
+            mat[:, :, i, j] = val.conj() if conj else val
+
+    return mat
+
+
+@pytest.mark.parametrize("dtype", TYPES)
+@pytest.mark.parametrize("conj", [False, True])
+@pytest.mark.parametrize("feeds", [None, [1, 4], [5, 0, 3, 2], [2, 2]])
+def test_unpack(dtype, conj, feeds):
+    utv = _products((3, NPROD, 4), dtype)
+
+    mat = tools.unpack_product_array(utv, feeds=feeds, conj=conj)
+
+    expected = _reference_unpack(
+        utv, np.arange(NFEED) if feeds is None else feeds, conj
+    )
+    assert mat.dtype == dtype
+    assert np.array_equal(mat, expected)
+
+    # The matrices are Hermitian
+    assert np.array_equal(mat, mat.swapaxes(-1, -2).conj())
+
+
+@pytest.mark.parametrize("dtype", TYPES)
+@pytest.mark.parametrize("conj", [False, True])
+def test_round_trip(dtype, conj):
+    utv = _products((3, NPROD, 4), dtype)
+
+    mat = tools.unpack_product_array(utv, conj=conj)
+    packed = tools.pack_product_array(mat, conj=conj)
+
+    assert packed.shape == utv.shape
+    assert np.array_equal(packed, utv)
+
+
+@pytest.mark.parametrize("dtype", [np.complex64, np.complex128])
+@pytest.mark.parametrize("conj", [False, True])
+@pytest.mark.parametrize("feeds", [[1, 4], [5, 0, 3]])
+def test_round_trip_feeds(dtype, conj, feeds):
+    # Packing a subset of feeds only writes the products between them
+    utv = _products((2, NPROD, 3), dtype)
+    mat = tools.unpack_product_array(utv, feeds=feeds, conj=conj)
+
+    out = np.zeros_like(utv)
+    tools.pack_product_array(mat, feeds=feeds, conj=conj, out=out)
+
+    written = sorted(set(tools.cmap(fi, fj, NFEED) for fi in feeds for fj in feeds))
+    assert np.array_equal(out[:, written], utv[:, written])
+
+    others = np.setdiff1d(np.arange(NPROD), written)
+    assert np.all(out[:, others] == 0)
+
+    # And the subset matrices match those of the full set
+    full = tools.unpack_product_array(utv, conj=conj)
+    assert np.array_equal(mat, full[:, :, feeds][:, :, :, feeds])
+
+
+def test_pack_nfeed_from_out():
+    mat = tools.unpack_product_array(_products((1, NPROD, 2), np.complex64))[
+        :, :, :2, :2
+    ]
+    out = np.zeros((1, NPROD, 2), dtype=np.complex64)
+
+    tools.pack_product_array(mat, feeds=[0, 1], out=out)
+
+    assert np.array_equal(out[:, :2], tools.pack_product_array(mat)[:, :2])
+    assert np.array_equal(out[:, NFEED], tools.pack_product_array(mat)[:, 2])
+
+
+def test_unpack_out():
+    utv = _products((2, NPROD, 3), np.complex128)
+    out = np.empty((2, 3, NFEED, NFEED), dtype=np.complex128)
+
+    assert tools.unpack_product_array(utv, out=out) is out
+    assert np.array_equal(out, _reference_unpack(utv, np.arange(NFEED), False))
+
+
+def test_errors():
+    utv = _products((1, NPROD, 2), np.complex64)
+
+    with pytest.raises(ValueError):
+        tools.unpack_product_array(utv, feeds=[0, NFEED])
+
+    with pytest.raises(ValueError):
+        tools.unpack_product_array(utv, nfeed=NFEED + 1)
+
+    with pytest.raises(ValueError):
+        tools.pack_product_array(
+            np.zeros((1, 2, 2, 2), dtype=np.complex64),
+            out=np.zeros((1, NPROD, 3), dtype=np.complex64),
+        )
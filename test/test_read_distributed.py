@@ -0,0 +1,117 @@
+"""Tests of reading containers distributed along a chosen axis."""
+
+import h5py
+import numpy as np
+import pytest
+
+pytest.importorskip("caput.memh5")
+
+from caput import memh5
+
+from draco.core import containers
+
+
+def _make_stream():
+    ss = containers.SiderealStream(
+        freq=np.linspace(800.0, 400.0, 5), input=4, ra=12, distributed=True
+    )
+    rng = np.random.RandomState(0)
+    shape = ss.vis.local_shape
+    ss.vis[:] = rng.standard_normal(shape) + 1.0j * rng.standard_normal(shape)
+    ss.weight[:] = rng.uniform(size=ss.weight.local_shape)
+    ss.input_flags[:] = rng.uniform(size=ss.input_flags.shape)
+    return ss
+
+
+def test_dist_hint_matches_caput(tmpdir):
+    ss = _make_stream()
+    fname = str(tmpdir.join("ss.h5"))
+    ss.save(fname)
+
+    # The hint we look for is the one caput writes
+    with h5py.File(fname, "r") as f:
+        assert f["vis"].attrs[containers._DIST_HINT]
+        assert containers._DIST_HINT not in f["input_flags"].attrs
+
+
+def test_dist_hint_round_trip(tmpdir):
+    ss = _make_stream()
+    fname = str(tmpdir.join("ss.h5"))
+    ss.save(fname)
+
+    # Read a file written by caput distributed over the RA axis
+    loaded = containers.SiderealStream.from_file(fname, distributed_axis="ra")
+    assert isinstance(loaded.vis, memh5.MemDatasetDistributed)
+    assert loaded.vis.distributed_axis == 2
+    assert not isinstance(loaded.input_flags, memh5.MemDatasetDistributed)
+    assert containers._DIST_HINT not in loaded.vis.attrs
+
+    loaded.redistribute("freq")
+    assert np.array_equal(loaded.vis[:], ss.vis[:])
+    assert np.array_equal(loaded.input_flags[:], ss.input_flags[:])
+
+    # Write the file ourselves and check caput reads it back distributed
+    fname2 = str(tmpdir.join("ss2.h5"))
+    ss.to_hdf5_threaded(fname2)
+    reloaded = memh5.BasicCont.from_file(fname2, distributed=True)
+    assert isinstance(reloaded, containers.SiderealStream)
+    assert isinstance(reloaded.vis, memh5.MemDatasetDistributed)
+    assert np.array_equal(reloaded.vis[:], ss.vis[:])
+
+
+@pytest.mark.parametrize("num_threads", [None, 2])
+@pytest.mark.parametrize("size", [1, 3])
+def test_read_local_non_default_axis(tmpdir, num_threads, size):
+    ss = containers.SiderealStream(
+        freq=np.linspace(800.0, 400.0, 5),
+        input=4,
+        ra=13,
+        distributed=True,
+        allow_chunked=True,
+    )
+    rng = np.random.RandomState(1)
+    shape = ss.vis.local_shape
+    ss.vis[:] = rng.standard_normal(shape) + 1.0j * rng.standard_normal(shape)
+
+    fname = str(tmpdir.join("ss.h5"))
+    ss.to_hdf5_threaded(fname)
+
+    with h5py.File(fname, "r") as f:
+        expected = f["vis"][:]
+        expected_flags = f["input_flags"][:]
+
+    # Read the sections of every rank along RA, and check they tile the file
+    slabs = []
+    for rank in range(size):
+        local = containers._read_local(
+            fname, rank, size, axes="ra", num_threads=num_threads
+        )
+        data, attrs, axis = local["datasets"]["vis"]
+        assert axis == 2
+        assert containers._DIST_HINT not in attrs
+        slabs.append(data)
+
+        flags, _, flags_axis = local["datasets"]["input_flags"]
+        assert flags_axis is None
+        assert np.array_equal(flags, expected_flags)
+
+    assert np.array_equal(np.concatenate(slabs, axis=2), expected)
+
+
+@pytest.mark.parametrize("num_threads", [None, 2])
+def test_from_file_non_default_axis(tmpdir, num_threads):
+    ss = _make_stream()
+    fname = str(tmpdir.join("ss.h5"))
+    ss.save(fname)
+
+    loaded = containers.SiderealStream.from_file(
+        fname, distributed_axis={"vis": "ra"}, num_threads=num_threads
+    )
+    assert loaded.vis.distributed_axis == 2
+    assert loaded.weight.distributed_axis == 0
+
+    vis = loaded.vis[:]
+    with h5py.File(fname, "r") as f:
+        start = vis.local_offset[2]
+        end = start + vis.local_shape[2]
+        assert np.array_equal(vis.view(np.ndarray), f["vis"][:, :, start:end])
@@ -0,0 +1,166 @@
+"""Tests of the redundancy calculation for stacked products."""
+
+import numpy as np
+import pytest
+
+from draco.util import _fast_tools, tools
+
+NINPUT = 8
+
+
+@pytest.fixture(autouse=True)
+def empty_cache():
+    tools._redundancy_cache.clear()
+    yield
+    tools._redundancy_cache.clear()
+
+
+def _products():
+    # All products of the inputs, stacked on their separation, with the
+    # autos left out of the stack
+    ii, jj = np.triu_indices(NINPUT)
+    prod = np.empty(len(ii), dtype=[("input_a", "<u2"), ("input_b", "<u2")])
+    prod["input_a"], prod["input_b"] = ii, jj
+
+    nstack = NINPUT - 1
+    stack = (jj - ii - 1).astype(np.uint32)
+    stack[ii == jj] = nstack
+
+    return prod, stack, nstack
+
+
+def _reference(flags, prod, stack, nstack):
+    # The original serial kernel
+    redundancy = np.zeros((nstack, flags.shape[1]), dtype=np.float32)
+    pm = prod.view(np.int16).reshape(-1, 2)
+    _fast_tools._calc_redundancy(
+        np.ascontiguousarray(flags, dtype=np.float32), pm, stack, nstack, redundancy
+    )
+    return redundancy
+
+
+def _flags(ntime=40, seed=0):
+    # Flags which change only at a few times, with some inputs flagged
+    # throughout
+    flags = np.ones((NINPUT, ntime), dtype=np.float32)
+    flags[1, 10:25] = 0.0
+    flags[5, 30:] = 0.0
+    flags[6] = 0.0
+    flags[:, 17] = 0.0
+    return flags
+
+
+def test_matches_reference():
+    prod, stack, nstack = _products()
+    flags = _flags()
+
+    result = tools.calculate_redundancy(flags, prod, stack, nstack, cache=False)
+
+    assert np.array_equal(result, _reference(flags, prod, stack, nstack))
+    # The autos weren't stacked, and separation one has all pairs at the start
+    assert result[0, 0] == NINPUT - 1 - 2
+
+
+def test_changing_every_sample():
+    # Nothing to skip in the incremental calculation
+    prod, stack, nstack = _products()
+    rng = np.random.RandomState(1)
+    flags = (rng.uniform(size=(NINPUT, 30)) > 0.3).astype(np.float32)
+
+    result = tools.calculate_redundancy(flags, prod, stack, nstack, cache=False)
+
+    assert np.array_equal(result, _reference(flags, prod, stack, nstack))
+
+
+@pytest.mark.parametrize("dtype", [np.bool_, np.uint8, np.intc, np.float64, np.int64])
+def test_flag_types(dtype):
+    prod, stack, nstack = _products()
+    flags = _flags()
+
+    result = tools.calculate_redundancy(flags.astype(dtype), prod, stack, nstack)
+
+    assert np.array_equal(result, _reference(flags, prod, stack, nstack))
+
+
+def test_strided_flags():
+    prod, stack, nstack = _products()
+    full = np.ones((2 * NINPUT, 80), dtype=np.float32)
+    full[::2, ::2] = _flags()
+    flags = full[::2, ::2]
+
+    result = tools.calculate_redundancy(flags, prod, stack, nstack)
+
+    assert np.array_equal(result, _reference(flags, prod, stack, nstack))
+
+
+def test_no_flags():
+    # If there are no good inputs at all, every input is assumed good
+    prod, stack, nstack = _products()
+    flags = np.zeros((NINPUT, 5), dtype=np.float32)
+
+    result = tools.calculate_redundancy(flags, prod, stack, nstack)
+
+    expected = _reference(np.ones_like(flags), prod, stack, nstack)
+    assert np.array_equal(result, expected)
+
+
+def test_cache_hit_is_a_copy():
+    prod, stack, nstack = _products()
+    flags = _flags()
+
+    first = tools.calculate_redundancy(flags, prod, stack, nstack)
+    first[:] = -1.0
+    second = tools.calculate_redundancy(flags, prod, stack, nstack)
+
+    assert np.array_equal(second, _reference(flags, prod, stack, nstack))
+    assert second.flags.writeable
+
+
+def test_cache_checks_contents():
+    # Flags with the same fingerprint (the same sum and the same sampled
+    # elements) must not share a result
+    prod, stack, nstack = _products()
+    ntime = 1024
+    step = NINPUT * ntime // 4096
+
+    flags_a = np.ones((NINPUT, ntime), dtype=np.float32)
+    flags_b = flags_a.copy()
+    flags_a[2, 1] = 0.0
+    flags_b[3, 1] = 0.0
+    assert step > 1
+    assert tools._fingerprint(flags_a) == tools._fingerprint(flags_b)
+
+    result_a = tools.calculate_redundancy(flags_a, prod, stack, nstack)
+    result_b = tools.calculate_redundancy(flags_b, prod, stack, nstack)
+
+    assert np.array_equal(result_a, _reference(flags_a, prod, stack, nstack))
+    assert np.array_equal(result_b, _reference(flags_b, prod, stack, nstack))
+
+    # Modifying the flags in place must not give the old result
+    flags_a[:] = 1.0
+    result = tools.calculate_redundancy(flags_a, prod, stack, nstack)
+    assert np.array_equal(result, _reference(flags_a, prod, stack, nstack))
+
+
+def test_cache_checks_products(monkeypatch):
+    # With every array of a shape sharing a fingerprint, a different stacking
+    # must still be regrouped
+    monkeypatch.setattr(tools, "_fingerprint", lambda arr: (arr.dtype.str, arr.shape))
+
+    prod, stack, nstack = _products()
+    flags = _flags()
+
+    tools.calculate_redundancy(flags, prod, stack, nstack)
+
+    # Move a product to another stack
+    stack = stack.copy()
+    stack[np.flatnonzero(stack == 0)[0]] = 1
+
+    result = tools.calculate_redundancy(flags, prod, stack, nstack)
+    assert np.array_equal(result, _reference(flags, prod, stack, nstack))
+
+    # And a different product map too
+    prod = prod.copy()
+    prod["input_b"][np.flatnonzero(stack == 2)[0]] = 6
+    result = tools.calculate_redundancy(flags, prod, stack, nstack)
+    assert np.array_equal(result, _reference(flags, prod, stack, nstack))
@@ -0,0 +1,83 @@
+"""Tests of sampling noise onto visibilities in blocks of time samples."""
+
+import numpy as np
+import pytest
+
+pytest.importorskip("caput.memh5")
+pytest.importorskip("scipy.stats")
+
+from draco.core import containers
+from draco.synthesis import noise
+from draco.util import tools
+
+NFEED = 4
+
+
+def _make_stream(ntime):
+    freq = np.zeros(2, dtype=[("centre", np.float64), ("width", np.float64)])
+    freq["centre"] = [800.0, 790.0]
+    freq["width"] = 1.0
+
+    ss = containers.SiderealStream(freq=freq, input=NFEED, ra=ntime, distributed=True)
+
+    # Positive definite expected covariances
+    rng = np.random.RandomState(0)
+    shape = ss.vis.local_shape[:1] + (ntime, NFEED, NFEED)
+    a = rng.standard_normal(shape) + 1.0j * rng.standard_normal(shape)
+    cov = np.matmul(a, a.swapaxes(-1, -2).conj()) + NFEED * np.eye(NFEED)
+    ss.vis[:] = tools.pack_product_array(cov.astype(np.complex64))
+    ss.weight[:] = 1.0
+
+    return ss
+
+
+def _reference(ss, seed, nsamp):
+    # Sample each time on its own, in the same order as the task
+    vis = ss.vis[:].view(np.ndarray).copy()
+
+    with noise.mpi_random_seed(seed):
+        for fi in range(vis.shape[0]):
+            for ti in range(vis.shape[2]):
+                mat = tools.unpack_product_array(vis[fi, np.newaxis, :, ti, np.newaxis])
+                mat[0, 0] = noise.draw_complex_wishart(mat[0, 0], nsamp)
+                mat /= nsamp
+                vis[fi, :, ti] = tools.pack_product_array(mat)[0, :, 0]
+
+    return vis
+
+
+# Bytes in the matrix of one time sample
+_SAMPLE_BYTES = np.dtype(np.complex64).itemsize * NFEED ** 2
+
+
+@pytest.mark.parametrize(
+    "block_bytes",
+    [
+        # Less than one sample, which must still give one sample per block
+        1,
+        # Blocks which don't divide the samples
+        3 * _SAMPLE_BYTES,
+        3 * _SAMPLE_BYTES + 1,
+        # A single block of exactly all samples
+        8 * _SAMPLE_BYTES,
+        # The default
+        noise._UNPACK_BLOCK_BYTES,
+    ],
+)
+def test_sample_noise_blocks(monkeypatch, block_bytes):
+    monkeypatch.setattr(noise, "_UNPACK_BLOCK_BYTES", block_bytes)
+
+    ntime = 8
+    ss = _make_stream(ntime)
+
+    # The number of samples the task uses for each frequency
+    dt = 240 * (ss.ra[1] - ss.ra[0]) * noise.STELLAR_S
+    nsamp = int(1e-6 * dt * 1e6)
+    expected = _reference(ss, 42, nsamp)
+
+    task = noise.SampleNoise()
+    task.read_config({"seed": 42, "sample_frac": 1e-6, "set_weights": False})
+    result = task.process(ss)
+
+    assert np.allclose(result.vis[:], expected, rtol=1e-6, atol=1e-6)
+    assert not np.allclose(result.vis[:], _make_stream(ntime).vis[:])
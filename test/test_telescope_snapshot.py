@@ -0,0 +1,275 @@
+"""Tests of the telescope metadata snapshot."""
+
+import ast
+import glob
+import os
+
+import numpy as np
+import pytest
+
+import draco
+
+_DRACO_DIR = os.path.dirname(draco.__file__)
+
+# Names the telescope is held under within draco
+_TELESCOPE_NAMES = {"tel", "telescope", "observer"}
+
+# Attributes only ever used on a full driftscan telescope, per file
+_LIVE_ONLY = {
+    # `LoadBeamTransfer` returns the feeds of the telescope it loads
+    ("io.py", "feeds"),
+}
+
+
+def _snapshot_lists():
+    # Read the attribute lists out of the snapshot module without importing
+    # it, as that needs caput
+    with open(os.path.join(_DRACO_DIR, "core", "telescope.py")) as fh:
+        tree = ast.parse(fh.read())
+
+    lists = {}
+    for node in tree.body:
+        if isinstance(node, ast.Assign) and isinstance(node.targets[0], ast.Name):
+            name = node.targets[0].id
+            if name.startswith("SNAPSHOT_") and isinstance(node.value, ast.List):
+                lists[name] = ast.literal_eval(node.value)
+    return lists
+
+
+def _observer_attributes():
+    try:
+        from caput.time import Observer
+    except ImportError:
+        # The methods of caput's Observer used in draco
+        return {"unix_to_lsa", "unix_to_lsd", "lsd_to_unix"}
+    return set(dir(Observer))
+
+
+def _telescope_attributes(filename):
+    # Find the attributes used on anything that looks like a telescope, i.e.
+    # `tel.x`, `telescope.x`, `self.telescope.x`, ...
+    with open(filename) as fh:
+        tree = ast.parse(fh.read())
+
+    # Skip modules imported under the same names
+    modules = set()
+    for node in ast.walk(tree):
+        if isinstance(node, (ast.Import, ast.ImportFrom)):
+            modules.update(
+                alias.asname or alias.name.split(".")[0] for alias in node.names
+            )
+
+    used = set()
+    for node in ast.walk(tree):
+        if not isinstance(node, ast.Attribute) or node.attr.startswith("__"):
+            continue
+        base = node.value
+        if isinstance(base, ast.Name):
+            if base.id in _TELESCOPE_NAMES and base.id not in modules:
+                used.add((node.attr, node.lineno))
+        elif (
+            isinstance(base, ast.Attribute)
+            and isinstance(base.value, ast.Name)
+            and base.value.id == "self"
+            and base.attr in _TELESCOPE_NAMES
+        ):
+            used.add((node.attr, node.lineno))
+    return used
+
+
+def test_snapshot_has_used_attributes():
+    # The snapshot attributes are listed by hand, so make sure each telescope
+    # attribute used within draco is in them
+    lists = _snapshot_lists()
+    known = set(sum(lists.values(), [])) | _observer_attributes()
+
+    missing = []
+    for filename in glob.glob(os.path.join(_DRACO_DIR, "*", "*.py")):
+        for attr, lineno in _telescope_attributes(filename):
+            if (
+                attr not in known
+                and (os.path.basename(filename), attr) not in _LIVE_ONLY
+            ):
+                missing.append(
+                    "%s:%i %s" % (os.path.relpath(filename, _DRACO_DIR), lineno, attr)
+                )
+
+    assert not missing, "Not in the telescope snapshot: %s" % ", ".join(missing)
+
+
+@pytest.fixture(scope="module")
+def telescopes(tmp_path_factory):
+    pytest.importorskip("caput.memh5")
+    cylinder = pytest.importorskip("drift.telescope.cylinder")
+
+    from draco.core import telescope
+
+    tel = cylinder.PolarisedCylinderTelescope.from_config(
+        {
+            "freq_lower": 400.0,
+            "freq_upper": 410.0,
+            "num_freq": 4,
+            "num_cylinders": 2,
+            "num_feeds": 4,
+            "cylinder_width": 5.0,
+            "feed_spacing": 0.3,
+            "auto_correlations": True,
+        }
+    )
+
+    directory = str(tmp_path_factory.mktemp("snapshot"))
+    telescope.save_snapshot(tel, directory)
+
+    return tel, telescope.load_snapshot(directory)
+
+
+def _freq(tel):
+    freq = np.zeros(tel.nfreq, dtype=[("centre", np.float64), ("width", np.float64)])
+    freq["centre"] = tel.frequencies
+    freq["width"] = np.abs(np.diff(tel.frequencies)).mean()
+    return freq
+
+
+def _make_stream(tel, stacked=True):
+    # A sidereal stream containing every product of the telescope's feeds,
+    # stacked onto the telescope's unique baselines if requested
+    from draco.analysis import transform
+    from draco.core import containers
+
+    nprod = tel.nfeed * (tel.nfeed + 1) // 2
+    rev = np.zeros(nprod, dtype=[("stack", "<u4"), ("conjugate", "u1")])
+    rev["stack"] = np.arange(nprod)
+
+    ss = containers.SiderealStream(
+        freq=_freq(tel),
+        input=tel.input_index,
+        ra=32,
+        reverse_map_stack=rev,
+        distributed=True,
+    )
+    rng = np.random.RandomState(0)
+    ss.vis[:] = rng.standard_normal(ss.vis.local_shape) + 1.0j * rng.standard_normal(
+        ss.vis.local_shape
+    )
+    ss.weight[:] = rng.uniform(1.0, 2.0, size=ss.weight.local_shape)
+    ss.input_flags[:] = 1.0
+
+    if not stacked:
+        return ss
+
+    collate = transform.CollateProducts()
+    collate.setup(tel)
+    return collate.process(ss)
+
+
+def _assert_streams_equal(a, b):
+    for name in a.datasets:
+        assert np.array_equal(
+            a.datasets[name][:].view(np.ndarray), b.datasets[name][:].view(np.ndarray)
+        )
+    for name in a.index_map:
+        assert np.array_equal(a.index_map[name], b.index_map[name])
+
+
+def _run(telescopes, cls, config, make_input, *setup_args):
+    # Run a task on the same input with both the live telescope and the
+    # snapshot, and return the outputs
+    outputs = []
+    for tel in telescopes:
+        task = cls()
+        task.read_config(config)
+        task.setup(tel, *setup_args)
+        outputs.append(task.process(make_input()))
+    return outputs
+
+
+def test_collate_products(telescopes):
+    tel = telescopes[0]
+    live, snap = [_make_stream(t) for t in telescopes]
+
+    assert snap.vis.shape[1] == tel.npairs
+    _assert_streams_equal(live, snap)
+
+
+def test_delay_filter(telescopes):
+    from draco.analysis import delay
+
+    live, snap = _run(
+        telescopes,
+        delay.DelayFilter,
+        {"delay_cut": 0.05},
+        lambda: _make_stream(telescopes[0]),
+    )
+    _assert_streams_equal(live, snap)
+
+
+def test_mask_baselines(telescopes):
+    from draco.analysis import flagging
+
+    live, snap = _run(
+        telescopes,
+        flagging.MaskBaselines,
+        {"mask_long_ns": 1.0, "mask_short": 1.0, "zero_data": True},
+        lambda: _make_stream(telescopes[0]),
+    )
+    _assert_streams_equal(live, snap)
+    assert not np.all(live.weight[:] > 0.0)
+
+
+def test_beamform(telescopes):
+    from draco.analysis import beamform
+    from draco.core import containers
+
+    cat = containers.SourceCatalog(object_id=3)
+    cat["position"]["ra"][:] = [30.0, 120.0, 300.0]
+    cat["position"]["dec"][:] = [10.0, 45.0, 80.0]
+
+    live, snap = _run(
+        telescopes,
+        beamform.BeamForm,
+        {"polarization": "full", "timetrack": 3600.0},
+        lambda: _make_stream(telescopes[0]),
+        cat,
+    )
+    _assert_streams_equal(live, snap)
+
+
+def test_sidereal_regridder(telescopes):
+    from draco.analysis import sidereal
+    from draco.core import containers
+
+    tel = telescopes[0]
+    lsd = 100
+
+    def _make_timestream():
+        times = tel.lsd_to_unix(lsd + np.linspace(-0.05, 1.05, 128))
+        ts = containers.TimeStream(
+            freq=_freq(tel),
+            input=tel.input_index,
+            time=times,
+            distributed=True,
+        )
+        rng = np.random.RandomState(1)
+        ts.vis[:] = rng.standard_normal(ts.vis.local_shape)
+        ts.weight[:] = 1.0
+        ts.attrs["lsd"] = lsd
+        return ts
+
+    live, snap = _run(
+        telescopes,
+        sidereal.SiderealRegridder,
+        {"samples": 64, "lanczos_width": 3},
+        _make_timestream,
+    )
+    _assert_streams_equal(live, snap)
+
+
+def test_missing_attribute(telescopes):
+    snap = telescopes[1]
+
+    with pytest.raises(AttributeError, match="no attribute feeds"):
+        snap.feeds
+
+    # Arrays are memory mapped read only
+    assert not snap.baselines.flags.writeable
+    assert np.array_equal(snap.baselines, telescopes[0].baselines)
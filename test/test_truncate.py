@@ -0,0 +1,108 @@
+"""Tests of the truncation routines on strided and broadcast arrays."""
+
+import numpy as np
+
+from draco.util import truncate
+
+
+def _random_complex(shape, seed=0):
+    rng = np.random.RandomState(seed)
+    return (rng.standard_normal(shape) + 1.0j * rng.standard_normal(shape)).astype(
+        np.complex64
+    )
+
+
+def test_truncate_weights_broadcast_4d():
+    # A weight broadcast over axes that can't be merged with a copy free reshape
+    val = _random_complex((3, 4, 5, 6))
+    wgt = np.random.RandomState(1).uniform(1e2, 1e4, size=(3, 1, 5, 6))
+    wgt = wgt.astype(np.float32)
+
+    wgt_b = np.broadcast_to(wgt, val.shape)
+    expected = truncate.truncate_weights(val.copy(), wgt_b.copy(), 1e-5)
+
+    result = val.copy()
+    truncate.truncate_weights(result, wgt_b, 1e-5)
+
+    assert np.array_equal(result, expected)
+    assert not np.array_equal(result, val)
+
+
+def test_truncate_fixed_transposed_4d():
+    # A transposed array, whose leading axes can't be merged
+    val = _random_complex((6, 5, 4, 3))
+    valt = val.transpose(3, 2, 1, 0)
+    original = valt.copy()
+
+    expected = truncate.truncate_fixed(np.ascontiguousarray(valt), 1e-3)
+
+    truncate.truncate_fixed(valt, 1e-3)
+
+    assert np.array_equal(valt, expected)
+    assert not np.array_equal(valt, original)
+
+
+def test_truncate_weights_transposed_4d():
+    val = _random_complex((6, 5, 4, 3), seed=2)
+    wgt = np.random.RandomState(3).uniform(1e2, 1e4, size=val.shape)
+
+    valt = val.transpose(3, 2, 1, 0)
+    wgtt = wgt.transpose(3, 2, 1, 0)
+
+    expected = truncate.truncate_weights(
+        np.ascontiguousarray(valt), np.ascontiguousarray(wgtt), 1e-5
+    )
+
+    truncate.truncate_weights(valt, wgtt, 1e-5)
+
+    assert np.array_equal(valt, expected)
+
+
+def _old_truncate(val, err):
+    # The original float32 only kernel, one element at a time
+    return np.array(
+        [truncate.bit_truncate(v, e) for v, e in zip(val.ravel(), err.ravel())],
+        dtype=np.float32,
+    ).reshape(val.shape)
+
+
+def test_truncate_weights_fallback_matches_float32():
+    # Zero weights fall back to a relative precision, which must give the
+    # same result as the original float32 kernel, computed as
+    # `fallback * val` in single precision
+    fallback = 1e-4
+    val = _random_complex((4, 5, 6), seed=4)
+    val[0, 0, :3] = 0.0
+    wgt = np.zeros(val.shape, dtype=np.float32)
+
+    result = truncate.truncate_weights(val.copy(), wgt, fallback)
+
+    for part in [np.real, np.imag]:
+        mag = np.abs(part(val))
+        expected = np.sign(part(val)) * _old_truncate(mag, np.float32(fallback) * mag)
+        assert np.array_equal(part(result), expected)
+
+    # The original kernel truncated negative values to zero, as their error
+    # was negative, so check the sign symmetry explicitly
+    neg = truncate.truncate_weights(-val, wgt, fallback)
+    assert np.array_equal(neg, -result)
+
+
+def test_truncate_fixed_matches_float32():
+    prec = 1e-3
+    val = np.random.RandomState(5).uniform(0.1, 1e3, size=(3, 50)).astype(np.float32)
+
+    result = truncate.truncate_fixed(val.copy(), prec)
+
+    assert np.array_equal(result, _old_truncate(val, np.float32(prec) * val))
+
+
+def test_truncate_weights_matches_float32():
+    val = np.random.RandomState(6).standard_normal((2, 3, 40)).astype(np.float32)
+    wgt = np.random.RandomState(7).uniform(1e2, 1e4, size=val.shape)
+    wgt = wgt.astype(np.float32)
+
+    result = truncate.truncate_weights(val.copy(), wgt, 1e-5)
+
+    err = (1.0 / np.sqrt(wgt.astype(np.float64))).astype(np.float32)
+    assert np.array_equal(result, _old_truncate(val, err))
@@ -0,0 +1,91 @@
+"""Tests of truncating containers as they are written."""
+
+import h5py
+import numpy as np
+import pytest
+
+pytest.importorskip("caput.memh5")
+
+from draco.core import containers, io, task
+
+
+class _SubStream(containers.SiderealStream):
+    pass
+
+
+def _make_stream(cls=containers.SiderealStream, distributed=True, chunked=True):
+    ss = cls(
+        freq=np.linspace(800.0, 400.0, 6),
+        input=3,
+        ra=10,
+        distributed=distributed,
+        allow_chunked=chunked,
+    )
+    rng = np.random.RandomState(0)
+    shape = ss.vis[:].shape
+    ss.vis[:] = rng.standard_normal(shape) + 1.0j * rng.standard_normal(shape)
+    ss.weight[:] = rng.uniform(1e2, 1e3, size=shape)
+    return ss
+
+
+def _truncated(ss):
+    # Truncate a copy of the datasets in the same way as the `Truncate` task
+    spec = io.TRUNC_SPEC[containers.SiderealStream]
+    vis = np.array(ss.vis[:])
+    weight = np.array(ss.weight[:])
+    vi = 3 * spec["variance_increase"]
+    io._truncate_array(vis, weight, spec["fixed_precision"], vi)
+    io._truncate_array(weight, None, spec["fixed_precision"], vi)
+    return vis, weight
+
+
+def test_trunc_spec_mro():
+    spec = io.TRUNC_SPEC[containers.SiderealStream]
+    assert io._trunc_spec(_SubStream) is spec
+    assert io._trunc_spec(containers.SiderealStream) is spec
+    assert io._trunc_spec(containers.ContainerBase) is None
+
+    transforms = io._truncation_transforms(_make_stream(_SubStream))
+    assert set(transforms) == {"vis", "vis_weight"}
+
+
+@pytest.mark.parametrize("distributed", [True, False])
+@pytest.mark.parametrize("chunked", [True, False])
+def test_truncate_on_write(tmpdir, monkeypatch, distributed, chunked):
+    # Use a tiny block size so contiguous datasets are written in many blocks
+    monkeypatch.setattr(containers, "_WRITE_BLOCK_BYTES", 100)
+
+    ss = _make_stream(distributed=distributed, chunked=chunked)
+    original = np.array(ss.vis[:])
+    vis, weight = _truncated(ss)
+
+    fname = str(tmpdir.join("ss.h5"))
+    ss.to_hdf5_threaded(fname, transforms=io._truncation_transforms(ss))
+
+    with h5py.File(fname, "r") as f:
+        assert np.array_equal(f["vis"][:], vis)
+        assert np.array_equal(f["vis_weight"][:], weight)
+
+    # The container itself keeps its full precision
+    assert np.array_equal(ss.vis[:], original)
+    assert not np.array_equal(vis, original)
+
+
+def test_nan_dump_not_truncated(tmpdir, monkeypatch):
+    monkeypatch.chdir(str(tmpdir))
+
+    ss = _make_stream()
+    ss.vis[0] = np.nan
+    ss.attrs["tag"] = "nan"
+    original = np.array(ss.vis[:])
+
+    class _Identity(task.SingleTask):
+        def process(self, data):
+            return data
+
+    tsk = _Identity()
+    tsk.read_config({"nan_check": True, "nan_dump": True, "truncate_on_write": True})
+    tsk.next(ss)
+
+    with h5py.File("nandump__Identity_nan.h5", "r") as f:
+        assert np.array_equal(f["vis"][:], original, equal_nan=True)
@@ -0,0 +1,158 @@
+"""Tests of the tasks accumulating weighted visibilities."""
+
+import numpy as np
+import pytest
+
+pytest.importorskip("caput.memh5")
+
+from draco.analysis import sidereal, transform
+from draco.core import containers, telescope
+from draco.util import tools
+
+
+def _freq(centres):
+    freq = np.zeros(len(centres), dtype=[("centre", np.float64), ("width", np.float64)])
+    freq["centre"] = centres
+    freq["width"] = 10.0
+    return freq
+
+
+def _inputs(n):
+    return np.array(
+        [(i, "fake%04i" % i) for i in range(n)],
+        dtype=[("chan_id", "u2"), ("correlator_input", "U32")],
+    )
+
+
+def _make_stream(freq, ninput=4, nra=8, seed=0, gain=False):
+    ss = containers.SiderealStream(
+        freq=_freq(freq), input=_inputs(ninput), ra=nra, distributed=True
+    )
+    rng = np.random.RandomState(seed)
+    shape = ss.vis.local_shape
+    ss.vis[:] = rng.standard_normal(shape) + 1.0j * rng.standard_normal(shape)
+
+    # Weights with some masked samples
+    weight = rng.uniform(0.5, 2.0, size=shape)
+    weight[rng.uniform(size=shape) < 0.2] = 0.0
+    ss.weight[:] = weight
+    ss.input_flags[:] = 1.0
+
+    if gain:
+        ss.add_dataset("gain")
+        ss.gain[:] = rng.standard_normal(ss.gain.local_shape)
+
+    return ss
+
+
+@pytest.mark.parametrize("gain", [False, True])
+def test_frequency_rebin(gain):
+    ss = _make_stream(np.linspace(800.0, 730.0, 8), gain=gain)
+    vis = ss.vis[:].view(np.ndarray).copy()
+    weight = ss.weight[:].view(np.ndarray).copy()
+
+    task = transform.FrequencyRebin()
+    task.read_config({"channel_bin": 2})
+    sb = task.process(ss)
+
+    # The original numpy rebinning
+    rvis = np.zeros((4,) + vis.shape[1:], dtype=vis.dtype)
+    rweight = np.zeros((4,) + vis.shape[1:], dtype=weight.dtype)
+    for fi in range(8):
+        rvis[fi // 2] += vis[fi] * weight[fi]
+        rweight[fi // 2] += weight[fi]
+    rvis *= tools.invert_no_zero(rweight)
+
+    assert np.allclose(sb.vis[:], rvis, rtol=1e-5, atol=1e-6)
+    assert np.array_equal(sb.weight[:], rweight)
+    assert np.allclose(sb.freq, np.linspace(800.0, 730.0, 8).reshape(4, 2).mean(1))
+
+    if gain:
+        rgain = ss.gain[:].view(np.ndarray).reshape(4, 2, *ss.gain.shape[1:])
+        assert np.allclose(sb.gain[:], rgain.mean(axis=1), rtol=1e-6)
+    else:
+        assert "gain" not in sb.datasets
+
+
+def test_sidereal_stacker():
+    days = [_make_stream([800.0, 790.0, 780.0], seed=seed) for seed in range(3)]
+    for lsd, day in enumerate(days):
+        day.attrs["lsd"] = 100 + lsd
+
+    vis = np.array([day.vis[:].view(np.ndarray).copy() for day in days])
+    weight = np.array([day.weight[:].view(np.ndarray).copy() for day in days])
+
+    stacker = sidereal.SiderealStacker()
+    stacker.read_config({})
+    for day in days:
+        stacker.process(day)
+    stack = stacker.process_finish()
+
+    rweight = weight.sum(axis=0)
+    rvis = (vis * weight).sum(axis=0) * tools.invert_no_zero(rweight)
+
+    assert np.allclose(stack.vis[:], rvis, rtol=1e-5, atol=1e-6)
+    assert np.allclose(stack.weight[:], rweight, rtol=1e-6)
+    assert list(stack.attrs["lsd"]) == [100, 101, 102]
+
+
+class _LineTelescope(object):
+    # Evenly spaced feeds on a line, whose unique baselines are their
+    # separations, with the telescope attributes CollateProducts uses
+
+    longitude = latitude = altitude = lsd_start_day = 0.0
+
+    def __init__(self, nfeed, frequencies):
+        self.nfeed = nfeed
+        self.npairs = nfeed
+        self.frequencies = np.array(frequencies)
+        self.input_index = _inputs(nfeed)
+
+        ii, jj = np.meshgrid(np.arange(nfeed), np.arange(nfeed), indexing="ij")
+        self.feedmap = np.abs(jj - ii)
+        self.feedconj = ii > jj
+        self.feedmask = np.ones((nfeed, nfeed), dtype=bool)
+        self.uniquepairs = np.array([(0, k) for k in range(nfeed)])
+
+
+@pytest.mark.parametrize("weight", ["natural", "inverse_variance"])
+def test_collate_products(tmpdir, weight):
+    nfeed = 4
+    tel = _LineTelescope(nfeed, [800.0, 780.0])
+    telescope.save_snapshot(tel, str(tmpdir))
+    snapshot = telescope.load_snapshot(str(tmpdir))
+
+    # Every product is its own stack in the input
+    ss = _make_stream([800.0, 790.0, 780.0], ninput=nfeed)
+    nprod = ss.vis.shape[1]
+    rev = np.zeros(nprod, dtype=[("stack", "<u4"), ("conjugate", "u1")])
+    rev["stack"] = np.arange(nprod)
+    ss.create_reverse_map("stack", rev)
+
+    prod = ss.index_map["prod"][:]
+    vis = ss.vis[:].view(np.ndarray)[[0, 2]].copy()
+    ssw = ss.weight[:].view(np.ndarray)[[0, 2]].copy()
+
+    task = transform.CollateProducts()
+    task.read_config({"weight": weight})
+    task.setup(snapshot)
+    sp = task.process(ss)
+
+    assert sp.vis.shape == (2, nfeed, ss.vis.shape[2])
+    assert np.array_equal(sp.freq, [800.0, 780.0])
+
+    # Average the products of each separation
+    if weight == "natural":
+        wss = (ssw > 0.0).astype(np.float64)
+    else:
+        wss = ssw.astype(np.float64)
+
+    for sep in range(nfeed):
+        sel = np.flatnonzero(prod["input_b"] - prod["input_a"] == sep)
+        wsum = wss[:, sel].sum(axis=1)
+        rvis = (wss[:, sel] * vis[:, sel]).sum(axis=1) * tools.invert_no_zero(wsum)
+        var = tools.divide_no_zero(wss[:, sel] ** 2, ssw[:, sel].astype(np.float64))
+        rweight = wsum ** 2 * tools.invert_no_zero(var.sum(axis=1))
+
+        assert np.allclose(sp.vis[:, sep], rvis, rtol=1e-5, atol=1e-6)
+        assert np.allclose(sp.weight[:, sep], rweight, rtol=1e-5, atol=1e-6)
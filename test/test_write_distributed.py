@@ -0,0 +1,83 @@
+"""Tests that the parallel writers produce the same files as caput."""
+
+import h5py
+import numpy as np
+import pytest
+
+pytest.importorskip("caput.memh5")
+
+from draco.core import containers
+
+
+def _make_stream():
+    ss = containers.SiderealStream(
+        freq=np.linspace(800.0, 400.0, 7),
+        input=4,
+        ra=16,
+        distributed=True,
+        allow_chunked=True,
+    )
+    rng = np.random.RandomState(0)
+    shape = ss.vis.local_shape
+    ss.vis[:] = rng.standard_normal(shape) + 1.0j * rng.standard_normal(shape)
+    ss.weight[:] = rng.uniform(size=ss.weight.local_shape)
+    ss.input_flags[:] = rng.uniform(size=ss.input_flags.shape)
+    ss.attrs["tag"] = "write_test"
+    ss.vis.attrs["units"] = "Jy"
+    return ss
+
+
+def _normalise(value):
+    value = np.asarray(value)
+    if value.dtype.kind == "U":
+        value = np.char.encode(value, "utf8")
+    return value
+
+
+def _assert_files_equal(fname_a, fname_b):
+    with h5py.File(fname_a, "r") as fa, h5py.File(fname_b, "r") as fb:
+
+        items_a, items_b = {}, {}
+        fa.visititems(lambda name, item: items_a.setdefault(name, item))
+        fb.visititems(lambda name, item: items_b.setdefault(name, item))
+
+        assert set(items_a) == set(items_b)
+
+        for name in [""] + list(items_a):
+            a = fa[name] if name else fa
+            b = fb[name] if name else fb
+
+            assert set(a.attrs) == set(b.attrs), name
+            for key in a.attrs:
+                assert np.array_equal(
+                    _normalise(a.attrs[key]), _normalise(b.attrs[key])
+                ), (name, key)
+
+            if isinstance(a, h5py.Dataset):
+                assert a.dtype == b.dtype, name
+                assert a.shape == b.shape, name
+                assert np.array_equal(a[()], b[()]), name
+
+
+def test_collective_matches_save(tmpdir):
+    ss = _make_stream()
+
+    fname_save = str(tmpdir.join("save.h5"))
+    fname_coll = str(tmpdir.join("collective.h5"))
+
+    ss.save(fname_save)
+    ss.to_hdf5_collective(fname_coll)
+
+    _assert_files_equal(fname_save, fname_coll)
+
+
+def test_threaded_matches_save(tmpdir):
+    ss = _make_stream()
+
+    fname_save = str(tmpdir.join("save.h5"))
+    fname_thread = str(tmpdir.join("threaded.h5"))
+
+    ss.save(fname_save)
+    ss.to_hdf5_threaded(fname_thread, num_threads=2)
+
+    _assert_files_equal(fname_save, fname_thread)